@@ -22,14 +22,16 @@ if a newer version is available from the NCBI master list and removes outdated a
 """
 import argparse
 import logging
+import os
 from pathlib import Path
 import requests
+import shutil
 import sys
 import tempfile
 
 import pandas as pd
 
-from src.ncbi_util.assembly_summary import parse_assembly_summary, download_latest_assembly_summary_as_df
+from src.ncbi_util.assembly_summary import DEFAULT_CACHE_FOLDER, get_cached_assembly_summary, load_assembly_summary
 
 
 # High level constants
@@ -72,12 +74,22 @@ def main():
         help=(
             'Path to NCBI assembly summary file containing'
             'the list of all existing assemblies. '
-            'If unspecified, file is downloaded from NCBI\'s ftp.'
+            'If unspecified, the latest file from NCBI\'s ftp is used (see --cache_folder).'
         ), 
         type=Path,
         required=False,
         default=None,
     )
+    parser.add_argument(
+        '--cache_folder', 
+        help=(
+            'Folder where the NCBI assembly summary is cached between runs. '
+            f'Defaults to {DEFAULT_CACHE_FOLDER}'
+        ), 
+        type=Path,
+        required=False,
+        default=DEFAULT_CACHE_FOLDER,
+    )
     parser.add_argument(
         '-t', '--taxon', 
         type=str,
@@ -95,6 +107,7 @@ def main():
     output_folder = args.output_folder
     gtdb_metadata_path = args.gtdb_metadata
     assembly_summary_path = args.assembly_summary
+    cache_folder = args.cache_folder
     taxon = args.taxon
     n_species_per_taxon = args.n_species_per_taxon
 
@@ -120,14 +133,18 @@ def main():
     gtdb_metadata = load_or_download_gtdb_metadata(gtdb_metadata_path, output_folder)
 
     if assembly_summary_path is None:
-        logger.info('No NCBI assembly summary file found - downloading from NCBI (should take a couple of minutes)')
-        assembly_summary_df = download_latest_assembly_summary_as_df(
-            output_folder / 'ncbi_assembly_summary.txt',
-            delete_after=False,
-        )
-    else:
-        logger.info(f'Loading assembly summary from {assembly_summary_path}')
-        assembly_summary_df = parse_assembly_summary(assembly_summary_path)
+        logger.info(f'No NCBI assembly summary file specified - checking for the latest version (cache: {cache_folder})')
+        assembly_summary_path = get_cached_assembly_summary(cache_folder)
+
+        # The cached copy is replaced when NCBI publishes a new summary: 
+        # keep the snapshot used for this subset next to the outputs.
+        snapshot_path = output_folder / 'ncbi_assembly_summary.txt'
+        logger.info(f'Saving assembly summary snapshot to {snapshot_path}')
+        save_assembly_summary_snapshot(assembly_summary_path, snapshot_path)
+
+    logger.info(f'Loading assembly summary from {assembly_summary_path}')
+    # Only accessions are needed
+    assembly_summary_df = load_assembly_summary(assembly_summary_path, columns=[])
 
     logger.info('Selecting genomes')
     accessions = make_selection(gtdb_metadata, taxon, n_species_per_taxon)
@@ -164,6 +181,31 @@ def main():
     sys.exit(0)
 
 
+def save_assembly_summary_snapshot(summary_path : Path, snapshot_path : Path) -> None:
+    """
+    Hard link (or copy, across file systems) `summary_path` to `snapshot_path`, atomically.
+    The cache replaces its copy with a new file when revalidated, so a hard link stays a stable snapshot.
+    """
+    if snapshot_path.exists() and os.path.samefile(summary_path, snapshot_path):
+        return
+
+    temp_path = snapshot_path.with_name(f'.{snapshot_path.name}.tmp')
+    if temp_path.exists():
+        temp_path.unlink()
+
+    try:
+        try:
+            os.link(summary_path, temp_path)
+        except OSError:
+            shutil.copyfile(summary_path, temp_path)
+            os.chmod(temp_path, 0o644)
+
+        os.replace(temp_path, snapshot_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
 def make_selection(gtdb_metadata_input : pd.DataFrame, taxon : str, n_species_per_taxon : int):
     accession_list = []
     taxon_column = f'gtdb_{taxon}'
@@ -4,27 +4,64 @@ Script to download genomes from [NCBI](https://www.ncbi.nlm.nih.gov/).
 import argparse
 import logging
 import os
-import random
+import re
+import shutil
 import subprocess
 import sys
-import time
 import tempfile
-from multiprocessing import Process
+import time
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Process, Queue
 from pathlib import Path
-from typing import List, Optional
+from queue import Empty
+from typing import Callable, Dict, List, Optional, Tuple
 
-import numpy as np
 import pandas as pd
 
-from src.utils import get_n_cpus
+from src.utils import exponential_backoff_sleep_seconds, get_n_cpus
 from src.ncbi_util.assembly_summary import (
-    download_latest_assembly_summary_as_df,
-    parse_assembly_summary,
+    DEFAULT_CACHE_FOLDER,
+    get_cached_assembly_summary,
+    load_assembly_summary,
+    make_accession_resolver,
+    predict_download_bytes,
+)
+from src.ncbi_util.checksums import (
+    MD5_CACHE_FILE_NAME,
+    MD5_CHECKSUMS_FILE_NAME,
+    find_incomplete_assemblies,
+    load_md5_cache,
+    save_md5_cache,
+)
+from src.ncbi_util.download_governor import DownloadGovernor
+from src.ncbi_util.download_metrics import EVENTS_FILE_NAME, PROMETHEUS_FILE_NAME, DownloadMetrics
+from src.ncbi_util.genome_store import add_assemblies_to_store, link_assembly_from_store
+from src.ncbi_util.download_state import (
+    STATE_DB_FILE_NAME,
+    STATUS_DOWNLOADED,
+    STATUS_FAILED,
+    STATUS_MISSING,
+    STATUS_PENDING,
+    get_accession_statuses,
+    get_accessions,
+    get_downloaded_accessions,
+    get_failed_downloads,
+    get_file_types_key,
+    log_status_counts,
+    open_state_db,
+    record_missing,
+    record_pending,
+    record_results,
+    record_superseded,
 )
 
 
 logger = logging.getLogger()
 
+# Output of rsync --stats, e.g. "Total transferred file size: 1,482,060 bytes"
+RSYNC_TRANSFERRED_BYTES_REGEX = re.compile(r'Total transferred file size: ([\d,]+) bytes')
+
 
 def main():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
@@ -54,10 +91,20 @@ def main():
         help=(
             'Path to NCBI assembly summary file containing'
             'the list of all existing assemblies. '
-            'If unspecified, file is downloaded from NCBI\'s ftp.'
+            'If unspecified, the latest file from NCBI\'s ftp is used (see --cache_folder).'
         ), 
         type=str,
     )
+    parser.add_argument(
+        '--cache_folder', 
+        help=(
+            'Folder where the NCBI assembly summary is cached between runs. '
+            'The cached copy is only downloaded again if it changed on NCBI\'s side. '
+            f'Defaults to {DEFAULT_CACHE_FOLDER}'
+        ), 
+        type=Path,
+        default=DEFAULT_CACHE_FOLDER,
+    )
     parser.add_argument(
         '-o', '--output_folder', 
         help=(
@@ -73,126 +120,802 @@ def main():
         action='store_true', 
         required=False,
     )
+    parser.add_argument(
+        '--file_types', 
+        help=(
+            'Comma separated list of file types to download, e.g. '
+            'protein.faa,cds_from_genomic.fna,genomic.fna,genomic.gff. '
+            'File md5checksums.txt is always downloaded. '
+            'Defaults to all files.'
+        ),
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        '--report_skipped_bytes', 
+        help=(
+            'With --file_types and --transport rsync, log the number of bytes saved by not downloading '
+            'the other files. Costs one extra rsync session per batch to list assembly folders.'
+        ),
+        action='store_true', 
+        required=False,
+    )
+    parser.add_argument(
+        '--batch_size', 
+        help=(
+            'Number of assemblies downloaded per rsync session. '
+            'Batching saves the connection setup of one rsync call per assembly, '
+            'which dominates when downloading many small assemblies. '
+            'Assemblies that fail within a batch are retried individually.'
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        '--transport', 
+        help=(
+            'Download protocol. rsync runs one download process per CPU (see --cpu). '
+            'https runs all downloads from a single process with asyncio, over a pool of '
+            'keep-alive connections (see --max_connections).'
+        ),
+        choices=['rsync', 'https'],
+        default='rsync',
+    )
+    parser.add_argument(
+        '--max_connections', 
+        help=(
+            'Maximum number of simultaneous connections to NCBI, across all download processes. '
+            'With --transport rsync, the number of connections is also bounded by --cpu. '
+            'The limit is lowered automatically when the rate of failed download tries climbs, '
+            'and raised back once downloads succeed again.'
+        ),
+        type=int,
+        default=64,
+    )
+    parser.add_argument(
+        '--max_bandwidth', 
+        help=(
+            'Maximum aggregate download bandwidth in MB/s, across all download processes. '
+            'Defaults to no limit.'
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        '--resume', 
+        help=(
+            'Skip assemblies already downloaded to the output folder. '
+            'Local files are checked against md5checksums.txt and only assemblies '
+            'with missing or corrupt files are downloaded again. '
+            'Checksums are cached in <output_folder>/md5_cache.tsv.'
+        ),
+        action='store_true', 
+        required=False,
+    )
+    parser.add_argument(
+        '--update', 
+        help=(
+            'Refresh a previous download with a newer assembly summary. '
+            'Assemblies listed in <output_folder>/ncbi_assembly_summary_subset.csv are resolved to their '
+            'latest version, together with -a / -l if specified. Only new accessions and '
+            'version bumps are downloaded.'
+        ),
+        action='store_true', 
+        required=False,
+    )
+    parser.add_argument(
+        '--retire_superseded', 
+        help=(
+            'With --update, delete the folder of the previous version of '
+            'assemblies whose new version was downloaded successfully.'
+        ),
+        action='store_true', 
+        required=False,
+    )
+    parser.add_argument(
+        '--store', 
+        help=(
+            'Folder of a content-addressed store of assembly files, shared between output folders. '
+            'Assemblies already in the store are hard linked instead of downloaded, and downloaded '
+            'files are added to it. Identical files are stored once. '
+            'Should be on the same file system as the output folder (files are copied otherwise).'
+        ),
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '--prometheus_textfile', 
+        help=(
+            'Path of a Prometheus textfile rewritten periodically with download metrics '
+            '(e.g. in the directory of node_exporter\'s textfile collector). '
+            f'Defaults to <output_folder>/{PROMETHEUS_FILE_NAME}. '
+            f'Per-assembly events are also appended to <output_folder>/{EVENTS_FILE_NAME}.'
+        ),
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '--status', 
+        help=(
+            'Print the download state recorded in <output_folder>/download_state.sqlite and exit. '
+            'Can be run while a download is in progress.'
+        ),
+        action='store_true', 
+        required=False,
+    )
     parser.add_argument('--cpu', type=int, default=4)
     args = parser.parse_args()
 
     assembly = args.assembly
     assemblies_path = args.assembly_list
     summary_path = args.assembly_summary
+    cache_folder = args.cache_folder
     output_folder = Path(args.output_folder)
     use_genbank = args.genbank
+    file_types = parse_file_types(args.file_types)
+    report_skipped_bytes = args.report_skipped_bytes and file_types is not None
+    batch_size = max(1, args.batch_size)
+    transport = args.transport
+    max_connections = max(1, args.max_connections)
+    max_bandwidth = args.max_bandwidth
+    resume = args.resume
+    update = args.update
+    retire_superseded = args.retire_superseded
+    store_folder = args.store
+    prometheus_path = args.prometheus_textfile
     n_cpu = min(args.cpu, get_n_cpus())
 
     if not output_folder.is_dir():
         logger.error(f'Output folder is not a directory: {args.output_folder}')
         sys.exit(1)
 
-    assemblies = get_assembly_list_from_arguments(assembly, assemblies_path)
+    # Download state is only written by this process: workers report results through a queue.
+    state_db = open_state_db(output_folder / STATE_DB_FILE_NAME)
+
+    if args.status:
+        log_status_counts(state_db)
+        sys.exit(0)
+
+    metadata_path = output_folder / 'ncbi_assembly_summary_subset.csv'
+
+    if retire_superseded and not update:
+        logger.error('--retire_superseded requires --update')
+        sys.exit(1)
+
+    if transport == 'https':
+        try:
+            import aiohttp
+        except ImportError:
+            logger.error('--transport https requires package aiohttp (e.g. `pip install aiohttp`)')
+            sys.exit(1)
+
+    previous_subset_df = None
+    if update:
+        if not metadata_path.is_file():
+            logger.error(f'Nothing to update: {metadata_path} does not exist')
+            sys.exit(1)
+
+        previous_subset_df = load_previous_subset(metadata_path)
+        logger.info(f'Update mode: {len(previous_subset_df):,} assemblies previously downloaded')
+
+        assemblies = [] if assembly is None and assemblies_path is None else (
+            get_assembly_list_from_arguments(assembly, assemblies_path)
+        )
+        # Unversioned accessions resolve to the latest version
+        assemblies = list(dict.fromkeys(
+            assemblies + get_update_accessions(previous_subset_df)
+        ))
+    else:
+        assemblies = get_assembly_list_from_arguments(assembly, assemblies_path)
 
     if len(assemblies) == 0:
         logger.error('No assemblies to download')
         sys.exit(1)
 
     if summary_path is None:
-        logger.info('No NCBI assembly summary file found - downloading from NCBI (should take a couple of minutes)')
-        assembly_summary_df = download_latest_assembly_summary_as_df()
-    else:
-        logger.info(f'Loading assembly summary from {summary_path}')
-        assembly_summary_df = parse_assembly_summary(summary_path)
+        logger.info(f'No NCBI assembly summary file specified - checking for the latest version (cache: {cache_folder})')
+        summary_path = get_cached_assembly_summary(cache_folder)
+
+    logger.info(f'Loading assembly summary from {summary_path}')
+    assembly_summary_df = load_assembly_summary(summary_path)
 
     download_instructions, missing_accessions = make_download_instructions(assembly_summary_df, assemblies, use_genbank)
 
+    record_missing(state_db, assemblies, missing_accessions)
+    missing_accessions = get_accessions(state_db, [STATUS_MISSING])
+
+    missing_accessions_path = output_folder / 'missing_accessions.txt'
     if len(missing_accessions) > 0:
-        missing_accessions_path = output_folder / 'missing_accessions.txt'
         with missing_accessions_path.open('w') as f_out:
             for acc in missing_accessions:
                 f_out.write(acc + '\n')
         
         logger.warning(f'Assembly accessions not found on NCBI: {len(missing_accessions):,}. Full list stored to {missing_accessions_path}')
+    elif missing_accessions_path.is_file():
+        missing_accessions_path.unlink()
 
     if len(download_instructions) == 0:
         logger.info('No assemblies to be downloaded')
         sys.exit(0)
 
-    logger.info(f'Downloading {len(download_instructions):,} assemblies into {output_folder}')
-
-    n_cpu = min(n_cpu, len(download_instructions))
-    n_per_process = int(np.ceil(len(download_instructions) / n_cpu))
-
     genomes_folder = output_folder / 'genomes'
     genomes_folder.mkdir(exist_ok=True)
 
-    processes = []
-    for i in range(n_cpu):
-        start = i * n_per_process
-        end = start + n_per_process
- 
-        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
-            download_instructions.iloc[start:end].to_csv(f)
-            p = Process(target=worker_main, args=(
-                f.name,
-                genomes_folder.resolve().as_posix(),
-            ))
-            p.start()
-            processes.append(p)
+    tasks = [
+        (assembly, row['organism_name'], row['ftp_path'])
+        for assembly, row in download_instructions.iterrows()
+    ]
+    file_types_key = get_file_types_key(file_types)
 
-    for p in processes:
-        p.join()
+    superseded = {}
+    if update:
+        tasks, superseded = get_update_tasks(tasks, previous_subset_df, state_db, file_types_key, genomes_folder)
+
+    if resume:
+        tasks_to_resume = get_tasks_to_resume(tasks, output_folder, genomes_folder, file_types, n_cpu)
+        verified = set(tasks) - set(tasks_to_resume)
+        record_pending(state_db, [(assembly, get_folder_name(ftp_path)) for assembly, _, ftp_path in verified], file_types_key)
+        record_results(state_db, [{'assembly': assembly, 'error': None, 'attempts': 0} for assembly, _, _ in verified])
+        tasks = tasks_to_resume
+    else:
+        downloaded = get_downloaded_accessions(state_db, file_types_key)
+        n_tasks = len(tasks)
+        recorded = [task for task in tasks if downloaded.get(task[0]) == get_folder_name(task[2])]
+        # Folders may have been deleted since they were recorded as downloaded
+        missing = {task for task in recorded if not has_assembly_folder(genomes_folder / get_folder_name(task[2]))}
+        skipped = set(recorded) - missing
+        tasks = [task for task in tasks if task not in skipped]
+        if len(skipped) > 0:
+            logger.info(f'Skipping {len(skipped):,} assemblies already downloaded according to {STATE_DB_FILE_NAME}')
+        if len(missing) > 0:
+            logger.warning(f'Downloading again {len(missing):,} assemblies recorded as downloaded but missing from {genomes_folder}')
+
+    record_pending(state_db, [(assembly, get_folder_name(ftp_path)) for assembly, _, ftp_path in tasks], file_types_key)
+
+    if store_folder is not None:
+        tasks = link_tasks_from_store(tasks, store_folder, genomes_folder, file_types, state_db)
+
+    # Longest processing time first: large assemblies are started early
+    # so that they do not end up dictating the tail of the run.
+    predicted_bytes = predict_download_bytes(
+        assembly_summary_df.loc[[assembly for assembly, _, _ in tasks]], 
+        file_types,
+    ).to_dict()
+    tasks = sorted(tasks, key=lambda task: predicted_bytes[task[0]], reverse=True)
+
+    logger.info(f'Downloading {len(tasks):,} assemblies into {output_folder}')
+    logger.info(f'Predicted download size: {sum(predicted_bytes.values()) / 1e9:,.2f} GB')
+    if file_types is not None:
+        logger.info(f'File types: {", ".join(file_types)}')
+
+    governor = DownloadGovernor(
+        max_connections if transport == 'https' else min(max_connections, n_cpu),
+        max_bytes_per_second=None if max_bandwidth is None else max_bandwidth * 1e6,
+    )
+
+    metrics = DownloadMetrics(
+        output_folder / EVENTS_FILE_NAME,
+        prometheus_path if prometheus_path is not None else output_folder / PROMETHEUS_FILE_NAME,
+        n_tasks=len(tasks),
+        governor=governor,
+    )
+
+    def record_result(result):
+        record_results(state_db, [result])
+        metrics.record(result)
+
+    if len(tasks) == 0:
+        results = []
+    elif transport == 'https':
+        from src.ncbi_util.async_download import download_assemblies_https
+
+        progress = {'n_results': 0, 'n_failed': 0}
+
+        def on_result(result):
+            record_result(result)
+            progress['n_results'] += 1
+            progress['n_failed'] += int(result['error'] is not None)
+            log_download_progress(progress['n_results'], len(tasks), progress['n_failed'])
+
+        results = download_assemblies_https(
+            tasks, 
+            genomes_folder, 
+            is_selected=None if file_types is None else partial(is_selected_file, file_types=file_types),
+            max_connections=max_connections,
+            on_result=on_result,
+            governor=governor,
+        )
+    else:
+        results = run_rsync_workers(
+            tasks, 
+            genomes_folder, 
+            file_types, 
+            batch_size, 
+            n_cpu,
+            on_result=record_result,
+            governor=governor,
+            report_skipped_bytes=report_skipped_bytes,
+        )
 
     logger.info('Download completed.')
 
-    metadata_path = output_folder / 'ncbi_assembly_summary_subset.csv'
+    metrics.close()
+
+    if store_folder is not None:
+        md5_cache_path = output_folder / MD5_CACHE_FILE_NAME
+        md5_cache = load_md5_cache(md5_cache_path)
+        task_folders = {assembly: genomes_folder / get_folder_name(ftp_path) for assembly, _, ftp_path in tasks}
+        add_assemblies_to_store(
+            store_folder, 
+            [task_folders[r['assembly']] for r in results if r['error'] is None],
+            md5_cache=md5_cache,
+            n_threads=n_cpu,
+        )
+        save_md5_cache(md5_cache, md5_cache_path)
+
+    log_predicted_vs_actual_bytes(results, predicted_bytes)
+
+    if retire_superseded:
+        retire_superseded_assemblies(results, superseded, genomes_folder, state_db)
+
+    failed_downloads = get_failed_downloads(state_db)
+
+    if report_skipped_bytes and transport == 'rsync':
+        bytes_skipped = sum(r['bytes_skipped'] for r in results)
+        logger.info(f'Bytes saved by filtering file types: {bytes_skipped / 1e6:,.1f} MB')
+
+    if len(failed_downloads) > 0:
+        failed_downloads_path = output_folder / 'failed_accessions.csv'
+        pd.DataFrame(
+            failed_downloads, 
+            columns=['assembly_accession', 'attempts', 'error'],
+        ).to_csv(failed_downloads_path, index=False)
+
+        logger.warning(f'Assemblies that failed to download: {len(failed_downloads):,}. Full report stored to {failed_downloads_path}')
+
+    # Metadata of every assembly of the output folder, including those downloaded by previous runs
+    downloaded_accessions = get_accessions(state_db, [STATUS_DOWNLOADED, STATUS_FAILED, STATUS_PENDING])
     logger.info(f'Saving genome metadata to {metadata_path}')
-    assembly_summary_df.loc[download_instructions.index].to_csv(metadata_path)
+    assembly_summary_df[assembly_summary_df.index.isin(downloaded_accessions)].to_csv(metadata_path)
+
+    state_db.close()
 
     logger.info('DONE')
 
 
-def worker_main(instructions_path : str, output_folder : str) -> None:
+def get_tasks_to_resume(
+    tasks : List[Tuple[str, str, str]],
+    output_folder : Path,
+    genomes_folder : Path,
+    file_types : Optional[List[str]],
+    n_cpu : int,
+) -> List[Tuple[str, str, str]]:
+    """
+    Return the tasks whose assembly folder is missing or does not match its md5checksums.txt.
+    Corrupt files are deleted so that rsync does not skip them based on size and modification time.
+    """
+    md5_cache_path = output_folder / MD5_CACHE_FILE_NAME
+    md5_cache = load_md5_cache(md5_cache_path)
+
+    folders = [genomes_folder / get_folder_name(ftp_path) for _, _, ftp_path in tasks]
+    incomplete = find_incomplete_assemblies(
+        [folder for folder in folders if folder.is_dir()],
+        is_expected=None if file_types is None else partial(is_selected_file, file_types=file_types),
+        md5_cache=md5_cache,
+        n_threads=n_cpu,
+    )
+    save_md5_cache(md5_cache, md5_cache_path)
+
+    for folder, relative_paths in incomplete.items():
+        for relative_path in relative_paths:
+            path = folder / relative_path
+            if path.is_file():
+                logger.warning(f'Checksum mismatch, deleting {path}')
+                path.unlink()
+
+    tasks_to_resume = [
+        task for task, folder in zip(tasks, folders)
+        if not folder.is_dir() or folder in incomplete
+    ]
+    n_complete = len(tasks) - len(tasks_to_resume)
+    logger.info(f'Resume: {n_complete:,} assemblies already downloaded and verified, {len(tasks_to_resume):,} to download')
+    return tasks_to_resume
+
+
+def has_assembly_folder(folder : Path) -> bool:
+    """
+    Whether assembly `folder` is present, with its md5checksums.txt.
+    Files are only verified against checksums with --resume (see `get_tasks_to_resume`).
+    """
+    return (folder / MD5_CHECKSUMS_FILE_NAME).is_file()
+
+
+def load_previous_subset(path : os.PathLike) -> pd.DataFrame:
+    """
+    Load accession and ftp_path of assemblies from a previous `ncbi_assembly_summary_subset.csv`.
+    """
+    return pd.read_csv(
+        path, 
+        usecols=['assembly_accession', 'ftp_path'], 
+        index_col='assembly_accession',
+        dtype=str,
+    )
+
+
+def get_update_accessions(previous_subset_df : pd.DataFrame) -> List[str]:
+    """
+    Unversioned accessions of previously downloaded assemblies, which resolve to their latest version.
+    Assemblies downloaded from RefSeq folders (`/GCF/` in their ftp_path) are listed by their RefSeq accession, 
+    so that they are downloaded from RefSeq again (unless --genbank).
+    """
+    accessions = []
+    for acc, ftp_path in previous_subset_df['ftp_path'].items():
+        if isinstance(ftp_path, str) and '/GCF/' in ftp_path:
+            acc = '_'.join(get_folder_name(ftp_path).split('_')[:2])
+        accessions.append(acc.split('.')[0])
+
+    return accessions
+
+
+def get_update_tasks(
+    tasks : List[Tuple[str, str, str]],
+    previous_subset_df : pd.DataFrame,
+    state_db,
+    file_types_key : str,
+    genomes_folder : Path,
+) -> Tuple[List[Tuple[str, str, str]], Dict[str, str]]:
+    """
+    Diff tasks against the previous subset, by unversioned accession and version.
+    Return tasks of new accessions and version bumps (plus previous assemblies not downloaded successfully,
+    or whose folder is missing from `genomes_folder`) and a dict mapping the new accession of version bumps 
+    to the previous accession and folder name.
+    Unchanged assemblies are recorded as downloaded in the state database.
+    """
+    previous_versions = {}
+    for acc in previous_subset_df.index:
+        base, _, version = acc.partition('.')
+        previous_versions[base] = max(previous_versions.get(base, (0, None)), (int(version or 0), acc))
+
+    statuses = get_accession_statuses(state_db)
+
+    update_tasks, unchanged, superseded = [], [], {}
+    n_new = 0
+    for task in tasks:
+        acc = task[0]
+        base, _, version = acc.partition('.')
+        previous_version, previous_acc = previous_versions.get(base, (None, None))
+        if previous_acc is None:
+            n_new += 1
+            update_tasks.append(task)
+        elif previous_version < int(version or 0):
+            superseded[acc] = (previous_acc, get_folder_name(previous_subset_df.at[previous_acc, 'ftp_path']))
+            update_tasks.append(task)
+        elif statuses.get(acc) in (STATUS_FAILED, STATUS_PENDING):
+            update_tasks.append(task)
+        elif not has_assembly_folder(genomes_folder / get_folder_name(task[2])):
+            update_tasks.append(task)
+        else:
+            unchanged.append(task)
+
+    logger.info((
+        f'Update: {n_new:,} new assemblies, {len(superseded):,} new versions, '
+        f'{len(unchanged):,} unchanged'
+    ))
+
+    unrecorded = [(assembly, get_folder_name(ftp_path)) for assembly, _, ftp_path in unchanged if assembly not in statuses]
+    record_pending(state_db, unrecorded, file_types_key)
+    record_results(state_db, [{'assembly': assembly, 'error': None, 'attempts': 0} for assembly, _ in unrecorded])
+
+    return update_tasks, superseded
+
+
+def retire_superseded_assemblies(
+    results : List[dict],
+    superseded : Dict[str, Tuple[str, str]],
+    genomes_folder : Path,
+    state_db,
+) -> None:
+    """
+    Delete folders of previous versions of assemblies whose new version was downloaded successfully.
+    """
+    statuses = get_accession_statuses(state_db)
+    retired = []
+    for result in results:
+        if result['error'] is not None or result['assembly'] not in superseded:
+            continue
+
+        previous_acc, previous_folder_name = superseded[result['assembly']]
+        folder = genomes_folder / previous_folder_name
+        if folder.is_dir():
+            logger.info(f'Deleting superseded assembly folder {folder}')
+            shutil.rmtree(folder)
+
+        if previous_acc in statuses:
+            retired.append(previous_acc)
+
+    record_superseded(state_db, retired)
+    logger.info(f'Superseded assemblies retired: {len(retired):,}')
+
+
+def link_tasks_from_store(
+    tasks : List[Tuple[str, str, str]],
+    store_folder : Path,
+    genomes_folder : Path,
+    file_types : Optional[List[str]],
+    state_db,
+) -> List[Tuple[str, str, str]]:
+    """
+    Link assemblies available in the store into the genomes folder.
+    Return the tasks left to download.
+    """
+    is_expected = None if file_types is None else partial(is_selected_file, file_types=file_types)
+
+    tasks_to_download, linked = [], []
+    for task in tasks:
+        folder = genomes_folder / get_folder_name(task[2])
+        if link_assembly_from_store(store_folder, folder, is_expected):
+            linked.append({
+                'assembly': task[0], 
+                'error': None, 
+                'attempts': 0, 
+                'bytes': get_folder_size(folder),
+            })
+        else:
+            tasks_to_download.append(task)
+
+    record_results(state_db, linked)
+    logger.info(f'Store: {len(linked):,} assemblies linked from {store_folder}, {len(tasks_to_download):,} to download')
+    return tasks_to_download
+
+
+def run_rsync_workers(
+    tasks : List[Tuple[str, str, str]],
+    genomes_folder : Path,
+    file_types : Optional[List[str]],
+    batch_size : int,
+    n_cpu : int,
+    on_result : Optional[Callable[[dict], None]] = None,
+    governor : Optional[DownloadGovernor] = None,
+    report_skipped_bytes : bool = False,
+) -> List[dict]:
+    """
+    Download `(assembly, organism_name, ftp_path)` tasks with rsync on `n_cpu` processes.
+    Workers pull one batch of assemblies at a time from a shared queue, 
+    so that a slow download only holds up a single worker.
+    Return one result dict per assembly (see `worker_main`);
+    `on_result` is called with each result as soon as it is received.
+
+    Tasks are expected largest first. They are dealt round-robin into batches, so that
+    large assemblies are spread across batches rather than all downloaded serially by one worker;
+    batches then come out ordered by decreasing total size.
+    """
+    n_batches = (len(tasks) + batch_size - 1) // batch_size
+    batches = [tasks[i::n_batches] for i in range(n_batches)]
+
+    n_cpu = min(n_cpu, len(batches))
+
+    task_queue = Queue()
+    result_queue = Queue()
+    for batch in batches:
+        task_queue.put(batch)
+    for _ in range(n_cpu):
+        task_queue.put(None)
+
+    processes = []
+    for i in range(n_cpu):
+        p = Process(target=worker_main, args=(
+            i,
+            task_queue,
+            result_queue,
+            genomes_folder.resolve().as_posix(),
+            file_types,
+            governor,
+            report_skipped_bytes,
+        ))
+        p.start()
+        processes.append(p)
+
+    results = collect_download_results(result_queue, processes, len(tasks), on_result)
+
+    for p in processes:
+        p.join()
+
+    return results
+
+
+def worker_main(
+    worker_ix : int,
+    task_queue : Queue, 
+    result_queue : Queue, 
+    output_folder : str,
+    file_types : Optional[List[str]] = None,
+    governor : Optional[DownloadGovernor] = None,
+    report_skipped_bytes : bool = False,
+) -> None:
+    """
+    Download batches of assemblies from `task_queue` until a `None` sentinel is received.
+    Report a result dict for every assembly to `result_queue`, with key `error = None` on success,
+    number of download `attempts`, `bytes` on disk and download `duration_seconds`.
+    With `report_skipped_bytes`, assembly folders are listed first to also report the `bytes_skipped` 
+    by `file_types` (one more rsync session per batch).
+    A failed assembly does not prevent the worker from moving on to the next one.
+
+    Batches of more than one assembly are first downloaded in a single rsync session;
+    assemblies that could not be confirmed as downloaded are then retried one by one.
+    """
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
 
-    instructions_path = Path(instructions_path)
     output_folder = Path(output_folder)
-    try:
-        instructions_df = pd.read_csv(instructions_path, index_col='assembly_accession')
-
-        for i, assembly in enumerate(instructions_df.index):
-            instructions = instructions_df.loc[assembly]
-            organism_name = instructions.organism_name
-            logger.info(f'Downloading assembly {i+1:,} / {len(instructions_df):,}: {assembly} - {organism_name}')
-            rsync_url = instructions.ftp_path.replace('https://', 'rsync://')
-            try:
-                download_assembly_with_retry(rsync_url, output_folder)
-            except AssemblyDownloadError as e:
-                logger.error(e)
-                return
-    finally:
-        if instructions_path.is_file():
-            instructions_path.unlink()
+    while True:
+        tasks = task_queue.get()
+        if tasks is None:
+            break
+
+        rsync_urls = [ftp_path.replace('https://', 'rsync://') for _, _, ftp_path in tasks]
+
+        bytes_skipped = {}
+        if report_skipped_bytes and file_types is not None:
+            bytes_skipped = get_skipped_bytes(rsync_urls, file_types, governor)
+
+        pending_urls = set(rsync_urls)
+        batch_seconds = 0.
+        batch_bytes_transferred = None
+        if len(tasks) > 1:
+            logger.info(f'Worker {worker_ix+1} | Downloading batch of {len(tasks):,} assemblies')
+            start = time.monotonic()
+            pending_urls, batch_bytes_transferred = download_assembly_batch(rsync_urls, output_folder, file_types, governor)
+            pending_urls = set(pending_urls)
+            batch_seconds = (time.monotonic() - start) / len(tasks)
+
+        results = []
+
+        for (assembly, organism_name, _), rsync_url in zip(tasks, rsync_urls):
+            folder_name = get_folder_name(rsync_url)
+            result = {
+                'assembly': assembly, 
+                'error': None, 
+                'worker_ix': worker_ix,
+                'attempts': int(len(tasks) > 1),
+                'bytes': None,
+                'bytes_transferred': None,
+                'duration_seconds': batch_seconds,
+                'retry_sleep_seconds': 0.,
+                'error_codes': [],
+                'bytes_skipped': bytes_skipped.get(folder_name, 0),
+            }
+            if rsync_url in pending_urls:
+                logger.info(f'Worker {worker_ix+1} | Downloading assembly {assembly} - {organism_name}')
+                start = time.monotonic()
+                try:
+                    stats = download_assembly_with_retry(rsync_url, output_folder, file_types=file_types, governor=governor)
+                except AssemblyDownloadError as e:
+                    logger.error(f'Error while downloading {assembly}: {e}')
+                    result['error'] = str(e).strip()
+                    stats = e.stats
+                except Exception as e:
+                    logger.error(f'Error while downloading {assembly}: {e}')
+                    result['error'] = str(e).strip()
+                    stats = {'attempts': 1}
+
+                result['attempts'] += stats['attempts']
+                result['bytes_transferred'] = stats.get('bytes_transferred')
+                result['retry_sleep_seconds'] = stats.get('retry_sleep_seconds', 0.)
+                result['error_codes'] = stats.get('error_codes', [])
+                result['duration_seconds'] += time.monotonic() - start
+
+            if result['error'] is None:
+                result['bytes'] = get_folder_size(output_folder / folder_name)
+
+            results.append(result)
+
+        # rsync only reports transferred bytes for the whole batch:
+        # split them across assemblies of the batch in proportion to their size on disk.
+        batched = [r for r in results if r['bytes_transferred'] is None and r['bytes'] is not None]
+        batch_bytes = sum(r['bytes'] for r in batched)
+        for r in batched:
+            if batch_bytes_transferred is not None and batch_bytes > 0:
+                r['bytes_transferred'] = int(batch_bytes_transferred * r['bytes'] / batch_bytes)
+
+        for result in results:
+            result_queue.put(result)
+
+
+def collect_download_results(
+    result_queue : Queue, 
+    processes : List[Process], 
+    n_tasks : int,
+    on_result : Optional[Callable[[dict], None]] = None,
+    poll_seconds : int = 10,
+) -> List[dict]:
+    """
+    Wait for all download results and log progress.
+    Stops early if every worker process has exited (e.g. killed).
+    """
+    results = []
+    n_failed = 0
+    n_results = 0
+    while n_results < n_tasks:
+        try:
+            result = result_queue.get(timeout=poll_seconds)
+        except Empty:
+            if not any(p.is_alive() for p in processes):
+                logger.error(f'All workers exited before completion: {n_tasks - n_results:,} results missing')
+                break
+            continue
+
+        if on_result is not None:
+            on_result(result)
+
+        n_results += 1
+        n_failed += int(result['error'] is not None)
+        results.append(result)
+        log_download_progress(n_results, n_tasks, n_failed)
+
+    return results
+
+
+def log_predicted_vs_actual_bytes(results : List[dict], predicted_bytes : Dict[str, int]) -> None:
+    """
+    Log predicted vs actual bytes of successful downloads, per worker.
+    """
+    predicted_per_worker = defaultdict(int)
+    actual_per_worker = defaultdict(int)
+    for result in results:
+        if result['error'] is None and result.get('bytes') is not None:
+            worker_ix = result.get('worker_ix', 0)
+            predicted_per_worker[worker_ix] += predicted_bytes.get(result['assembly'], 0)
+            actual_per_worker[worker_ix] += result['bytes']
+
+    for worker_ix in sorted(actual_per_worker.keys()):
+        logger.info((
+            f'Worker {worker_ix+1} | Predicted: {predicted_per_worker[worker_ix] / 1e6:,.1f} MB, '
+            f'actual: {actual_per_worker[worker_ix] / 1e6:,.1f} MB'
+        ))
+
+
+def log_download_progress(n_results : int, n_tasks : int, n_failed : int) -> None:
+    if n_results == 1 or n_results % 100 == 0 or n_results == n_tasks:
+        logger.info(f'Processed assemblies: {n_results:,} / {n_tasks:,} ({n_failed:,} failed)')
 
 
 def download_assembly_with_retry(
     rsync_url : str,
     output_folder : os.PathLike,
     n_retries : int = 10,
-) -> None:
+    file_types : Optional[List[str]] = None,
+    governor : Optional[DownloadGovernor] = None,
+) -> dict:
+    """
+    Download assembly, retrying on rsync errors.
+    Return download stats: number of `attempts`, `bytes_transferred`,
+    `retry_sleep_seconds` and rsync `error_codes` of failed tries.
+    """
+    stats = {'attempts': 0, 'bytes_transferred': None, 'retry_sleep_seconds': 0., 'error_codes': []}
     try_nb = 0
     while True:
         try_nb += 1
-        response = download_asembly(rsync_url, output_folder)
+        stats['attempts'] = try_nb
+        response = download_asembly(rsync_url, output_folder, file_types, governor)
+
+        # User errors say nothing about the state of the server
+        if governor is not None and response.returncode != 1:
+            governor.report_try(response.returncode == 0)
 
         if response.returncode == 0:
             # Download completed successfully
-            break
+            stats['bytes_transferred'] = parse_rsync_transferred_bytes(response.stdout)
+            return stats
+
+        stats['error_codes'].append(response.returncode)
         
         # Deal with errors:
         # - rsync error code 1 is a user error, raise exception.
         # - otherwise retry with exponential backoff for a set number of times
         stderr_txt = response.stderr.decode('utf-8')
         if response.returncode == 1:
-            raise AssemblyDownloadError(stderr_txt) 
+            raise AssemblyDownloadError(stderr_txt, stats=stats) 
         elif try_nb > n_retries:
-            raise AssemblyDownloadError(f'{try_nb:,} tries failed, aborting. Error: {stderr_txt}')
+            raise AssemblyDownloadError(f'{try_nb:,} tries failed, aborting. Error: {stderr_txt}', stats=stats)
         else:
             sleep_seconds = exponential_backoff_sleep_seconds(try_nb)
             logger.warning((
@@ -200,28 +923,273 @@ def download_assembly_with_retry(
                 f'Error: {stderr_txt}'
             ))
             time.sleep(sleep_seconds)
+            stats['retry_sleep_seconds'] += sleep_seconds
             continue
 
 
 def download_asembly(
     rsync_url : str,
     output_folder : os.PathLike,
+    file_types : Optional[List[str]] = None,
+    governor : Optional[DownloadGovernor] = None,
 ) -> subprocess.CompletedProcess:
-    return subprocess.run(
+    return run_rsync(
         [
-            'rsync', 
             '--copy-links', 
             '--recursive',
             '--times', 
-            '--quiet',
-            '--exclude', 'README.txt',
+            '--stats',
+        ] + 
+        get_rsync_filter_params([get_folder_name(rsync_url)], file_types) +
+        [
             rsync_url,
             output_folder.as_posix(),
         ],
-        capture_output=True,
+        governor,
     )
 
 
+def run_rsync(rsync_args : List[str], governor : Optional[DownloadGovernor] = None) -> subprocess.CompletedProcess:
+    """
+    Run rsync with `rsync_args`, within the connection and bandwidth limits of `governor` if specified.
+    Bandwidth is only enforced with --bwlimit: transferred bytes are not consumed from the token bucket 
+    afterwards, since they were already paced during the transfer.
+    """
+    if governor is None:
+        return subprocess.run(['rsync'] + rsync_args, capture_output=True)
+
+    with governor.connection():
+        bytes_per_second = governor.get_connection_bytes_per_second()
+        if bytes_per_second is not None:
+            # --bwlimit unit is KiB per second
+            rsync_args = [f'--bwlimit={max(1, int(bytes_per_second / 1024))}'] + rsync_args
+
+        return subprocess.run(['rsync'] + rsync_args, capture_output=True)
+
+
+def download_assembly_batch(
+    rsync_urls : List[str],
+    output_folder : os.PathLike,
+    file_types : Optional[List[str]] = None,
+    governor : Optional[DownloadGovernor] = None,
+) -> Tuple[List[str], Optional[int]]:
+    """
+    Download several assemblies with one rsync session per common root 
+    (e.g. rsync://ftp.ncbi.nlm.nih.gov/genomes/all/), using a `--files-from` list.
+
+    No retry happens here: return the subset of `rsync_urls` which could not be 
+    confirmed as downloaded. When rsync fails, folders mentioned in its error output are pending, 
+    and other folders are checked against their `md5checksums.txt` (restricted to `file_types`): 
+    a file left by an earlier run does not make a partial transfer count as downloaded.
+    Pending URLs should be retried individually.
+    Also return the number of bytes transferred, if reported by rsync.
+    """
+    output_folder = Path(output_folder)
+    pending_urls = []
+    bytes_transferred = None
+    for rsync_root, urls in group_by_rsync_root(rsync_urls).items():
+        folder_names = [get_folder_name(url) for url in urls]
+
+        files_from_path = write_files_from_list(rsync_root, urls)
+
+        try:
+            response = run_rsync(
+                [
+                    '--copy-links', 
+                    '--recursive',
+                    '--times', 
+                    '--stats',
+                    '--no-relative',
+                    f'--files-from={files_from_path.as_posix()}',
+                ] + 
+                get_rsync_filter_params(folder_names, file_types) +
+                [
+                    rsync_root,
+                    output_folder.as_posix(),
+                ],
+                governor,
+            )
+        finally:
+            files_from_path.unlink()
+
+        n_bytes = parse_rsync_transferred_bytes(response.stdout)
+        if n_bytes is not None:
+            bytes_transferred = (bytes_transferred or 0) + n_bytes
+
+        if governor is not None and response.returncode != 1:
+            governor.report_try(response.returncode == 0)
+
+        if response.returncode == 0:
+            continue
+
+        stderr_txt = response.stderr.decode('utf-8')
+        logger.warning(f'Batch of {len(urls):,} assemblies partially failed (rsync code {response.returncode})')
+
+        folders_to_check = {}
+        for url, folder_name in zip(urls, folder_names):
+            if folder_name in stderr_txt:
+                pending_urls.append(url)
+            else:
+                folders_to_check[output_folder / folder_name] = url
+
+        incomplete = find_incomplete_assemblies(
+            list(folders_to_check.keys()),
+            is_expected=None if file_types is None else partial(is_selected_file, file_types=file_types),
+        )
+        pending_urls += [url for folder, url in folders_to_check.items() if folder in incomplete]
+
+    return pending_urls, bytes_transferred
+
+
+def parse_rsync_transferred_bytes(stdout : bytes) -> Optional[int]:
+    match = RSYNC_TRANSFERRED_BYTES_REGEX.search(stdout.decode('utf-8', errors='replace'))
+    if match is None:
+        return None
+    return int(match.group(1).replace(',', ''))
+
+
+def group_by_rsync_root(rsync_urls : List[str]) -> Dict[str, List[str]]:
+    """
+    Group assembly folder URLs by root, i.e. the part preceding `GCA/123/456/789/...` 
+    for NCBI URLs, or the parent folder otherwise.
+    """
+    marker = '/genomes/all/'
+    groups = defaultdict(list)
+    for url in rsync_urls:
+        if marker in url:
+            root = url[:url.index(marker) + len(marker)]
+        else:
+            root = url.rstrip('/').rsplit('/', 1)[0] + '/'
+        groups[root].append(url)
+
+    return groups
+
+
+def write_files_from_list(rsync_root : str, rsync_urls : List[str]) -> Path:
+    """
+    Write paths of `rsync_urls` relative to `rsync_root` to a temporary file, 
+    for use with rsync option `--files-from`. The caller is responsible for deleting the file.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='_files_from.txt', delete=False) as f:
+        for url in rsync_urls:
+            f.write(url[len(rsync_root):].strip('/') + '\n')
+
+    return Path(f.name)
+
+
+def get_folder_name(rsync_url : str) -> str:
+    return rsync_url.rstrip('/').split('/')[-1]
+
+
+def get_folder_size(folder : Path) -> int:
+    """
+    Total size in bytes of the files in `folder`, recursively.
+    """
+    n_bytes = 0
+    for root, _, file_names in os.walk(folder):
+        for file_name in file_names:
+            n_bytes += os.path.getsize(os.path.join(root, file_name))
+
+    return n_bytes
+
+
+def get_rsync_filter_params(folder_names : List[str], file_types : Optional[List[str]]) -> List[str]:
+    """
+    rsync include / exclude rules to download only the selected file types of assemblies `folder_names`.
+    All files except README.txt are downloaded if `file_types` is None.
+    """
+    if file_types is None:
+        return ['--exclude', 'README.txt']
+
+    # Patterns are anchored to the assembly folder, since a loose pattern such as 
+    # `*_genomic.fna.gz` would also match `*_cds_from_genomic.fna.gz`.
+    params = []
+    for folder_name in folder_names:
+        params += ['--include', f'/{folder_name}/']
+        for file_name in get_selected_file_names(folder_name, file_types):
+            params += ['--include', f'/{folder_name}/{file_name}']
+    params += ['--exclude', '*']
+    return params
+
+
+def get_selected_file_names(folder_name : str, file_types : List[str]) -> List[str]:
+    """
+    Names of the files to download from assembly `folder_name`, compressed or not, 
+    e.g. `GCA_018222585.1_ASM1822258v1_protein.faa.gz` for file type `protein.faa`.
+    """
+    file_names = ['md5checksums.txt']
+    for file_type in file_types:
+        file_names += [f'{folder_name}_{file_type}', f'{folder_name}_{file_type}.gz']
+    return file_names
+
+
+def is_selected_file(folder_name : str, relative_path : str, file_types : List[str]) -> bool:
+    """
+    Whether file `relative_path` of assembly `folder_name` belongs to one of `file_types`.
+    """
+    return relative_path in get_selected_file_names(folder_name, file_types)
+
+
+def get_skipped_bytes(
+    rsync_urls : List[str], 
+    file_types : List[str], 
+    governor : Optional[DownloadGovernor] = None,
+) -> Dict[str, int]:
+    """
+    Number of bytes in each assembly folder that are not downloaded 
+    because they do not belong to one of `file_types`, keyed by folder name.
+    Folders are listed with one rsync session per common root; 
+    folders that cannot be listed are left out.
+    """
+    bytes_skipped = {}
+    for rsync_root, urls in group_by_rsync_root(rsync_urls).items():
+        files_from_path = write_files_from_list(rsync_root, urls)
+
+        try:
+            response = run_rsync(
+                [
+                    '--copy-links', 
+                    '--recursive', 
+                    '--list-only', 
+                    '--no-relative',
+                    f'--files-from={files_from_path.as_posix()}',
+                    rsync_root,
+                ],
+                governor,
+            )
+        finally:
+            files_from_path.unlink()
+
+        selected_paths = {
+            f'{folder_name}/{file_name}' 
+            for folder_name in (get_folder_name(url) for url in urls)
+            for file_name in get_selected_file_names(folder_name, file_types)
+        }
+        for line in response.stdout.decode('utf-8').splitlines():
+            # e.g. -rw-r--r--      1,234,567 2021/05/04 10:20:30 GCA_018222585.1_ASM1822258v1/file.txt
+            parts = line.split(maxsplit=4)
+            if len(parts) < 5 or not parts[0].startswith('-'):
+                continue
+
+            path = parts[4]
+            folder_name = path.split('/')[0]
+            if path not in selected_paths and not path.endswith('/README.txt'):
+                bytes_skipped[folder_name] = bytes_skipped.get(folder_name, 0) + int(parts[1].replace(',', ''))
+
+    return bytes_skipped
+
+
+def parse_file_types(file_types : Optional[str]) -> Optional[List[str]]:
+    if file_types is None:
+        return None
+
+    return [
+        file_type.strip()
+        for file_type in file_types.split(',')
+        if file_type.strip() != ''
+    ]
+
+
 def get_assembly_list_from_arguments(
     assembly : Optional[str], 
     assemblies_path : Optional[str]
@@ -260,44 +1228,42 @@ def make_download_instructions(
     assembly_summary_df : pd.DataFrame, 
     assemblies : List[str],
     use_genbank : bool,
-) -> pd.DataFrame:
+    accession_resolver : Optional[pd.DataFrame] = None,
+) -> Tuple[pd.DataFrame, List[str]]:
     """
     Dataframe holding just enough info to be useful for 
     the purpose of downloading genomes.
+
+    Accessions are resolved in one vectorized lookup against `accession_resolver`
+    (see `make_accession_resolver`), which is built from `assembly_summary_df` if unspecified.
     """
-    genbank_ids = set(assembly_summary_df.index)
-    refseq_id_to_genbank = {}
-    for genbank_id in assembly_summary_df.index:
-        row = assembly_summary_df.loc[genbank_id]
-        refseq_id = row['gbrs_paired_asm']
-        if pd.isnull(refseq_id) or refseq_id == 'na':
-            continue
+    if accession_resolver is None:
+        accession_resolver = make_accession_resolver(assembly_summary_df)
 
-        refseq_id_to_genbank[refseq_id] = genbank_id
-
-    assembly_ids = set()
-    missing_accessions = []
-    assembly_use_ref_seq = []
-    for assembly in assemblies:
-        if assembly in genbank_ids:
-            assembly_accession = assembly
-        elif assembly in refseq_id_to_genbank:
-            assembly_accession = refseq_id_to_genbank[assembly]
-            if not use_genbank:
-                assembly_use_ref_seq.append((assembly_accession, assembly))
-        else:
-            missing_accessions.append(assembly)
+    resolved_df = accession_resolver.reindex(pd.Index(assemblies))
 
-        assembly_ids.add(assembly_accession)
+    is_missing = resolved_df['assembly_accession'].isnull().to_numpy()
+    missing_accessions = resolved_df.index[is_missing].tolist()
+    resolved_df = resolved_df[~is_missing]
+
+    assembly_ids = sorted(set(resolved_df['assembly_accession']))
 
     # Use RefSeq URL if necessary
-    for assembly, refseq_id in assembly_use_ref_seq:
-        ftp_path = assembly_summary_df.loc[assembly, 'ftp_path']
-        ftp_path = ftp_path.replace(assembly, refseq_id)
-        ftp_path = ftp_path.replace('/GCA/', '/GCF/')
-        assembly_summary_df.loc[assembly, 'ftp_path'] = ftp_path
+    if not use_genbank:
+        use_refseq_df = resolved_df[
+            resolved_df['paired_accession'].notnull()
+        ].drop_duplicates('assembly_accession')
+
+        if len(use_refseq_df) > 0:
+            assembly_accessions = use_refseq_df['assembly_accession'].tolist()
+            refseq_ids = use_refseq_df['paired_accession'].tolist()
+            ftp_paths = assembly_summary_df.loc[assembly_accessions, 'ftp_path'].tolist()
+            assembly_summary_df.loc[assembly_accessions, 'ftp_path'] = [
+                ftp_path.replace(assembly, refseq_id).replace('/GCA/', '/GCF/')
+                for ftp_path, assembly, refseq_id in zip(ftp_paths, assembly_accessions, refseq_ids)
+            ]
 
-    subset_df = assembly_summary_df.loc[sorted(assembly_ids)]
+    subset_df = assembly_summary_df.loc[assembly_ids]
 
     column_subset = ['organism_name', 'asm_name', 'ftp_path']
     return (
@@ -306,16 +1272,10 @@ def make_download_instructions(
     )
 
 
-def exponential_backoff_sleep_seconds(try_nb):
-    """
-    Return an exponentially larger number of seconds with each try.
-    A total of 10 tries adds up to about 5 minutes.
-    """
-    return np.round(1.6 ** try_nb + random.uniform(0, 1), 1)
-
-
 class AssemblyDownloadError(Exception):
-    pass
+    def __init__(self, message : str, stats : Optional[dict] = None):
+        super().__init__(message)
+        self.stats = stats if stats is not None else {'attempts': 1}
 
 
 if __name__ == '__main__':
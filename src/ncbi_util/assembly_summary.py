@@ -7,17 +7,79 @@ README: https://ftp.ncbi.nlm.nih.gov/genomes/ASSEMBLY_REPORTS/README_assembly_su
 CONTENT: https://ftp.ncbi.nlm.nih.gov/genomes/ASSEMBLY_REPORTS/assembly_summary_genbank.txt 
 """
 
+from collections import defaultdict
+import json
+import logging
 import os
 from pathlib import Path
 import tempfile
-from typing import Optional
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
 import requests
 
 from .urls import assembly_summary_url
 
 
+# Shared on-disk cache, reused across scripts and runs.
+DEFAULT_CACHE_FOLDER = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'assembly'
+
+# Compact dtypes for the assembly summary columns (see README link above).
+# Columns not listed here are read as strings.
+ASSEMBLY_SUMMARY_CATEGORICAL_COLUMNS = [
+    'refseq_category',
+    'version_status',
+    'assembly_level',
+    'release_type',
+    'genome_rep',
+    'asm_submitter',
+    'paired_asm_comp',
+    'excluded_from_refseq',
+    'relation_to_type_material',
+    'assembly_type',
+    'group',
+    'annotation_provider',
+    'annotation_name',
+]
+ASSEMBLY_SUMMARY_NUMERIC_DTYPES = {
+    'taxid': 'Int32',
+    'species_taxid': 'Int32',
+    'genome_size': 'Int64',
+    'genome_size_ungapped': 'Int64',
+    'gc_percent': 'float32',
+    'replicon_count': 'Int32',
+    'scaffold_count': 'Int32',
+    'contig_count': 'Int32',
+    'total_gene_count': 'Int32',
+    'protein_coding_gene_count': 'Int32',
+    'non_coding_gene_count': 'Int32',
+}
+
+# Approximate compressed size of assembly files, as bytes per base, per gene and per contig.
+# Measured on typical bacterial assemblies; only used to order downloads, not to check them.
+FILE_TYPE_BYTES_PER_UNIT = {
+    'genomic.fna': (0.29, 0, 0),
+    'genomic.gbff': (0.42, 300, 700),
+    'protein.faa': (0, 200, 0),
+    'protein.gpff': (0, 530, 0),
+    'cds_from_genomic.fna': (0, 310, 0),
+    'translated_cds.faa': (0, 230, 0),
+    'rna_from_genomic.fna': (0, 5, 0),
+    'genomic.gff': (0, 60, 0),
+    'genomic.gtf': (0, 75, 0),
+    'feature_table.txt': (0, 36, 0),
+}
+# Reports, contamination ranges and assembly_structure, downloaded when all files are
+OTHER_FILES_BYTES_PER_UNIT = (0.33, 0, 100)
+ASSEMBLY_FIXED_BYTES = 20_000
+
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 60
+
+logger = logging.getLogger()
+
+
 def download_latest_assembly_summary_as_df(
     path : Optional[os.PathLike] = None,
     delete_after : bool = True,
@@ -51,13 +113,93 @@ def download_latest_assembly_summary(
     elif isinstance(path, str):
         path = Path(path).resolve()
 
-    with path.open('wb') as f:
-        r = requests.get(assembly_summary_url)
-        f.write(r.content)
+    with requests.get(assembly_summary_url, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS) as r:
+        r.raise_for_status()
+        write_response_to_file(r, path)
 
     return path
 
 
+def get_cached_assembly_summary(
+    cache_folder : Optional[os.PathLike] = None,
+    url : str = assembly_summary_url,
+) -> Path:
+    """
+    Return path to a local copy of the assembly summary stored in `cache_folder`
+    (defaults to `DEFAULT_CACHE_FOLDER`).
+
+    The cached copy is revalidated against NCBI with a conditional request 
+    (ETag / Last-Modified, stored in a JSON file next to the summary) and the
+    file is only transferred again if it changed. Downloads are streamed to disk in chunks.
+    If NCBI cannot be reached, the cached copy is used as is.
+    """
+    cache_folder = Path(cache_folder) if cache_folder is not None else DEFAULT_CACHE_FOLDER
+    cache_folder.mkdir(parents=True, exist_ok=True)
+
+    summary_path = cache_folder / url.split('/')[-1]
+    headers_path = cache_folder / f'{summary_path.name}.headers.json'
+
+    cached_headers = {}
+    if summary_path.is_file() and headers_path.is_file():
+        with headers_path.open() as f:
+            cached_headers = json.load(f)
+
+    request_headers = {}
+    if cached_headers.get('etag') is not None:
+        request_headers['If-None-Match'] = cached_headers['etag']
+    if cached_headers.get('last_modified') is not None:
+        request_headers['If-Modified-Since'] = cached_headers['last_modified']
+
+    try:
+        with requests.get(url, headers=request_headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS) as r:
+            if r.status_code == 304:
+                logger.info(f'Assembly summary unchanged since last download: {summary_path}')
+                return summary_path
+
+            r.raise_for_status()
+
+            logger.info(f'Downloading assembly summary to {summary_path}')
+            with tempfile.NamedTemporaryFile(dir=cache_folder, prefix=f'.{summary_path.name}', delete=False) as f:
+                temp_path = Path(f.name)
+            try:
+                write_response_to_file(r, temp_path)
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, summary_path)
+            finally:
+                if temp_path.is_file():
+                    temp_path.unlink()
+
+            with headers_path.open('w') as f:
+                json.dump(
+                    {
+                        'url': url,
+                        'etag': r.headers.get('ETag'),
+                        'last_modified': r.headers.get('Last-Modified'),
+                    }, 
+                    f,
+                )
+
+    except requests.RequestException as e:
+        if not summary_path.is_file():
+            raise
+        logger.warning(f'Could not revalidate assembly summary, using cached copy {summary_path}: {e}')
+
+    return summary_path
+
+
+def write_response_to_file(
+    response : requests.Response, 
+    path : os.PathLike, 
+    chunk_size : int = DOWNLOAD_CHUNK_SIZE,
+) -> None:
+    """
+    Stream the body of `response` (requested with `stream=True`) to `path`, one chunk at a time.
+    """
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+
+
 def parse_assembly_summary(path : os.PathLike) -> pd.DataFrame:
     """
     Parse assembly summary file from NCBI into a pandas DataFrame.
@@ -69,3 +211,179 @@ def parse_assembly_summary(path : os.PathLike) -> pd.DataFrame:
     assembly_summary_df.columns = columns
 
     return assembly_summary_df.set_index('assembly_accession')
+
+
+def load_assembly_summary(
+    path : os.PathLike, 
+    columns : Optional[List[str]] = None,
+    use_sidecar : bool = True,
+) -> pd.DataFrame:
+    """
+    Lean alternative to `parse_assembly_summary`.
+
+    Only `columns` are returned (all columns if unspecified), with compact dtypes: 
+    categories for low cardinality columns and nullable integers for counts and sizes 
+    (`na` values become missing values).
+
+    On first parse, the typed table is saved to a Parquet sidecar file next to `path`
+    (`<path>.parquet`). Later calls read the requested columns from the sidecar, 
+    as long as it is more recent than `path`.
+    """
+    path = Path(path)
+    sidecar_path = get_assembly_summary_sidecar_path(path)
+
+    sidecar_is_fresh = (
+        sidecar_path.is_file() and 
+        sidecar_path.stat().st_mtime >= path.stat().st_mtime
+    )
+    if use_sidecar and sidecar_is_fresh:
+        read_columns = None if columns is None else ['assembly_accession'] + list(columns)
+        return pd.read_parquet(sidecar_path, columns=read_columns).set_index('assembly_accession')
+
+    if use_sidecar:
+        # The sidecar holds every column so that it can serve any later call.
+        assembly_summary_df = read_assembly_summary_typed(path)
+        try:
+            write_assembly_summary_sidecar(assembly_summary_df, sidecar_path)
+        except OSError as e:
+            logger.warning(f'Could not write assembly summary sidecar file {sidecar_path}: {e}')
+    else:
+        assembly_summary_df = read_assembly_summary_typed(path, columns)
+
+    assembly_summary_df = assembly_summary_df.set_index('assembly_accession')
+    if columns is not None:
+        assembly_summary_df = assembly_summary_df[list(columns)]
+
+    return assembly_summary_df
+
+
+def read_assembly_summary_typed(path : os.PathLike, columns : Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read assembly summary file with compact dtypes, optionally restricted to `columns`.
+    Returns `assembly_accession` as a regular column.
+    """
+    wanted = None if columns is None else {'assembly_accession'} | set(columns)
+
+    def normalize_column_name(c):
+        return c.lstrip('#').strip()
+
+    # Strings unless specified otherwise
+    dtypes = defaultdict(lambda: str)
+    for c in ASSEMBLY_SUMMARY_CATEGORICAL_COLUMNS:
+        dtypes[c] = 'category'
+    dtypes.update(ASSEMBLY_SUMMARY_NUMERIC_DTYPES)
+
+    assembly_summary_df = pd.read_csv(
+        path, 
+        sep='\t', 
+        skiprows=1, 
+        usecols=None if wanted is None else lambda c: normalize_column_name(c) in wanted,
+        dtype=dtypes,
+        keep_default_na=False,
+        na_values={c: ['na', ''] for c in ASSEMBLY_SUMMARY_NUMERIC_DTYPES},
+    )
+    assembly_summary_df.columns = [normalize_column_name(c) for c in assembly_summary_df.columns]
+
+    return assembly_summary_df
+
+
+def write_assembly_summary_sidecar(assembly_summary_df : pd.DataFrame, sidecar_path : Path) -> None:
+    with tempfile.NamedTemporaryFile(dir=sidecar_path.parent, prefix=f'.{sidecar_path.name}', delete=False) as f:
+        temp_path = Path(f.name)
+    try:
+        assembly_summary_df.to_parquet(temp_path, index=False)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, sidecar_path)
+    finally:
+        if temp_path.is_file():
+            temp_path.unlink()
+
+
+def get_assembly_summary_sidecar_path(path : os.PathLike) -> Path:
+    path = Path(path)
+    return path.with_name(f'{path.name}.parquet')
+
+
+def make_accession_resolver(assembly_summary_df : pd.DataFrame) -> pd.DataFrame:
+    """
+    Build a lookup table from any accession found in the assembly summary to the row it belongs to.
+
+    Keys cover GenBank and RefSeq accessions (via column `gbrs_paired_asm`), both versioned 
+    (e.g. GCF_000337575.1) and unversioned (e.g. GCF_000337575). Unversioned keys point to the 
+    latest version available. Exact matches on the summary index take precedence over paired accessions.
+
+    Index: accession
+    Columns:
+    - assembly_accession: matching index of the assembly summary
+    - paired_accession: paired accession the key was derived from (NaN for direct matches)
+
+    Build it once and reuse it: resolving a list of accessions is then a single `reindex` call.
+    """
+    accessions = assembly_summary_df.index.to_numpy(dtype=object)
+    paired_accessions = assembly_summary_df['gbrs_paired_asm'].to_numpy(dtype=object)
+    has_pair = pd.notnull(paired_accessions) & (paired_accessions != 'na')
+
+    # Versioned keys: direct matches first, then paired accessions
+    keys = np.concatenate([accessions, paired_accessions[has_pair]])
+    targets = np.concatenate([accessions, accessions[has_pair]])
+    pairs = np.concatenate([
+        np.full(len(accessions), np.nan, dtype=object), 
+        paired_accessions[has_pair],
+    ])
+    priorities = np.concatenate([
+        np.zeros(len(accessions), dtype=np.int8), 
+        np.ones(has_pair.sum(), dtype=np.int8),
+    ])
+
+    # Unversioned keys: point to the latest version, direct matches first
+    split_keys = [k.partition('.') for k in keys]
+    base_keys = np.array([base for base, _, _ in split_keys], dtype=object)
+    versions = np.array([int(v) if v.isdigit() else 0 for _, _, v in split_keys], dtype=np.int64)
+    order = np.lexsort((-versions, priorities))
+
+    all_keys = np.concatenate([keys, base_keys[order]])
+    _, first_ix = np.unique(pd.factorize(all_keys)[0], return_index=True)
+    first_ix.sort()
+
+    return pd.DataFrame(
+        {
+            'assembly_accession': np.concatenate([targets, targets[order]])[first_ix],
+            'paired_accession': np.concatenate([pairs, pairs[order]])[first_ix],
+        },
+        index=pd.Index(all_keys[first_ix], name='key', dtype=object),
+        dtype=object,
+    )
+
+
+def predict_download_bytes(
+    assembly_summary_df : pd.DataFrame, 
+    file_types : Optional[List[str]] = None,
+) -> pd.Series:
+    """
+    Estimate the download size of each assembly from columns
+    genome_size, total_gene_count and contig_count.
+    Only files of `file_types` are counted if specified; all files otherwise.
+    Missing genome sizes are replaced by the median.
+    """
+    def get_counts(column):
+        if column not in assembly_summary_df.columns:
+            return np.zeros(len(assembly_summary_df))
+        values = pd.to_numeric(assembly_summary_df[column], errors='coerce')
+        return values.to_numpy(dtype=float, na_value=np.nan)
+
+    n_bases = get_counts('genome_size')
+    is_missing = np.isnan(n_bases)
+    if is_missing.any():
+        median = 0. if is_missing.all() else np.nanmedian(n_bases)
+        n_bases = np.where(is_missing, median, n_bases)
+    n_genes = np.nan_to_num(get_counts('total_gene_count'))
+    n_contigs = np.nan_to_num(get_counts('contig_count'))
+
+    if file_types is None:
+        units = list(FILE_TYPE_BYTES_PER_UNIT.values()) + [OTHER_FILES_BYTES_PER_UNIT]
+    else:
+        units = [FILE_TYPE_BYTES_PER_UNIT.get(file_type, (0, 0, 0)) for file_type in file_types]
+
+    per_base, per_gene, per_contig = np.sum(units, axis=0)
+    predicted = ASSEMBLY_FIXED_BYTES + per_base * n_bases + per_gene * n_genes + per_contig * n_contigs
+    return pd.Series(predicted.astype(np.int64), index=assembly_summary_df.index, name='predicted_bytes')
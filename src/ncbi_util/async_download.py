@@ -0,0 +1,308 @@
+"""
+Asyncio HTTPS transport to download assembly folders from NCBI.
+
+Alternative to rsync: a single process runs many file downloads concurrently
+over a bounded pool of keep-alive connections. Retries back off with `asyncio.sleep`,
+so that a failing transfer never stalls the others.
+
+Assembly folders are listed from the HTML index served at their `ftp_path`
+(e.g. https://ftp.ncbi.nlm.nih.gov/genomes/all/GCA/018/222/585/GCA_018222585.1_ASM1822258v1/).
+"""
+import asyncio
+from email.utils import parsedate_to_datetime
+import logging
+import os
+from pathlib import Path
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import aiohttp
+
+from src.utils import exponential_backoff_sleep_seconds
+from src.ncbi_util.download_governor import POLL_SECONDS, DownloadGovernor
+
+
+logger = logging.getLogger()
+
+HREF_REGEX = re.compile(r'href="([^"]+)"', re.IGNORECASE)
+
+# HTTP status codes worth retrying; any other error status fails the download right away.
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def download_assemblies_https(
+    tasks : List[Tuple[str, str, str]],
+    output_folder : os.PathLike,
+    is_selected : Optional[Callable[[str, str], bool]] = None,
+    max_connections : int = 64,
+    n_retries : int = 10,
+    on_result : Optional[Callable[[dict], None]] = None,
+    governor : Optional[DownloadGovernor] = None,
+) -> List[dict]:
+    """
+    Download `(assembly, organism_name, ftp_path)` tasks to `<output_folder>/<folder name>/`.
+
+    - is_selected: optional predicate `(folder_name, relative_path) -> bool` to filter files.
+      README.txt is always skipped.
+    - max_connections: size of the connection pool, i.e. maximum number of concurrent transfers.
+    - on_result: optional callback called with each result as soon as it is available.
+    - governor: optional bandwidth and concurrency governor, applied to file transfers.
+
+    Return one result dict per assembly, with key `error = None` on success,
+    `bytes` downloaded and download `duration_seconds`.
+    """
+    return asyncio.run(_download_assemblies(
+        tasks,
+        Path(output_folder),
+        is_selected,
+        max_connections,
+        n_retries,
+        on_result,
+        governor,
+    ))
+
+
+async def _download_assemblies(
+    tasks : List[Tuple[str, str, str]],
+    output_folder : Path,
+    is_selected : Optional[Callable[[str, str], bool]],
+    max_connections : int,
+    n_retries : int,
+    on_result : Optional[Callable[[dict], None]],
+    governor : Optional[DownloadGovernor],
+) -> List[dict]:
+    queue = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+
+    results = []
+
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_connections)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def consumer():
+            while True:
+                try:
+                    task = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                result = await download_assembly(session, task, output_folder, is_selected, n_retries, governor)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+        # Assemblies hold several files each, so there is no need for more
+        # assembly consumers than connections to keep the pool busy.
+        n_consumers = min(max_connections, len(tasks))
+        await asyncio.gather(*[consumer() for _ in range(n_consumers)])
+
+    return results
+
+
+async def download_assembly(
+    session : aiohttp.ClientSession,
+    task : Tuple[str, str, str],
+    output_folder : Path,
+    is_selected : Optional[Callable[[str, str], bool]],
+    n_retries : int,
+    governor : Optional[DownloadGovernor] = None,
+) -> dict:
+    assembly, _, ftp_path = task
+    folder_url = ftp_path.rstrip('/') + '/'
+    folder_name = folder_url.rstrip('/').split('/')[-1]
+
+    result = {
+        'assembly': assembly, 
+        'error': None, 
+        'attempts': 1,
+        'bytes': None,
+        'bytes_transferred': None,
+        'duration_seconds': None,
+        'retry_sleep_seconds': 0.,
+        'error_codes': [],
+        'bytes_skipped': 0,
+    }
+    start = time.monotonic()
+    try:
+        relative_paths = await list_folder(session, folder_url, n_retries, result)
+        relative_paths = [
+            p for p in relative_paths
+            if p != 'README.txt' and (is_selected is None or is_selected(folder_name, p))
+        ]
+        responses = await asyncio.gather(
+            *[
+                download_file(
+                    session,
+                    folder_url + quote(p),
+                    output_folder / folder_name / p,
+                    n_retries,
+                    result,
+                    governor,
+                )
+                for p in relative_paths
+            ],
+            return_exceptions=True,
+        )
+        errors = [r for r in responses if isinstance(r, BaseException)]
+        if len(errors) > 0:
+            raise errors[0]
+
+        result['bytes'] = sum(responses)
+        result['bytes_transferred'] = result['bytes']
+
+    except (HttpDownloadError, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        logger.error(f'Error while downloading {assembly}: {e!r}')
+        result['error'] = str(e) or repr(e)
+
+    result['duration_seconds'] = time.monotonic() - start
+    return result
+
+
+async def list_folder(
+    session : aiohttp.ClientSession,
+    folder_url : str,
+    n_retries : int,
+    stats : Optional[dict] = None,
+    prefix : str = '',
+) -> List[str]:
+    """
+    Return paths of all files in `folder_url`, relative to it, recursing into sub-folders.
+    """
+    html = await with_retries(lambda: fetch_text(session, folder_url), folder_url, n_retries, stats)
+
+    relative_paths = []
+    for href in HREF_REGEX.findall(html):
+        # Skip sorting links, parent directory, absolute links, etc.
+        if href.startswith(('?', '#', '/', '.')) or '://' in href:
+            continue
+
+        name = unquote(href)
+        if name.endswith('/'):
+            relative_paths += await list_folder(session, folder_url + href, n_retries, stats, prefix + name)
+        else:
+            relative_paths.append(prefix + name)
+
+    return relative_paths
+
+
+async def fetch_text(session : aiohttp.ClientSession, url : str) -> str:
+    async with session.get(url) as response:
+        check_status(response)
+        return await response.text()
+
+
+async def download_file(
+    session : aiohttp.ClientSession,
+    url : str,
+    output_path : Path,
+    n_retries : int,
+    stats : Optional[dict] = None,
+    governor : Optional[DownloadGovernor] = None,
+) -> int:
+    """
+    Stream `url` to `output_path` and return the number of bytes written.
+    Data is written to a `.part` file first, renamed once complete.
+    Modification time is set from the Last-Modified header, as rsync --times would do.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = output_path.with_name(f'{output_path.name}.part')
+
+    async def fetch():
+        n_bytes = 0
+        if governor is not None:
+            while not governor.try_acquire_connection():
+                await asyncio.sleep(POLL_SECONDS)
+
+        try:
+            async with session.get(url) as response:
+                check_status(response)
+                with part_path.open('wb') as f:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        n_bytes += len(chunk)
+                        if governor is not None:
+                            wait_seconds = governor.consume(len(chunk))
+                            if wait_seconds > 0:
+                                await asyncio.sleep(wait_seconds)
+
+                last_modified = response.headers.get('Last-Modified')
+        finally:
+            if governor is not None:
+                governor.release_connection()
+
+        os.replace(part_path, output_path)
+        if last_modified is not None:
+            mtime = parsedate_to_datetime(last_modified).timestamp()
+            os.utime(output_path, (mtime, mtime))
+
+        return n_bytes
+
+    try:
+        return await with_retries(fetch, url, n_retries, stats, governor)
+    finally:
+        if part_path.is_file():
+            part_path.unlink()
+
+
+async def with_retries(
+    coroutine_fn, 
+    description : str, 
+    n_retries : int, 
+    stats : Optional[dict] = None, 
+    governor : Optional[DownloadGovernor] = None,
+):
+    """
+    Await `coroutine_fn()`, retrying with exponential backoff on network errors
+    and retryable HTTP status codes. Waiting does not block other transfers.
+    Retries are counted in `stats` if specified (keys: attempts, retry_sleep_seconds, error_codes)
+    and reported to `governor` if specified.
+    """
+    try_nb = 0
+    while True:
+        try_nb += 1
+        try:
+            value = await coroutine_fn()
+            if governor is not None:
+                governor.report_try(True)
+            return value
+        except (RetryableHttpError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if governor is not None:
+                governor.report_try(False)
+            if try_nb > n_retries:
+                raise HttpDownloadError(f'{try_nb:,} tries failed, aborting. Error: {e!r}')
+
+            sleep_seconds = exponential_backoff_sleep_seconds(try_nb)
+            logger.warning((
+                f'{description}: try number {try_nb:,} failed, retrying in {sleep_seconds:,} seconds. '
+                f'Error: {e!r}'
+            ))
+            if stats is not None:
+                stats['attempts'] += 1
+                stats['retry_sleep_seconds'] += sleep_seconds
+                stats['error_codes'].append(getattr(e, 'status', type(e).__name__))
+            await asyncio.sleep(sleep_seconds)
+
+
+def check_status(response : aiohttp.ClientResponse) -> None:
+    if response.status == 200:
+        return
+    elif response.status in RETRY_STATUS_CODES:
+        raise RetryableHttpError(f'HTTP {response.status} for {response.url}', response.status)
+    else:
+        raise HttpDownloadError(f'HTTP {response.status} for {response.url}')
+
+
+class HttpDownloadError(Exception):
+    pass
+
+
+class RetryableHttpError(Exception):
+    def __init__(self, message : str, status : int):
+        super().__init__(message)
+        self.status = status
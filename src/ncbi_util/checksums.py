@@ -0,0 +1,153 @@
+"""
+Verify local assembly folders against the `md5checksums.txt` file published by NCBI in each folder.
+
+Hashes are computed on a thread pool (hashlib releases the GIL on large buffers)
+and cached by (path, size, modification time, inode), so that files are only hashed again if they changed.
+The inode is part of the key since files hard linked from a genome store (see `genome_store.py`) take 
+the size and modification time of the stored object: a path relinked to another object of the same size 
+and modification time would otherwise get the md5 of the previous file.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger()
+
+MD5_CHECKSUMS_FILE_NAME = 'md5checksums.txt'
+MD5_CACHE_FILE_NAME = 'md5_cache.tsv'
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def find_incomplete_assemblies(
+    folders : List[Path],
+    is_expected : Optional[Callable[[str, str], bool]] = None,
+    md5_cache : Optional[Dict[Tuple[str, int, int, int], str]] = None,
+    n_threads : int = 8,
+) -> Dict[Path, List[str]]:
+    """
+    Check assembly folders against their `md5checksums.txt`.
+
+    - is_expected: optional predicate `(folder_name, relative_path) -> bool` restricting
+      the files that should be present (e.g. file type filtering). README.txt is never expected.
+    - md5_cache: optional dict `(path, size, mtime_ns, inode) -> md5` (see `get_md5_cache_key`), updated in place.
+
+    Return a dict mapping incomplete folders to the relative paths of their missing or corrupt files.
+    Folders without `md5checksums.txt` are incomplete.
+    """
+    if md5_cache is None:
+        md5_cache = {}
+
+    incomplete = {}
+    to_hash = []
+    for folder in folders:
+        checksums_path = folder / MD5_CHECKSUMS_FILE_NAME
+        if not checksums_path.is_file():
+            incomplete[folder] = [MD5_CHECKSUMS_FILE_NAME]
+            continue
+
+        for relative_path, expected_md5 in parse_md5_checksums(checksums_path).items():
+            if relative_path == 'README.txt':
+                continue
+            elif is_expected is not None and not is_expected(folder.name, relative_path):
+                continue
+
+            path = folder / relative_path
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                incomplete.setdefault(folder, []).append(relative_path)
+                continue
+
+            key = get_md5_cache_key(path, stat)
+            to_hash.append((folder, relative_path, key, expected_md5))
+
+    keys_to_compute = sorted({key for _, _, key, _ in to_hash if key not in md5_cache})
+    if len(keys_to_compute) > 0:
+        logger.info(f'Computing md5 checksums of {len(keys_to_compute):,} files')
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            md5s = executor.map(compute_md5, [key[0] for key in keys_to_compute])
+            for key, md5 in zip(keys_to_compute, md5s):
+                md5_cache[key] = md5
+
+    for folder, relative_path, key, expected_md5 in to_hash:
+        if md5_cache[key] != expected_md5:
+            incomplete.setdefault(folder, []).append(relative_path)
+
+    return incomplete
+
+
+def get_md5_cache_key(path : Path, stat : os.stat_result) -> Tuple[str, int, int, int]:
+    return (path.resolve().as_posix(), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def parse_md5_checksums(path : os.PathLike) -> Dict[str, str]:
+    """
+    Parse `md5checksums.txt` into a dict mapping relative file path to md5, e.g.:
+    `b6e1d01921684cffd9b0b94f0703cd63  ./GCA_018222585.1_ASM1822258v1_protein.faa.gz`
+    """
+    checksums = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.strip().split(maxsplit=1)
+            if len(parts) != 2:
+                continue
+
+            md5, relative_path = parts
+            if relative_path.startswith('./'):
+                relative_path = relative_path[2:]
+            checksums[relative_path] = md5.lower()
+
+    return checksums
+
+
+def compute_md5(path : os.PathLike, chunk_size : int = HASH_CHUNK_SIZE) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def load_md5_cache(path : os.PathLike) -> Dict[Tuple[str, int, int, int], str]:
+    """
+    Load md5 cache from a TSV file with columns path, size, mtime_ns, inode, md5.
+    Return an empty cache if the file does not exist. Rows of other formats are ignored.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return {}
+
+    cache = {}
+    with path.open(newline='') as f:
+        for row in csv.reader(f, delimiter='\t'):
+            if len(row) != 5:
+                continue
+            file_path, size, mtime_ns, inode, md5 = row
+            cache[(file_path, int(size), int(mtime_ns), int(inode))] = md5
+
+    return cache
+
+
+def save_md5_cache(md5_cache : Dict[Tuple[str, int, int, int], str], path : os.PathLike) -> None:
+    """
+    Save md5 cache to a TSV file.
+    Stale entries are harmless since keys include file size, modification time and inode.
+    """
+    path = Path(path)
+    temp_path = path.with_name(f'.{path.name}.tmp')
+    with temp_path.open('w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        for (file_path, size, mtime_ns, inode), md5 in md5_cache.items():
+            writer.writerow([file_path, size, mtime_ns, inode, md5])
+
+    os.replace(temp_path, path)
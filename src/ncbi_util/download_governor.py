@@ -0,0 +1,154 @@
+"""
+Bandwidth and concurrency governor shared by all download processes.
+
+- Connections: at most `limit` downloads run at the same time across processes,
+  whatever the number of processes (--cpu) or asyncio tasks.
+- Bandwidth: a token bucket refilled at `max_bytes_per_second`. Bytes of HTTPS transfers are consumed
+  from the bucket as they arrive and new connections wait while it is in debt.
+  rsync processes are instead given their share of the bandwidth with --bwlimit,
+  which already paces the transfer: their bytes are not consumed from the bucket.
+- Adaptive backoff: the failure rate of download tries is tracked with an exponential moving average.
+  When it climbs above `FAILURE_RATE_HIGH`, the connection limit and bandwidth are halved;
+  they recover additively once tries succeed again.
+
+State lives in shared memory (multiprocessing values) guarded by a single lock,
+so the governor must be created before download processes are started.
+"""
+from contextlib import contextmanager
+import logging
+import multiprocessing
+import time
+from typing import Optional
+
+
+logger = logging.getLogger()
+
+POLL_SECONDS = 0.2
+FAILURE_RATE_ALPHA = 0.1
+FAILURE_RATE_HIGH = 0.25
+FAILURE_RATE_LOW = 0.05
+ADJUSTMENT_INTERVAL_SECONDS = 10.
+MIN_RATE_FACTOR = 0.1
+
+
+class DownloadGovernor:
+
+    def __init__(
+        self,
+        max_connections : int,
+        max_bytes_per_second : Optional[float] = None,
+        burst_seconds : float = 1.,
+    ):
+        self.max_connections = max(1, max_connections)
+        self.max_bytes_per_second = max_bytes_per_second
+        self.burst_bytes = None if max_bytes_per_second is None else max_bytes_per_second * burst_seconds
+
+        self._lock = multiprocessing.Lock()
+        self._active = multiprocessing.RawValue('i', 0)
+        self._limit = multiprocessing.RawValue('i', self.max_connections)
+        self._rate_factor = multiprocessing.RawValue('d', 1.)
+        self._tokens = multiprocessing.RawValue('d', self.burst_bytes or 0.)
+        self._last_refill = multiprocessing.RawValue('d', time.monotonic())
+        self._failure_rate = multiprocessing.RawValue('d', 0.)
+        self._last_adjustment = multiprocessing.RawValue('d', 0.)
+
+    def try_acquire_connection(self) -> bool:
+        """
+        Take a connection slot if one is free and the token bucket is not in debt.
+        """
+        with self._lock:
+            self._refill()
+            if self._active.value >= self._limit.value:
+                return False
+            elif self.max_bytes_per_second is not None and self._tokens.value < 0:
+                return False
+
+            self._active.value += 1
+            return True
+
+    def acquire_connection(self) -> None:
+        while not self.try_acquire_connection():
+            time.sleep(POLL_SECONDS)
+
+    def release_connection(self) -> None:
+        with self._lock:
+            self._active.value = max(0, self._active.value - 1)
+
+    @contextmanager
+    def connection(self):
+        self.acquire_connection()
+        try:
+            yield
+        finally:
+            self.release_connection()
+
+    def consume(self, n_bytes : int) -> float:
+        """
+        Consume `n_bytes` from the token bucket.
+        Return the number of seconds to wait before transferring more data.
+        """
+        if self.max_bytes_per_second is None or n_bytes <= 0:
+            return 0.
+
+        with self._lock:
+            self._refill()
+            self._tokens.value -= n_bytes
+            if self._tokens.value >= 0:
+                return 0.
+            return -self._tokens.value / self._get_rate()
+
+    def get_active_connections(self) -> int:
+        with self._lock:
+            return self._active.value
+
+    def get_connection_bytes_per_second(self) -> Optional[float]:
+        """
+        Bandwidth share of one connection, e.g. for rsync --bwlimit.
+        """
+        if self.max_bytes_per_second is None:
+            return None
+
+        with self._lock:
+            return self._get_rate() / self._limit.value
+
+    def report_try(self, success : bool) -> None:
+        """
+        Report the outcome of a download try, to adapt limits to the failure rate.
+        """
+        with self._lock:
+            failure_rate = (
+                (1 - FAILURE_RATE_ALPHA) * self._failure_rate.value +
+                FAILURE_RATE_ALPHA * float(not success)
+            )
+            self._failure_rate.value = failure_rate
+
+            now = time.monotonic()
+            if now - self._last_adjustment.value < ADJUSTMENT_INTERVAL_SECONDS:
+                return
+
+            limit, rate_factor = self._limit.value, self._rate_factor.value
+            if failure_rate > FAILURE_RATE_HIGH:
+                self._limit.value = max(1, limit // 2)
+                self._rate_factor.value = round(max(MIN_RATE_FACTOR, rate_factor / 2), 3)
+            elif failure_rate < FAILURE_RATE_LOW:
+                self._limit.value = min(self.max_connections, limit + 1)
+                self._rate_factor.value = round(min(1., rate_factor + MIN_RATE_FACTOR), 3)
+            else:
+                return
+
+            if (self._limit.value, self._rate_factor.value) != (limit, rate_factor):
+                self._last_adjustment.value = now
+                logger.info((
+                    f'Failure rate {failure_rate:.0%}: connection limit {limit:,} -> {self._limit.value:,}, '
+                    f'bandwidth factor {rate_factor:.1f} -> {self._rate_factor.value:.1f}'
+                ))
+
+    def _get_rate(self) -> float:
+        return self.max_bytes_per_second * self._rate_factor.value
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.max_bytes_per_second is not None:
+            elapsed = now - self._last_refill.value
+            self._tokens.value = min(self.burst_bytes, self._tokens.value + elapsed * self._get_rate())
+        self._last_refill.value = now
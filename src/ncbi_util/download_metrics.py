@@ -0,0 +1,225 @@
+"""
+Throughput metrics of `fetch_assemblies`.
+
+Every download result is appended to a JSONL event stream, and aggregated metrics
+are periodically written to a Prometheus textfile (e.g. for node_exporter's textfile collector).
+The textfile is rewritten on a timer, not only when results arrive, so that gauges 
+(elapsed time, connections in flight) stay current during long rsync batches.
+A summary is logged at the end, separating transfer time from time spent backing off
+between retries, so that a slow mirror can be told apart from retry storms.
+"""
+from collections import defaultdict
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Optional
+
+from src.ncbi_util.download_governor import DownloadGovernor
+
+
+logger = logging.getLogger()
+
+EVENTS_FILE_NAME = 'download_events.jsonl'
+PROMETHEUS_FILE_NAME = 'fetch_assemblies.prom'
+
+METRIC_PREFIX = 'fetch_assemblies'
+
+
+class DownloadMetrics:
+    """
+    Record download results (dicts reported by download workers, see `worker_main`)
+    to `events_path` and aggregate them, rewriting `prometheus_path` every `flush_seconds` 
+    from a background thread until `close()`.
+    Connections in flight are read from `governor` if specified.
+    """
+
+    def __init__(
+        self,
+        events_path : os.PathLike,
+        prometheus_path : Optional[os.PathLike],
+        n_tasks : int,
+        flush_seconds : float = 15.,
+        governor : Optional[DownloadGovernor] = None,
+    ):
+        self.events_file = open(events_path, 'a')
+        self.prometheus_path = None if prometheus_path is None else Path(prometheus_path)
+        self.n_tasks = n_tasks
+        self.flush_seconds = flush_seconds
+        self.governor = governor
+
+        self.start_time = time.time()
+        self.counts = defaultdict(int)
+        self.error_codes = defaultdict(int)
+        self.worker_totals = defaultdict(lambda: defaultdict(float))
+
+        self.write_event({'event': 'start', 'n_tasks': n_tasks})
+
+        # Guards aggregates, read by the flush thread while results are recorded
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.write_prometheus_textfile()
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.write_prometheus_textfile()
+            except OSError as e:
+                logger.warning(f'Could not write Prometheus textfile {self.prometheus_path}: {e}')
+
+    def record(self, result : dict) -> None:
+        duration_seconds = result.get('duration_seconds') or 0.
+        retry_sleep_seconds = result.get('retry_sleep_seconds') or 0.
+        transfer_seconds = max(0., duration_seconds - retry_sleep_seconds)
+        bytes_transferred = result.get('bytes_transferred') or 0
+        retries = max(0, result.get('attempts', 1) - 1)
+        status = 'downloaded' if result['error'] is None else 'failed'
+
+        self.write_event({
+            'event': 'assembly',
+            'assembly': result['assembly'],
+            'status': status,
+            'worker': result.get('worker_ix', 0) + 1,
+            'attempts': result.get('attempts', 1),
+            'retries': retries,
+            'error_codes': result.get('error_codes', []),
+            'bytes': result.get('bytes'),
+            'bytes_transferred': result.get('bytes_transferred'),
+            'duration_seconds': round(duration_seconds, 3),
+            'retry_sleep_seconds': round(retry_sleep_seconds, 3),
+            'mb_per_second': round(bytes_transferred / 1e6 / transfer_seconds, 3) if transfer_seconds > 0 else None,
+            'error': result['error'],
+        })
+
+        with self._lock:
+            self.counts[status] += 1
+            self.counts['retries'] += retries
+            for code in result.get('error_codes', []):
+                self.error_codes[str(code)] += 1
+
+            worker = self.worker_totals[result.get('worker_ix', 0)]
+            worker['assemblies'] += 1
+            worker['bytes'] += result.get('bytes') or 0
+            worker['bytes_transferred'] += bytes_transferred
+            worker['busy_seconds'] += duration_seconds
+            worker['retry_sleep_seconds'] += retry_sleep_seconds
+            worker['retries'] += retries
+
+    def write_event(self, event : dict) -> None:
+        self.events_file.write(json.dumps({'time': round(time.time(), 3), **event}) + '\n')
+        self.events_file.flush()
+
+    def write_prometheus_textfile(self) -> None:
+        if self.prometheus_path is None:
+            return
+
+        with self._lock:
+            lines = self._get_prometheus_lines()
+
+        temp_path = self.prometheus_path.with_name(f'.{self.prometheus_path.name}.tmp')
+        temp_path.write_text('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.prometheus_path)
+
+    def _get_prometheus_lines(self) -> list:
+        lines = [
+            f'# HELP {METRIC_PREFIX}_tasks Number of assemblies to download in this run.',
+            f'# TYPE {METRIC_PREFIX}_tasks gauge',
+            f'{METRIC_PREFIX}_tasks {self.n_tasks}',
+            f'# HELP {METRIC_PREFIX}_start_time_seconds Start time of the run.',
+            f'# TYPE {METRIC_PREFIX}_start_time_seconds gauge',
+            f'{METRIC_PREFIX}_start_time_seconds {self.start_time:.3f}',
+            f'# HELP {METRIC_PREFIX}_elapsed_seconds Time since the start of the run.',
+            f'# TYPE {METRIC_PREFIX}_elapsed_seconds gauge',
+            f'{METRIC_PREFIX}_elapsed_seconds {time.time() - self.start_time:.3f}',
+        ]
+        if self.governor is not None:
+            lines += [
+                f'# HELP {METRIC_PREFIX}_connections_in_flight Downloads in progress.',
+                f'# TYPE {METRIC_PREFIX}_connections_in_flight gauge',
+                f'{METRIC_PREFIX}_connections_in_flight {self.governor.get_active_connections()}',
+            ]
+
+        lines += [
+            f'# HELP {METRIC_PREFIX}_assemblies_total Processed assemblies by status.',
+            f'# TYPE {METRIC_PREFIX}_assemblies_total counter',
+        ]
+        for status in ('downloaded', 'failed'):
+            lines.append(f'{METRIC_PREFIX}_assemblies_total{{status="{status}"}} {self.counts[status]}')
+
+        lines += [
+            f'# HELP {METRIC_PREFIX}_download_errors_total Failed download tries by error code (rsync exit code or HTTP status).',
+            f'# TYPE {METRIC_PREFIX}_download_errors_total counter',
+        ]
+        for code, count in sorted(self.error_codes.items()):
+            lines.append(f'{METRIC_PREFIX}_download_errors_total{{code="{code}"}} {count}')
+
+        worker_metrics = [
+            ('assemblies', 'Assemblies processed per worker.'),
+            ('bytes', 'Size on disk of downloaded assemblies per worker.'),
+            ('bytes_transferred', 'Bytes transferred per worker.'),
+            ('busy_seconds', 'Time spent downloading per worker, including retries.'),
+            ('retry_sleep_seconds', 'Time spent waiting between retries per worker.'),
+            ('retries', 'Retried download tries per worker.'),
+        ]
+        for name, description in worker_metrics:
+            lines += [
+                f'# HELP {METRIC_PREFIX}_worker_{name}_total {description}',
+                f'# TYPE {METRIC_PREFIX}_worker_{name}_total counter',
+            ]
+            for worker_ix, totals in sorted(self.worker_totals.items()):
+                lines.append(f'{METRIC_PREFIX}_worker_{name}_total{{worker="{worker_ix + 1}"}} {totals[name]:g}')
+
+        return lines
+
+    def close(self) -> None:
+        """
+        Stop periodic writes, write final metrics and log a summary.
+        """
+        self._stop.set()
+        self._flush_thread.join()
+        self.write_prometheus_textfile()
+
+        wall_seconds = time.time() - self.start_time
+        bytes_transferred = sum(w['bytes_transferred'] for w in self.worker_totals.values())
+        busy_seconds = sum(w['busy_seconds'] for w in self.worker_totals.values())
+        retry_sleep_seconds = sum(w['retry_sleep_seconds'] for w in self.worker_totals.values())
+
+        summary = {
+            'event': 'summary',
+            'downloaded': self.counts['downloaded'],
+            'failed': self.counts['failed'],
+            'retries': self.counts['retries'],
+            'error_codes': dict(self.error_codes),
+            'bytes_transferred': int(bytes_transferred),
+            'wall_seconds': round(wall_seconds, 3),
+            'mb_per_second': round(bytes_transferred / 1e6 / wall_seconds, 3) if wall_seconds > 0 else None,
+            'busy_seconds': round(busy_seconds, 3),
+            'retry_sleep_seconds': round(retry_sleep_seconds, 3),
+        }
+        self.write_event(summary)
+        self.events_file.close()
+
+        logger.info((
+            f'Transferred {bytes_transferred / 1e6:,.1f} MB in {wall_seconds:,.1f} seconds '
+            f'({summary["mb_per_second"] or 0:,.2f} MB/s effective)'
+        ))
+        logger.info((
+            f'Retries: {self.counts["retries"]:,}, '
+            f'time spent waiting between retries: {retry_sleep_seconds:,.1f} of {busy_seconds:,.1f} worker seconds'
+        ))
+        if len(self.error_codes) > 0:
+            codes = ', '.join(f'{code}: {count:,}' for code, count in sorted(self.error_codes.items()))
+            logger.info(f'Failed tries by error code: {codes}')
+
+        for worker_ix, totals in sorted(self.worker_totals.items()):
+            transfer_seconds = totals['busy_seconds'] - totals['retry_sleep_seconds']
+            mb_per_second = totals['bytes_transferred'] / 1e6 / transfer_seconds if transfer_seconds > 0 else 0.
+            logger.info((
+                f'Worker {worker_ix + 1} | {int(totals["assemblies"]):,} assemblies, '
+                f'{totals["bytes_transferred"] / 1e6:,.1f} MB transferred at {mb_per_second:,.2f} MB/s, '
+                f'{int(totals["retries"]):,} retries'
+            ))
@@ -0,0 +1,201 @@
+"""
+Persistent download state of `fetch_assemblies`, stored in a SQLite database in the output folder.
+
+One row per accession records its status, number of download attempts, size on disk,
+download duration and last error. Download workers never write to the database:
+they report results to the main process, which is the single writer.
+The database runs in WAL mode so that progress can be queried while a download is running.
+"""
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger()
+
+STATE_DB_FILE_NAME = 'download_state.sqlite'
+
+STATUS_PENDING = 'pending'
+STATUS_DOWNLOADED = 'downloaded'
+STATUS_FAILED = 'failed'
+STATUS_MISSING = 'missing'
+STATUS_SUPERSEDED = 'superseded'
+
+ALL_FILE_TYPES = 'all'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assemblies (
+    accession TEXT PRIMARY KEY,
+    folder_name TEXT,
+    file_types TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER,
+    duration_seconds REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assemblies_status ON assemblies (status);
+"""
+
+
+def open_state_db(path : os.PathLike) -> sqlite3.Connection:
+    """
+    Open (and create if needed) the state database at `path`.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_file_types_key(file_types : Optional[List[str]]) -> str:
+    return ALL_FILE_TYPES if file_types is None else ','.join(sorted(file_types))
+
+
+def record_missing(conn : sqlite3.Connection, requested : Iterable[str], missing : Iterable[str]) -> None:
+    """
+    Record accessions not found on NCBI,
+    forgetting requested accessions previously missing that now resolve.
+    """
+    now = time.time()
+    with conn:
+        conn.executemany(
+            'DELETE FROM assemblies WHERE accession = ? AND status = ?',
+            [(acc, STATUS_MISSING) for acc in requested],
+        )
+        conn.executemany(
+            'INSERT OR IGNORE INTO assemblies (accession, status, updated_at) VALUES (?, ?, ?)',
+            [(acc, STATUS_MISSING, now) for acc in missing],
+        )
+
+
+def get_downloaded_accessions(conn : sqlite3.Connection, file_types_key : str) -> Dict[str, str]:
+    """
+    Return a dict mapping accession to folder name of assemblies
+    already downloaded with the same file types.
+    """
+    rows = conn.execute(
+        'SELECT accession, folder_name FROM assemblies WHERE status = ? AND file_types = ?',
+        (STATUS_DOWNLOADED, file_types_key),
+    )
+    return {accession: folder_name for accession, folder_name in rows}
+
+
+def record_pending(
+    conn : sqlite3.Connection,
+    tasks : List[Tuple[str, str]],
+    file_types_key : str,
+) -> None:
+    """
+    Mark `(accession, folder_name)` tasks as pending, keeping their attempt count.
+    """
+    now = time.time()
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO assemblies (accession, folder_name, file_types, status, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (accession) DO UPDATE SET
+                folder_name = excluded.folder_name,
+                file_types = excluded.file_types,
+                status = excluded.status,
+                updated_at = excluded.updated_at
+            """,
+            [(accession, folder_name, file_types_key, STATUS_PENDING, now) for accession, folder_name in tasks],
+        )
+
+
+def record_results(conn : sqlite3.Connection, results : List[dict]) -> None:
+    """
+    Record download results, as reported by download workers
+    (keys: assembly, error, attempts, bytes, duration_seconds).
+    The last error is cleared on success, so that a successful retry does not keep a stale error.
+    """
+    now = time.time()
+    rows = [
+        (
+            STATUS_DOWNLOADED if r['error'] is None else STATUS_FAILED,
+            r.get('attempts', 1),
+            r.get('bytes'),
+            r.get('duration_seconds'),
+            r['error'],
+            now,
+            r['assembly'],
+        )
+        for r in results
+    ]
+    with conn:
+        conn.executemany(
+            """
+            UPDATE assemblies SET
+                status = ?,
+                attempts = attempts + ?,
+                bytes = COALESCE(?, bytes),
+                duration_seconds = COALESCE(?, duration_seconds),
+                last_error = ?,
+                updated_at = ?
+            WHERE accession = ?
+            """,
+            rows,
+        )
+
+
+def record_superseded(conn : sqlite3.Connection, accessions : List[str]) -> None:
+    """
+    Mark assemblies replaced by a newer version, whose folder has been deleted.
+    """
+    now = time.time()
+    with conn:
+        conn.executemany(
+            'UPDATE assemblies SET status = ?, updated_at = ? WHERE accession = ?',
+            [(STATUS_SUPERSEDED, now, accession) for accession in accessions],
+        )
+
+
+def get_accession_statuses(conn : sqlite3.Connection) -> Dict[str, str]:
+    return {accession: status for accession, status in conn.execute('SELECT accession, status FROM assemblies')}
+
+
+def get_status_counts(conn : sqlite3.Connection) -> Dict[str, int]:
+    rows = conn.execute('SELECT status, COUNT(*) FROM assemblies GROUP BY status ORDER BY status')
+    return {status: count for status, count in rows}
+
+
+def get_accessions(conn : sqlite3.Connection, statuses : List[str]) -> List[str]:
+    placeholders = ', '.join('?' for _ in statuses)
+    rows = conn.execute(
+        f'SELECT accession FROM assemblies WHERE status IN ({placeholders}) ORDER BY accession',
+        statuses,
+    )
+    return [accession for accession, in rows]
+
+
+def get_failed_downloads(conn : sqlite3.Connection) -> List[Tuple[str, int, str]]:
+    """
+    Return `(accession, attempts, last_error)` of failed downloads.
+    """
+    return conn.execute(
+        'SELECT accession, attempts, last_error FROM assemblies WHERE status = ? ORDER BY accession',
+        (STATUS_FAILED,),
+    ).fetchall()
+
+
+def log_status_counts(conn : sqlite3.Connection) -> None:
+    counts = get_status_counts(conn)
+    if len(counts) == 0:
+        logger.info('No assemblies recorded')
+        return
+
+    for status, count in counts.items():
+        logger.info(f'{status}: {count:,}')
+
+    row = conn.execute(
+        'SELECT SUM(bytes), SUM(duration_seconds) FROM assemblies WHERE status = ?',
+        (STATUS_DOWNLOADED,),
+    ).fetchone()
+    n_bytes, duration_seconds = row[0] or 0, row[1] or 0.
+    logger.info(f'Downloaded: {n_bytes / 1e9:,.2f} GB in {duration_seconds / 3600:,.2f} worker hours')
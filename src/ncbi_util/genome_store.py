@@ -0,0 +1,217 @@
+"""
+Content-addressed store of assembly files, shared between output folders.
+
+Files are stored once under `<store>/objects/<md5[:2]>/<md5>` and assembly folders of output folders
+are hard links into it. A manifest per assembly folder, `<store>/manifests/<folder_name>.tsv`,
+maps relative paths to md5, so that an assembly already in the store is linked instead of downloaded.
+Identical files of different assemblies (e.g. paired GenBank / RefSeq assemblies) share the same object.
+
+Objects are published with a hard link that fails if the object already exists, never replaced:
+concurrent additions of the same content (threads of `add_assemblies_to_store`, or several processes
+sharing the store) keep the first object and link the other files to it.
+Linked files share the inode, size and modification time of their object (see md5 cache keys in `checksums.py`).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import errno
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import Callable, Dict, List, Optional, Tuple
+import uuid
+
+from src.ncbi_util.checksums import (
+    MD5_CHECKSUMS_FILE_NAME, 
+    compute_md5, 
+    get_md5_cache_key, 
+    parse_md5_checksums,
+)
+
+
+logger = logging.getLogger()
+
+STORE_OBJECTS_FOLDER = 'objects'
+STORE_MANIFESTS_FOLDER = 'manifests'
+
+
+def get_object_path(store_folder : Path, md5 : str) -> Path:
+    return store_folder / STORE_OBJECTS_FOLDER / md5[:2] / md5
+
+
+def get_manifest_path(store_folder : Path, folder_name : str) -> Path:
+    return store_folder / STORE_MANIFESTS_FOLDER / f'{folder_name}.tsv'
+
+
+def read_manifest(store_folder : Path, folder_name : str) -> Dict[str, str]:
+    """
+    Return a dict mapping relative path to md5 of the files of assembly `folder_name` in the store.
+    """
+    path = get_manifest_path(store_folder, folder_name)
+    if not path.is_file():
+        return {}
+
+    with path.open(newline='') as f:
+        return {row[0]: row[1] for row in csv.reader(f, delimiter='\t') if len(row) == 2}
+
+
+def write_manifest(store_folder : Path, folder_name : str, manifest : Dict[str, str]) -> None:
+    path = get_manifest_path(store_folder, folder_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    with temp_path.open('w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        for relative_path, md5 in sorted(manifest.items()):
+            writer.writerow([relative_path, md5])
+
+    os.replace(temp_path, path)
+
+
+def link_or_copy(source : Path, destination : Path) -> None:
+    """
+    Hard link `source` to `destination`, replacing it if it exists.
+    Fall back to a copy if source and destination are on different file systems.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = destination.with_name(f'.{destination.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        os.link(source, temp_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(source, temp_path)
+
+    os.replace(temp_path, destination)
+
+
+def add_object(path : Path, object_path : Path) -> bool:
+    """
+    Add file `path` to the store as `object_path`.
+    Return False if the object already exists, e.g. added meanwhile by another thread or process.
+    """
+    object_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(path, object_path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+
+    # Copy to a temporary file of the store, then publish it with a link as above
+    temp_path = object_path.with_name(f'.{object_path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        shutil.copy2(path, temp_path)
+        os.link(temp_path, object_path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def link_assembly_from_store(
+    store_folder : Path,
+    folder : Path,
+    is_expected : Optional[Callable[[str, str], bool]] = None,
+) -> bool:
+    """
+    Link files of assembly `folder` from the store if all expected files are available.
+    Expected files are those listed in the stored `md5checksums.txt`, filtered by `is_expected`
+    (predicate `(folder_name, relative_path) -> bool`). README.txt is never expected.
+    Return True if the assembly was linked.
+    """
+    manifest = read_manifest(store_folder, folder.name)
+    if MD5_CHECKSUMS_FILE_NAME not in manifest:
+        return False
+
+    checksums = parse_md5_checksums(get_object_path(store_folder, manifest[MD5_CHECKSUMS_FILE_NAME]))
+    relative_paths = [MD5_CHECKSUMS_FILE_NAME] + [
+        p for p in checksums.keys()
+        if p != 'README.txt' and (is_expected is None or is_expected(folder.name, p))
+    ]
+    if any(
+        manifest.get(p) is None or not get_object_path(store_folder, manifest[p]).is_file()
+        for p in relative_paths
+    ):
+        return False
+
+    for relative_path in relative_paths:
+        link_or_copy(get_object_path(store_folder, manifest[relative_path]), folder / relative_path)
+
+    return True
+
+
+def add_assembly_to_store(
+    store_folder : Path,
+    folder : Path,
+    md5_cache : Optional[Dict[Tuple[str, int, int, int], str]] = None,
+) -> Tuple[int, int]:
+    """
+    Add files of assembly `folder` to the store and replace them with links to the stored objects.
+    Files not matching their md5 in `md5checksums.txt` are left out.
+    Return the number of files added and the number of files deduplicated against existing objects.
+    """
+    checksums_path = folder / MD5_CHECKSUMS_FILE_NAME
+    if not checksums_path.is_file():
+        return 0, 0
+
+    expected_md5s = parse_md5_checksums(checksums_path)
+    expected_md5s[MD5_CHECKSUMS_FILE_NAME] = None
+
+    manifest = read_manifest(store_folder, folder.name)
+    n_added, n_deduplicated = 0, 0
+    for relative_path, expected_md5 in expected_md5s.items():
+        path = folder / relative_path
+        if relative_path == 'README.txt' or not path.is_file():
+            continue
+
+        md5 = get_md5(path, md5_cache)
+        if expected_md5 is not None and md5 != expected_md5:
+            logger.warning(f'Checksum mismatch, not adding to store: {path}')
+            continue
+
+        object_path = get_object_path(store_folder, md5)
+        if not object_path.is_file() and add_object(path, object_path):
+            n_added += 1
+        elif not os.path.samefile(path, object_path):
+            link_or_copy(object_path, path)
+            n_deduplicated += 1
+
+            # The file is now the stored object: cache its md5 under the new key
+            if md5_cache is not None:
+                md5_cache[get_md5_cache_key(path, path.stat())] = md5
+
+        manifest[relative_path] = md5
+
+    write_manifest(store_folder, folder.name, manifest)
+    return n_added, n_deduplicated
+
+
+def add_assemblies_to_store(
+    store_folder : Path,
+    folders : List[Path],
+    md5_cache : Optional[Dict[Tuple[str, int, int, int], str]] = None,
+    n_threads : int = 8,
+) -> None:
+    if md5_cache is None:
+        md5_cache = {}
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        counts = list(executor.map(lambda folder: add_assembly_to_store(store_folder, folder, md5_cache), folders))
+
+    n_added = sum(c[0] for c in counts)
+    n_deduplicated = sum(c[1] for c in counts)
+    logger.info(f'Store: {n_added:,} files added, {n_deduplicated:,} duplicate files linked to existing objects')
+
+
+def get_md5(path : Path, md5_cache : Optional[Dict[Tuple[str, int, int, int], str]]) -> str:
+    key = get_md5_cache_key(path, path.stat())
+    if md5_cache is not None and key in md5_cache:
+        return md5_cache[key]
+
+    md5 = compute_md5(path)
+    if md5_cache is not None:
+        md5_cache[key] = md5
+    return md5
@@ -0,0 +1,159 @@
+"""
+Benchmark parsing of hmmsearch domain tables (--domtblout):
+native parser of `search_hmm.py` vs Biopython's `Hmmer3DomtabHmmqueryParser`.
+
+Run on an existing domain table with `-i`, or on a synthetic table of `--n_rows` domain hits.
+Both parsers must produce the same dataframe.
+"""
+import argparse
+import logging
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from Bio.SearchIO.HmmerIO.hmmer3_domtab import Hmmer3DomtabHmmqueryParser
+
+from src.postprocessing.search_hmm import get_domain_file_columns_dict, parse_hmmer_output
+
+
+logger = logging.getLogger()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s (%(levelname)s) %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark parsing of hmmsearch domain tables',
+    )
+    parser.add_argument(
+        '-i', '--domtblout_path',
+        help='Path to domain table created with hmmsearch --domtblout (default: synthetic table)',
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '--n_rows',
+        help='Number of domain hits of the synthetic table',
+        type=int,
+        default=1_000_000,
+    )
+    parser.add_argument('--n_repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=444)
+    args = parser.parse_args()
+
+    domtblout_path = args.domtblout_path
+    n_rows = args.n_rows
+    n_repeats = args.n_repeats
+
+    if domtblout_path is not None and not domtblout_path.is_file():
+        logger.error(f'Domain table not found: {domtblout_path}')
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if domtblout_path is None:
+            random.seed(args.seed)
+            domtblout_path = Path(tmp_dir) / 'synthetic.domtblout'
+            logger.info(f'Writing synthetic domain table with {n_rows:,} rows')
+            write_synthetic_domtblout(domtblout_path, n_rows)
+
+        logger.info(f'Domain table: {domtblout_path} ({domtblout_path.stat().st_size / 1e6:,.1f} MB)')
+
+        native_seconds, native_df = time_parser(parse_hmmer_output, domtblout_path, n_repeats)
+        logger.info(f'Native parser: {native_seconds:.2f} seconds ({len(native_df):,} rows)')
+
+        biopython_seconds, biopython_df = time_parser(parse_hmmer_output_biopython, domtblout_path, n_repeats)
+        logger.info(f'Biopython parser: {biopython_seconds:.2f} seconds ({len(biopython_df):,} rows)')
+
+    pd.testing.assert_frame_equal(
+        native_df.reset_index(drop=True),
+        biopython_df.reset_index(drop=True).astype(native_df.dtypes.to_dict()),
+        check_exact=True,
+    )
+    logger.info(f'Outputs are identical. Speedup: {biopython_seconds / native_seconds:.1f}x')
+
+
+def time_parser(parse_fn, domtblout_path : Path, n_repeats : int):
+    """
+    Return the best time over `n_repeats` runs and the parsed dataframe.
+    """
+    best_seconds, df = None, None
+    for _ in range(n_repeats):
+        t0 = time.perf_counter()
+        with domtblout_path.open() as f:
+            df = parse_fn(f)
+        seconds = time.perf_counter() - t0
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+
+    return best_seconds, df
+
+
+def parse_hmmer_output_biopython(domtblout_file) -> pd.DataFrame:
+    """
+    Former parser of `search_hmm.py`, kept as reference.
+    """
+    output_data = get_domain_file_columns_dict()
+    parser = Hmmer3DomtabHmmqueryParser(domtblout_file)
+
+    for record in parser:
+        hmm_accession = record.accession
+        for protein_id, hit in record.items:
+            hmm_query = hit.query_id
+            for hit_instance in hit:
+                accession = hmm_accession
+                if accession == '-' or accession is None:
+                    accession = hmm_query
+
+                output_data['protein_id'].append(protein_id)
+                output_data['hmm_accession'].append(accession)
+                output_data['hmm_query'].append(hmm_query)
+                output_data['evalue'].append(hit_instance.evalue)
+                output_data['bitscore'].append(hit_instance.bitscore)
+                output_data['accuracy'].append(hit_instance.acc_avg)
+                output_data['start'].append(hit_instance.env_start)
+                output_data['end'].append(hit_instance.env_end)
+
+    return pd.DataFrame.from_dict(output_data)
+
+
+def write_synthetic_domtblout(path : Path, n_rows : int, n_profiles : int = 1000) -> None:
+    """
+    Domain table in hmmsearch format: rows grouped by profile, then by target sequence.
+    One profile in ten has no accession.
+    """
+    rows_per_profile = max(1, n_rows // n_profiles)
+    with path.open('w') as f:
+        f.write('# target name  accession  tlen query name  accession  qlen ...\n')
+        n_written, profile_ix = 0, 0
+        while n_written < n_rows:
+            query = f'PF{profile_ix:05d}_dom'
+            query_accession = '-' if profile_ix % 10 == 0 else f'PF{profile_ix:05d}.{random.randint(1, 20)}'
+            qlen = random.randint(30, 500)
+            n_profile_rows = min(rows_per_profile, n_rows - n_written)
+            while n_profile_rows > 0:
+                target = f'WP_{random.randint(0, 999_999_999):09d}.1'
+                tlen = random.randint(qlen, 2000)
+                n_domains = min(n_profile_rows, random.randint(1, 3))
+                for domain_ix in range(n_domains):
+                    env_from = random.randint(1, tlen - 10)
+                    env_to = random.randint(env_from + 5, tlen)
+                    f.write(' '.join([
+                        target, '-', str(tlen), query, query_accession, str(qlen),
+                        f'{random.random() * 1e-5:.2g}', f'{random.uniform(20, 500):.1f}', f'{random.uniform(0, 5):.1f}',
+                        str(domain_ix + 1), str(n_domains),
+                        f'{random.random() * 1e-5:.2g}', f'{random.random() * 1e-3:.2g}',
+                        f'{random.uniform(20, 500):.1f}', f'{random.uniform(0, 5):.1f}',
+                        '1', str(qlen), str(env_from + 1), str(env_to - 1), str(env_from), str(env_to),
+                        f'{random.uniform(0.5, 1):.2f}', 'hypothetical protein [Some organism]',
+                    ]) + '\n')
+                n_profile_rows -= n_domains
+                n_written += n_domains
+            profile_ix += 1
+
+        f.write('#\n# Program:         hmmsearch\n# [ok]\n')
+
+
+if __name__ == '__main__':
+    main()
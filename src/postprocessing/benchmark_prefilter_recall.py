@@ -0,0 +1,169 @@
+"""
+Benchmark the two-stage search of `search_hmm.py --prefilter_db` against the exhaustive search.
+
+Each proteome of the benchmark set is searched exhaustively with gathering thresholds, then with
+the MMseqs2 prefilter at each sensitivity of `--mmseqs2_sensitivity`. Recall is the fraction of
+domain hits of the exhaustive search also found by the two-stage search; speedup is the ratio of
+search times. Requires hmmer (hmmsearch or pyhmmer) and mmseqs.
+"""
+import argparse
+import logging
+from pathlib import Path
+import sys
+import time
+
+import pandas as pd
+
+from src.postprocessing.search_hmm import (
+    PREFILTER_SENSITIVITY,
+    SearchError,
+    count_recalled_hits,
+    load_assembly_subset,
+    load_pyhmmer_profiles,
+    search_exhaustive,
+    search_prefiltered,
+)
+from src.utils import get_accession_from_path_name
+
+
+logger = logging.getLogger()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s (%(levelname)s) %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Measure recall and speedup of the prefiltered search against the exhaustive search',
+    )
+    parser.add_argument(
+        '-i', '--base_folder',
+        help='Path to base folder containing the genome assemblies of the benchmark set',
+        type=Path,
+        default=Path('test_data'),
+    )
+    parser.add_argument(
+        '-l', '--assembly_subset',
+        help='Path to text file containing one assembly folder name per line (default: all assemblies)',
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        '-d', '--hmm_db',
+        help='Path to HMM database, with gathering thresholds',
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        '--prefilter_db',
+        help='Path to MMseqs2 profile database built from the same profiles as --hmm_db',
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        '--mmseqs2_sensitivity',
+        help='Prefilter sensitivities to benchmark',
+        type=float,
+        nargs='+',
+        default=[PREFILTER_SENSITIVITY],
+    )
+    parser.add_argument('--hmmer_engine', choices=['hmmsearch', 'pyhmmer'], default='hmmsearch')
+    parser.add_argument(
+        '-o', '--output_path',
+        help='Path to CSV report with recall and search times of each assembly and sensitivity',
+        type=Path,
+        default=None,
+    )
+    parser.add_argument('--n_threads', type=int, default=2)
+    args = parser.parse_args()
+
+    genomes_folder = args.base_folder / 'genomes'
+    hmm_db = args.hmm_db
+    prefilter_db = args.prefilter_db
+
+    if not genomes_folder.is_dir():
+        logger.error(f'Genomes folder does not exist: {genomes_folder}')
+        sys.exit(1)
+    elif not hmm_db.is_file():
+        logger.error(f'HMM database does not exist: {hmm_db}')
+        sys.exit(1)
+    elif not prefilter_db.exists():
+        logger.error(f'Prefilter database does not exist: {prefilter_db}')
+        sys.exit(1)
+    elif args.assembly_subset is not None and not args.assembly_subset.is_file():
+        logger.error(f'Assembly subset file does not exist: {args.assembly_subset}')
+        sys.exit(1)
+
+    profiles = None
+    if args.hmmer_engine == 'pyhmmer':
+        try:
+            profiles = load_pyhmmer_profiles(hmm_db)
+        except ImportError:
+            logger.error('--hmmer_engine pyhmmer requires package pyhmmer (e.g. `pip install pyhmmer`)')
+            sys.exit(1)
+
+    assembly_subset = load_assembly_subset(args.assembly_subset)
+    protein_paths = sorted(
+        p / f'{p.name}_protein.faa.gz' for p in genomes_folder.iterdir()
+        if (
+            p.is_dir() and
+            (p / f'{p.name}_protein.faa.gz').is_file() and
+            (assembly_subset is None or get_accession_from_path_name(p) in assembly_subset)
+        )
+    )
+    if len(protein_paths) == 0:
+        logger.error(f'No proteome found in {genomes_folder}')
+        sys.exit(1)
+
+    logger.info(f'Benchmark set: {len(protein_paths):,} proteomes')
+
+    report = []
+    for protein_path_gz in protein_paths:
+        try:
+            start = time.monotonic()
+            exhaustive_df = search_exhaustive(hmm_db, protein_path_gz, profiles, args.n_threads)
+            exhaustive_seconds = time.monotonic() - start
+
+            for sensitivity in args.mmseqs2_sensitivity:
+                start = time.monotonic()
+                df = search_prefiltered(hmm_db, prefilter_db, protein_path_gz, profiles, sensitivity, args.n_threads)
+                prefiltered_seconds = time.monotonic() - start
+
+                n_found, n_expected = count_recalled_hits(df, exhaustive_df)
+                report.append({
+                    'assembly': protein_path_gz.parent.name,
+                    'sensitivity': sensitivity,
+                    'n_found': n_found,
+                    'n_expected': n_expected,
+                    'exhaustive_seconds': exhaustive_seconds,
+                    'prefiltered_seconds': prefiltered_seconds,
+                })
+                logger.info((
+                    f'{protein_path_gz.parent.name} (sensitivity {sensitivity}): '
+                    f'{n_found:,} / {n_expected:,} domain hits, '
+                    f'{exhaustive_seconds:.1f}s exhaustive vs {prefiltered_seconds:.1f}s prefiltered'
+                ))
+        except (SearchError, OSError, EOFError, ValueError) as e:
+            logger.error(f'Error while searching {protein_path_gz}: {e}')
+            continue
+
+    if len(report) == 0:
+        logger.error('No proteome could be searched')
+        sys.exit(1)
+
+    report_df = pd.DataFrame(report)
+    if args.output_path is not None:
+        report_df.to_csv(args.output_path, index=False)
+        logger.info(f'Report saved to {args.output_path}')
+
+    for sensitivity, df in report_df.groupby('sensitivity'):
+        n_found, n_expected = df['n_found'].sum(), df['n_expected'].sum()
+        recall = n_found / n_expected if n_expected > 0 else float('nan')
+        logger.info((
+            f'Sensitivity {sensitivity}: recall {n_found:,} / {n_expected:,} domain hits ({recall:.2%}) '
+            f'over {len(df):,} proteomes, '
+            f'speedup {df["exhaustive_seconds"].sum() / df["prefiltered_seconds"].sum():.1f}x'
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Check that the two-stage search of `search_hmm.py --prefilter_db` gives the same hits
+with both hmmer engines (`hmmsearch` subprocess and in-process pyhmmer).
+
+Each proteome of the base folder (default: test_data) is searched with both engines;
+outputs must be identical. Requires hmmsearch, mmseqs and pyhmmer.
+"""
+import argparse
+import logging
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+from src.postprocessing.search_hmm import (
+    PREFILTER_SENSITIVITY,
+    load_pyhmmer_profiles,
+    search_prefiltered,
+)
+
+
+logger = logging.getLogger()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s (%(levelname)s) %(message)s')
+
+    parser = argparse.ArgumentParser(
+        description='Check that prefiltered searches give the same hits with hmmsearch and pyhmmer',
+    )
+    parser.add_argument(
+        '-i', '--base_folder',
+        help='Path to base folder containing genome assemblies',
+        type=Path,
+        default=Path('test_data'),
+    )
+    parser.add_argument(
+        '-d', '--hmm_db',
+        help='Path to HMM database, with gathering thresholds',
+        type=Path,
+        required=True,
+    )
+    parser.add_argument(
+        '--prefilter_db',
+        help='Path to MMseqs2 profile database built from the same profiles as --hmm_db',
+        type=Path,
+        required=True,
+    )
+    parser.add_argument('--mmseqs2_sensitivity', type=float, default=PREFILTER_SENSITIVITY)
+    parser.add_argument('--n_threads', type=int, default=2)
+    args = parser.parse_args()
+
+    genomes_folder = args.base_folder / 'genomes'
+    hmm_db = args.hmm_db
+    prefilter_db = args.prefilter_db
+
+    if not genomes_folder.is_dir():
+        logger.error(f'Genomes folder does not exist: {genomes_folder}')
+        sys.exit(1)
+    elif not hmm_db.is_file():
+        logger.error(f'HMM database does not exist: {hmm_db}')
+        sys.exit(1)
+    elif not prefilter_db.exists():
+        logger.error(f'Prefilter database does not exist: {prefilter_db}')
+        sys.exit(1)
+
+    try:
+        profiles = load_pyhmmer_profiles(hmm_db)
+    except ImportError:
+        logger.error('Package pyhmmer is required (e.g. `pip install pyhmmer`)')
+        sys.exit(1)
+
+    protein_paths = sorted(
+        p / f'{p.name}_protein.faa.gz' for p in genomes_folder.iterdir()
+        if p.is_dir() and (p / f'{p.name}_protein.faa.gz').is_file()
+    )
+    if len(protein_paths) == 0:
+        logger.error(f'No proteome found in {genomes_folder}')
+        sys.exit(1)
+
+    n_mismatches = 0
+    for protein_path_gz in protein_paths:
+        hmmsearch_df, pyhmmer_df = [
+            search_prefiltered(
+                hmm_db,
+                prefilter_db,
+                protein_path_gz,
+                engine_profiles,
+                args.mmseqs2_sensitivity,
+                args.n_threads,
+            ).reset_index(drop=True)
+            for engine_profiles in (None, profiles)
+        ]
+
+        try:
+            pd.testing.assert_frame_equal(hmmsearch_df, pyhmmer_df, check_dtype=False, check_exact=True)
+            logger.info(f'{protein_path_gz.name}: {len(hmmsearch_df):,} domain hits, identical')
+        except AssertionError as e:
+            n_mismatches += 1
+            logger.error((
+                f'{protein_path_gz.name}: {len(hmmsearch_df):,} (hmmsearch) vs '
+                f'{len(pyhmmer_df):,} (pyhmmer) domain hits, outputs differ: {e}'
+            ))
+
+    if n_mismatches > 0:
+        logger.error(f'Outputs differ for {n_mismatches:,} / {len(protein_paths):,} proteomes')
+        sys.exit(1)
+
+    logger.info(f'Outputs are identical for {len(protein_paths):,} proteomes')
+
+
+if __name__ == '__main__':
+    main()
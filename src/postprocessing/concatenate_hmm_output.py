@@ -1,5 +1,5 @@
 """
-Concatenate CSV files recapitulating Pfam or TIGR hits in each genome.
+Concatenate files recapitulating Pfam or TIGR hits in each genome (CSV or Parquet, see `hmm_output.py`).
 """
 import argparse
 import logging
@@ -15,6 +15,7 @@ from typing import List
 import numpy as np
 import pandas as pd
 
+from src.postprocessing.hmm_output import find_output_path, get_output_path, read_hmm_output
 from src.utils import get_accession_from_path_name, get_n_cpus, escape_species_name
 
 
@@ -191,36 +192,25 @@ def worker_main(
         species_name = metadata_df.loc[assembly_accession, 'gtdb_species']
         species_name_escaped = escape_species_name(species_name)
 
-        hmm_output_path_gz = path / f'{path.name}_{suffix}.csv.gz'
-        if not hmm_output_path_gz.is_file():
-            logger.error(f'File not found: {hmm_output_path_gz}')
+        # CSV or Parquet output of search_hmm.py
+        hmm_output_path = find_output_path(path, suffix)
+        if hmm_output_path is None:
+            logger.error(f'File not found: {get_output_path(path, suffix)}')
             continue
 
-        # Decompress protein fasta file
-        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as hmm_output_file:
-            hmm_output_path = Path(hmm_output_file.name).resolve()
-
-            returncode = subprocess.call(
-                ['gzip', '-cd', hmm_output_path_gz.resolve().as_posix()],
-                stdout=hmm_output_file,
-            )
-            if returncode != 0:
-                logger.error(f'Error while decompressing {hmm_output_path_gz}')
-                continue
-
         try:
-            df = pd.read_csv(hmm_output_path)
-            columns = df.columns.tolist()
-            accession_and_species = f'{assembly_accession}${species_name_escaped}'
-            df['id'] = df['protein_id'].apply(lambda protein_id: f'{protein_id}@{accession_and_species}')
-            df['assembly_accession'] = assembly_accession
-            columns = ['id', 'assembly_accession'] + columns
-            df[columns].to_csv(output_path, index=False, header=include_header, mode='a')
-            include_header = False
-
-        finally:
-            if hmm_output_path.is_file():
-                hmm_output_path.unlink()
+            df = read_hmm_output(hmm_output_path)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f'Error while reading {hmm_output_path}: {e}')
+            continue
+
+        columns = df.columns.tolist()
+        accession_and_species = f'{assembly_accession}${species_name_escaped}'
+        df['id'] = df['protein_id'].apply(lambda protein_id: f'{protein_id}@{accession_and_species}')
+        df['assembly_accession'] = assembly_accession
+        columns = ['id', 'assembly_accession'] + columns
+        df[columns].to_csv(output_path, index=False, header=include_header, mode='a')
+        include_header = False
 
     queue.put((worker_ix, output_path))
     logger.info(f'Worker {worker_ix+1} is done')
@@ -25,6 +25,7 @@ from typing import Dict, List, Union
 import numpy as np
 import pandas as pd
 
+from src.postprocessing.hmm_output import find_output_path, get_output_path, read_hmm_output
 from src.utils import get_accession_from_path_name
 
 
@@ -209,13 +210,15 @@ def worker_main(
 
         assembly_accession, _ = extract_metadata_from_path_name(path.name)
 
+        # CSV or Parquet output of search_hmm.py
+        domains_path = find_output_path(path, hmm_db_name)
+        if domains_path is None:
+            logger.error(f'File not found: {get_output_path(path, hmm_db_name)}')
+            continue
+
         data['assembly_accession'].append(assembly_accession)
 
-        domains_path = path / f'{path.name}_{hmm_db_name}.csv.gz'
-        domains_df = pd.read_csv(
-            domains_path, 
-            usecols=['hmm_query', 'protein_id'], 
-        )
+        domains_df = read_hmm_output(domains_path, columns=['hmm_query', 'protein_id'])
 
         # Keep one domain hit per protein
         domains_df = domains_df.drop_duplicates(['protein_id', 'hmm_query']).set_index('hmm_query')
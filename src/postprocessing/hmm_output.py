@@ -0,0 +1,70 @@
+"""
+Per-genome output files of `search_hmm.py`: domain hits of one assembly against one profile database.
+
+Two formats:
+- csv: gzipped CSV, `<assembly>_<db>.csv.gz` (default)
+- parquet: `<assembly>_<db>.parquet`, zstd-compressed, with dictionary-encoded
+  `hmm_accession` and `hmm_query` columns (few distinct values repeated over many hits)
+
+Readers (`concatenate_hmm_output.py`, `count_domains.py`) accept either format.
+Files are written atomically, so that a partial file is never mistaken for a finished one.
+"""
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+
+OUTPUT_FORMAT_SUFFIXES = {
+    'csv': '.csv.gz',
+    'parquet': '.parquet',
+}
+
+DICTIONARY_COLUMNS = ['hmm_accession', 'hmm_query']
+
+
+def get_output_path(path : Path, hmm_db_name : str, output_format : str = 'csv') -> Path:
+    """
+    Output file of the assembly in folder `path` against database `hmm_db_name`.
+    """
+    return path / f'{path.name}_{hmm_db_name}{OUTPUT_FORMAT_SUFFIXES[output_format]}'
+
+
+def find_output_path(path : Path, hmm_db_name : str) -> Optional[Path]:
+    """
+    Existing output file of the assembly in folder `path` against database `hmm_db_name`, in any format,
+    or None.
+    """
+    for output_format in OUTPUT_FORMAT_SUFFIXES.keys():
+        output_path = get_output_path(path, hmm_db_name, output_format)
+        if output_path.is_file():
+            return output_path
+
+    return None
+
+
+def write_hmm_output(df : pd.DataFrame, output_path : Path) -> None:
+    """
+    Write domain hits to `output_path`, in the format given by its suffix.
+    """
+    temp_path = output_path.with_name(f'.{output_path.name}.tmp')
+    if output_path.name.endswith(OUTPUT_FORMAT_SUFFIXES['parquet']):
+        df = df.astype({c: 'category' for c in DICTIONARY_COLUMNS if c in df.columns})
+        df.to_parquet(temp_path, index=False, compression='zstd')
+    else:
+        df.to_csv(temp_path, index=False, compression='gzip')
+
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, output_path)
+
+
+def read_hmm_output(output_path : Path, columns : Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read domain hits from an output file in either format, optionally restricted to `columns`.
+    Floats of CSV files are parsed exactly, so that both formats give the same values.
+    """
+    if output_path.name.endswith(OUTPUT_FORMAT_SUFFIXES['parquet']):
+        return pd.read_parquet(output_path, columns=columns)
+    else:
+        return pd.read_csv(output_path, usecols=columns, float_precision='round_trip')
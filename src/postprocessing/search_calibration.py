@@ -0,0 +1,101 @@
+"""
+Persisted process x thread configurations of `search_hmm.py`, as measured with `--calibrate`.
+
+The best split between processes and threads per process depends on the machine, the profile database
+and the search mode, so calibrations are stored per (host, database, mode) in a JSON file in the user cache
+folder (`$XDG_CACHE_HOME/assembly/search_hmm_calibration.json`, defaults to `~/.cache/assembly/`).
+"""
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import time
+from typing import List, Optional, Tuple
+import uuid
+
+
+logger = logging.getLogger()
+
+CALIBRATION_FILE_NAME = 'search_hmm_calibration.json'
+
+
+def get_calibration_path() -> Path:
+    cache_folder = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache')
+    return cache_folder / 'assembly' / CALIBRATION_FILE_NAME
+
+
+def get_calibration_key(hmm_dbs : List[Path], mode : str) -> str:
+    """
+    Key of a calibration: host name, file names and sizes of the databases searched together 
+    (sizes change with database releases), search mode.
+    """
+    db_names = '+'.join(hmm_db.name for hmm_db in hmm_dbs)
+    db_sizes = '+'.join(str(hmm_db.stat().st_size) for hmm_db in hmm_dbs)
+    return f'{socket.gethostname()}|{db_names}|{db_sizes}|{mode}'
+
+
+def get_n_cores() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_candidate_configs(n_cores : int, max_processes : int) -> List[Tuple[int, int]]:
+    """
+    Return `(n_processes, n_threads_per_process)` splits using all cores,
+    with threads per process powers of 2 and at most `max_processes` processes.
+    """
+    configs = []
+    n_threads = 1
+    while n_threads <= n_cores:
+        n_processes = n_cores // n_threads
+        if n_processes <= max_processes:
+            configs.append((n_processes, n_threads))
+        n_threads *= 2
+
+    if len(configs) == 0:
+        configs.append((max_processes, max(1, n_cores // max_processes)))
+
+    return configs
+
+
+def load_calibration(key : str) -> Optional[dict]:
+    """
+    Return the calibration stored for `key` (keys: n_processes, n_threads_per_process, genomes_per_hour),
+    or None.
+    """
+    path = get_calibration_path()
+    if not path.is_file():
+        return None
+
+    try:
+        with path.open() as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError) as e:
+        logger.warning(f'Could not read calibration file {path}: {e}')
+        return None
+
+
+def save_calibration(key : str, n_processes : int, n_threads_per_process : int, genomes_per_hour : float) -> None:
+    path = get_calibration_path()
+    calibrations = {}
+    if path.is_file():
+        try:
+            with path.open() as f:
+                calibrations = json.load(f)
+        except (OSError, ValueError):
+            calibrations = {}
+
+    calibrations[key] = {
+        'n_processes': n_processes,
+        'n_threads_per_process': n_threads_per_process,
+        'genomes_per_hour': round(genomes_per_hour, 1),
+        'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    with temp_path.open('w') as f:
+        json.dump(calibrations, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
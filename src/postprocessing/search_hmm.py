@@ -3,27 +3,90 @@ Use [HMMER](http://hmmer.org/) or [MMseqs2](https://github.com/soedinglab/mmseqs
 against a database of protein domain profiles (Pfam, TIGRfam, KOfam, etc).
 """
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import gzip
+import io
 import logging
 import os
 import subprocess
 import sys
-from multiprocessing import Process
+from multiprocessing import Pool, Process
 from pathlib import Path
 import random
+import re
 import shutil
 import tempfile
-from typing import List
+import time
+from typing import BinaryIO, Callable, Iterator, List, TextIO, Tuple
+import zlib
 
 import numpy as np
 import pandas as pd
-from Bio.SearchIO.HmmerIO.hmmer3_domtab import Hmmer3DomtabHmmqueryParser
 
+from src.postprocessing.hmm_output import (
+    OUTPUT_FORMAT_SUFFIXES,
+    find_output_path,
+    get_output_path,
+    write_hmm_output,
+)
+from src.postprocessing.search_calibration import (
+    get_calibration_key,
+    get_candidate_configs,
+    get_n_cores,
+    load_calibration,
+    save_calibration,
+)
+from src.postprocessing.sequence_index import (
+    open_sequence_index,
+    parse_fasta,
+    read_proteome,
+    add_proteome,
+    record_hits,
+    create_search_indices,
+    get_genomes,
+    get_genome_hits,
+)
 from src.utils import get_accession_from_path_name
 
 
 logger = logging.getLogger()
 
 
+class SearchError(Exception):
+    pass
+
+
+# 0-based columns of hmmsearch --domtblout tables. 
+# Fields before the target description (column 22) never contain spaces.
+DOMTBLOUT_COLUMNS = {
+    'protein_id': 0,
+    'hmm_query': 3,
+    'hmm_accession': 4,
+    'evalue': 12,  # independent E-value of the domain
+    'bitscore': 13,
+    'env_start': 19,
+    'env_end': 20,
+    'accuracy': 21,
+}
+DOMTBLOUT_N_FIELDS = 22
+
+# Default size of the chunks of unique sequences searched in --dedup mode
+DEDUP_CHUNK_RESIDUES = 50_000_000
+
+# Prefilter (--prefilter_db) defaults: MMseqs2 sensitivity, and a loose E-value threshold 
+# so that candidates include weak hits that pass gathering thresholds.
+PREFILTER_SENSITIVITY = 7.5
+PREFILTER_E_VALUE = 10.
+
+# Defaults when neither given nor calibrated
+DEFAULT_N_PROCESSES = 2
+DEFAULT_N_THREADS_PER_PROCESS = 2
+
+# Separator between genome index and protein id in batched searches, e.g. `12@WP_012345678.1`
+GENOME_TAG_SEPARATOR = '@'
+
+
 def main():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
 
@@ -32,7 +95,9 @@ def main():
             'Use [HMMER](http://hmmer.org/) or [MMseqs2](https://github.com/soedinglab/mmseqs2) to search '
             'protein sequences against a database of protein domain profiles (e.g Pfam, TIGRfam, KOfam, etc). '
             'To search using hmmer, specify either --hmmer_e_value or --cut_ga. '
-            'To search using MMseqs2, specify --mmseqs2_sensitivity.'
+            'Hmmer runs as `hmmsearch` subprocesses, or in-process with pyhmmer (--hmmer_engine pyhmmer). '
+            'To search using MMseqs2, specify --mmseqs2_sensitivity. '
+            'Several profile databases can be searched in a single pass over the proteomes.'
         ),
     )
     parser.add_argument(
@@ -43,8 +108,13 @@ def main():
     )
     parser.add_argument(
         '-d', '--hmm_db', 
-        help='Path to profile database', 
+        help=(
+            'Path to profile database(s). With several databases (e.g. Pfam-A, TIGRfam and eggNOG), '
+            'each proteome is decompressed once and searched against all of them, '
+            'with one output file per database'
+        ), 
         type=Path,
+        nargs='+',
         required=True,
     )
     parser.add_argument(
@@ -58,6 +128,17 @@ def main():
         action='store_true',
         help='Use the GA (gathering) bit scores thresholds instead of E-value (hmmer)', 
     )
+    parser.add_argument(
+        '--hmmer_engine', 
+        choices=['hmmsearch', 'pyhmmer'],
+        default='hmmsearch',
+        help=(
+            'hmmsearch: run the `hmmsearch` binary on each genome. '
+            'pyhmmer: load profiles once per process and search genomes in-process with '
+            '[pyhmmer](https://github.com/althonos/pyhmmer), which must be installed. '
+            'Both produce identical outputs.'
+        ), 
+    )
     parser.add_argument(
         '--mmseqs2_sensitivity', 
         type=float,
@@ -70,17 +151,137 @@ def main():
         type=str,
         required=False,
     )
-    parser.add_argument('--n_processes', type=int, default=2)
-    parser.add_argument('--n_threads_per_process', type=int, default=2)
+    parser.add_argument(
+        '--hmmer_batch_residues', 
+        type=int,
+        default=None,
+        help=(
+            'Search several proteomes per hmmsearch run, up to this total number of residues '
+            '(e.g. 50000000), to amortize profile loading over small proteomes. '
+            'Output files are split per genome, with E-values scaled to the size of each proteome '
+            '(scaled from the 2 significant digits of hmmsearch\'s output: they may differ from a per-genome '
+            'search in the last digit; hits, scores and coordinates are identical). '
+            f'With --dedup, number of residues of the chunks of unique sequences (default: {DEDUP_CHUNK_RESIDUES:,}). '
+            'Requires --hmmer_cut_ga.'
+        ), 
+    )
+    parser.add_argument(
+        '--mmseqs2_batch_residues', 
+        type=int,
+        default=None,
+        help=(
+            'Search several proteomes per `mmseqs easy-search` run, up to this total number of residues '
+            '(e.g. 50000000), then split hits per genome. MMseqs2 E-values only depend on the profile database, '
+            'so outputs are the same as when searching genomes one by one.'
+        ), 
+    )
+    parser.add_argument(
+        '--dedup', 
+        action='store_true',
+        help=(
+            'Search each distinct protein sequence once across all assemblies, then fan out hits '
+            'to every protein with that sequence (e.g. WP_ proteins shared by many RefSeq genomes). '
+            'Sequences are indexed by hash in a SQLite database in the temporary directory (see TMPDIR). '
+            'Output files are the same as without --dedup, with E-values computed for the size of each proteome '
+            'from full-precision P-values. '
+            'Requires --hmmer_cut_ga and --hmmer_engine pyhmmer.'
+        ), 
+    )
+    parser.add_argument(
+        '--hmmer_profile_shards', 
+        type=int,
+        default=1,
+        help=(
+            'Split the profile database into this number of shards, searched in parallel `hmmsearch` processes '
+            'sharing --n_threads_per_process threads (at most --n_threads_per_process shards run at once), '
+            'for large proteomes where a single hmmsearch scales poorly '
+            'with threads. Shard outputs are merged into the usual per-genome output file.'
+        ), 
+    )
+    parser.add_argument(
+        '--prefilter_db', 
+        type=Path,
+        default=None,
+        help=(
+            'Experimental two-stage search: path to an MMseqs2 profile database built from the same profiles '
+            'as --hmm_db (a single database) '
+            '(profile names matching HMM names or accessions). '
+            'MMseqs2 shortlists candidate (protein, profile) pairs, then hmmer runs on candidates only, '
+            'with E-values computed as for the whole proteome. '
+            'Hits missed by the prefilter are lost: recall against the exhaustive search has not been '
+            'benchmarked yet. Measure it on a benchmark set with '
+            '`python -m src.postprocessing.benchmark_prefilter_recall` before relying on this mode. '
+            f'Prefilter sensitivity is set with --mmseqs2_sensitivity (default: {PREFILTER_SENSITIVITY}). '
+            'Requires --hmmer_cut_ga.'
+        ), 
+    )
+    parser.add_argument(
+        '--prefilter_recall_sample', 
+        type=float,
+        default=0.,
+        help=(
+            'Fraction of assemblies also searched exhaustively with --prefilter_db, '
+            'to log the recall of the two-stage search (e.g. 0.01)'
+        ), 
+    )
+    parser.add_argument(
+        '--output_format', 
+        choices=sorted(OUTPUT_FORMAT_SUFFIXES.keys()),
+        default='csv',
+        help=(
+            'csv: gzipped CSV file per assembly and database (`<assembly>_<db>.csv.gz`). '
+            'parquet: Parquet file (`<assembly>_<db>.parquet`), smaller and faster to read. '
+            'Assemblies with an output file in either format are not searched again.'
+        ), 
+    )
+    parser.add_argument(
+        '--calibrate', 
+        action='store_true',
+        help=(
+            'Search a sample of assemblies (--calibration_sample) with several splits of all cores into '
+            'processes x threads per process, then run with the highest-throughput split. '
+            'The split is saved for this host, database and search mode, and used by later runs '
+            'unless --n_processes or --n_threads_per_process is given. '
+            'Cannot be combined with --n_processes or --n_threads_per_process.'
+        ), 
+    )
+    parser.add_argument(
+        '--calibration_sample', 
+        type=int,
+        default=16,
+        help='Number of assemblies searched with each configuration by --calibrate', 
+    )
+    parser.add_argument(
+        '--n_processes', 
+        type=int, 
+        default=None,
+        help=f'Default: calibrated value (see --calibrate), else {DEFAULT_N_PROCESSES}',
+    )
+    parser.add_argument(
+        '--n_threads_per_process', 
+        type=int, 
+        default=None,
+        help=f'Default: calibrated value (see --calibrate), else {DEFAULT_N_THREADS_PER_PROCESS}',
+    )
     args = parser.parse_args()
 
     base_folder = args.base_folder
-    hmm_db = args.hmm_db
+    hmm_dbs = args.hmm_db
     hmmer_e_value = args.hmmer_e_value
     hmmer_cut_ga = args.hmmer_cut_ga
+    hmmer_engine = args.hmmer_engine
     mmseqs2_sensitivity = args.mmseqs2_sensitivity
     n_processes = args.n_processes
     n_threads_per_process = args.n_threads_per_process
+    hmmer_batch_residues = args.hmmer_batch_residues
+    mmseqs2_batch_residues = args.mmseqs2_batch_residues
+    dedup = args.dedup
+    hmmer_profile_shards = args.hmmer_profile_shards
+    prefilter_db = args.prefilter_db
+    prefilter_recall_sample = args.prefilter_recall_sample
+    output_format = args.output_format
+    calibrate = args.calibrate
+    calibration_sample = args.calibration_sample
     assembly_subset_path = None
     if args.assembly_subset is not None:
         assembly_subset_path = Path(args.assembly_subset)
@@ -94,14 +295,94 @@ def main():
         logger.error(f'Genomes folder does not exist: {genomes_folder}')
         sys.exit(1)
     
-    if not hmm_db.is_file():
-        logger.error(f'HMM database does not exist: {args.hmm_db}')
-        sys.exit(1)
+    for hmm_db in hmm_dbs:
+        if not hmm_db.is_file():
+            logger.error(f'HMM database does not exist: {hmm_db}')
+            sys.exit(1)
 
     if not hmmer_cut_ga and hmmer_e_value is None and mmseqs2_sensitivity is None:
         logger.error(f'Specify one of --hmmer_cut_ga, --hmmer_e_value or --mmseqs2_sensitivity')
         sys.exit(1)
 
+    if hmmer_batch_residues is not None and not hmmer_cut_ga:
+        # Gathering thresholds are bit scores: hits do not depend on the number of sequences searched,
+        # unlike E-value thresholds.
+        logger.error('--hmmer_batch_residues requires --hmmer_cut_ga')
+        sys.exit(1)
+
+    if prefilter_db is not None:
+        if not prefilter_db.exists():
+            logger.error(f'Prefilter database does not exist: {prefilter_db}')
+            sys.exit(1)
+        elif not hmmer_cut_ga:
+            # Candidate sequences are searched with E-values of the whole proteome (-Z), 
+            # but reported domains depend on the number of candidates with E-value thresholds (domZ).
+            logger.error('--prefilter_db requires --hmmer_cut_ga')
+            sys.exit(1)
+        elif dedup or hmmer_batch_residues is not None:
+            logger.error('--prefilter_db cannot be combined with --dedup or --hmmer_batch_residues')
+            sys.exit(1)
+        elif len(hmm_dbs) > 1:
+            logger.error('--prefilter_db applies to a single profile database (--hmm_db)')
+            sys.exit(1)
+
+        logger.warning((
+            'Two-stage search (--prefilter_db) is experimental: its recall against the exhaustive search '
+            'has not been benchmarked (see benchmark_prefilter_recall.py)'
+            + ('' if prefilter_recall_sample > 0 else '. Use --prefilter_recall_sample to measure it in this run')
+        ))
+
+    if hmmer_profile_shards < 1:
+        logger.error('--hmmer_profile_shards must be at least 1')
+        sys.exit(1)
+    elif hmmer_profile_shards > 1 and (
+        hmmer_engine != 'hmmsearch' or 
+        dedup or 
+        hmmer_batch_residues is not None or 
+        prefilter_db is not None
+    ):
+        logger.error((
+            '--hmmer_profile_shards only applies to per-genome searches with --hmmer_engine hmmsearch '
+            '(not with --dedup, --hmmer_batch_residues or --prefilter_db)'
+        ))
+        sys.exit(1)
+
+    if dedup and not hmmer_cut_ga:
+        # Same as batches: unique sequences are searched together, independently of their genomes.
+        logger.error('--dedup requires --hmmer_cut_ga')
+        sys.exit(1)
+    elif dedup and hmmer_engine != 'pyhmmer':
+        # E-values of each genome are computed from P-values of unique sequences. hmmsearch only prints 
+        # them with 2 significant digits, which would then be rounded twice.
+        logger.error('--dedup requires --hmmer_engine pyhmmer')
+        sys.exit(1)
+
+    if mmseqs2_batch_residues is not None and (hmmer_cut_ga or hmmer_e_value is not None):
+        logger.error('--mmseqs2_batch_residues only applies to MMseqs2 searches (--mmseqs2_sensitivity)')
+        sys.exit(1)
+
+    if calibrate and dedup:
+        logger.error('--calibrate cannot be combined with --dedup')
+        sys.exit(1)
+    elif calibrate and (n_processes is not None or n_threads_per_process is not None):
+        # Calibration picks both values: explicit ones would be silently overridden
+        logger.error('--calibrate cannot be combined with --n_processes or --n_threads_per_process')
+        sys.exit(1)
+    elif calibrate and calibration_sample < 1:
+        logger.error('--calibration_sample must be at least 1')
+        sys.exit(1)
+
+    if hmmer_engine == 'pyhmmer':
+        try:
+            import pyhmmer
+        except ImportError:
+            logger.error('--hmmer_engine pyhmmer requires package pyhmmer (e.g. `pip install pyhmmer`)')
+            sys.exit(1)
+
+        if hmmer_batch_residues is not None and not dedup:
+            logger.error('--hmmer_batch_residues only applies to --hmmer_engine hmmsearch')
+            sys.exit(1)
+
     if assembly_subset_path is not None and not assembly_subset_path.is_file():
         logger.error(f'Assembly subset file does not exist: {args.assembly_subset}')
         sys.exit(1)
@@ -109,10 +390,18 @@ def main():
     assembly_subset = load_assembly_subset(assembly_subset_path)
 
     use_hmmer = hmmer_cut_ga or hmmer_e_value is not None
+
+    # Output files are named after databases: names must be distinct
+    hmm_db_names = [get_hmm_db_name(hmm_db, use_hmmer) for hmm_db in hmm_dbs]
+    if len(set(hmm_db_names)) < len(hmm_db_names):
+        logger.error(f'Profile databases must have distinct names: {", ".join(hmm_db_names)}')
+        sys.exit(1)
+
+    hmm_dbs_txt = ', '.join(hmm_db.as_posix() for hmm_db in hmm_dbs)
     if use_hmmer:
-        logger.info(f'Running hmmer: profile db {hmm_db} vs proteome db {base_folder}')
+        logger.info(f'Running hmmer ({hmmer_engine}): profile db {hmm_dbs_txt} vs proteome db {base_folder}')
     else:
-        logger.info(f'Running MMseqs2: profile db {hmm_db} vs proteome db {base_folder}')
+        logger.info(f'Running MMseqs2: profile db {hmm_dbs_txt} vs proteome db {base_folder}')
 
     paths = [
         p for p in genomes_folder.iterdir()
@@ -135,63 +424,310 @@ def main():
     random.shuffle(paths)
 
     with tempfile.TemporaryDirectory() as temp_dir:
-        # Copy HMM DB file to temp directory,
+        # Copy HMM DB files to temp directory,
         # i.e. on disk and not on network drive if running on HPC.
-        hmm_db_tmp_path = Path(temp_dir) / hmm_db.name
-        shutil.copy(hmm_db, hmm_db_tmp_path)
+        # Each database gets its own folder: file names of MMseqs2 databases may overlap.
+        hmm_db_tmp_paths = []
+        for db_ix, hmm_db in enumerate(hmm_dbs):
+            db_folder = Path(temp_dir) / f'db_{db_ix}'
+            db_folder.mkdir()
+            hmm_db_tmp_path = db_folder / hmm_db.name
+            if use_hmmer:
+                shutil.copy(hmm_db, hmm_db_tmp_path)
+            else:
+                # MMseqs2 database files: <db>, <db>.index, <db>.dbtype, <db>_h, ...
+                for db_file in hmm_db.parent.glob(f'{hmm_db.name}*'):
+                    if db_file.is_file():
+                        shutil.copy(db_file, db_folder / db_file.name)
 
-        # Run on tasks on multi processes.
-        n_processes = min(n_processes, len(paths))
-        n_per_process = int(np.ceil(len(paths) / n_processes))
-        processes = []
-        for i in range(n_processes):
-            start = i * n_per_process
-            end = start + n_per_process
-    
-            p = Process(target=worker_main, args=(
-                i,
-                hmm_db_tmp_path,
-                paths[start:end],
-                use_hmmer,
-                hmmer_e_value,
-                hmmer_cut_ga,
-                mmseqs2_sensitivity,
+                # Index the profile database once: searches then only build their query database.
+                create_mmseqs2_index(hmm_db_tmp_path, db_folder, mmseqs2_sensitivity)
+
+            hmm_db_tmp_paths.append(hmm_db_tmp_path)
+
+        # Shards are written once, next to the copy of each HMM DB, and shared by all workers.
+        hmm_db_shards = None
+        if use_hmmer and hmmer_profile_shards > 1:
+            hmm_db_shards = [
+                write_profile_shards(hmm_db_tmp_path, hmmer_profile_shards, hmm_db_tmp_path.parent / 'shards')
+                for hmm_db_tmp_path in hmm_db_tmp_paths
+            ]
+            for hmm_db_name, shards in zip(hmm_db_names, hmm_db_shards):
+                logger.info(f'Profile database {hmm_db_name} split into {len(shards):,} shards')
+
+        search_options = dict(
+            use_hmmer=use_hmmer,
+            hmmer_e_value=hmmer_e_value,
+            hmmer_cut_ga=hmmer_cut_ga,
+            mmseqs2_sensitivity=mmseqs2_sensitivity,
+            hmmer_batch_residues=hmmer_batch_residues,
+            mmseqs2_batch_residues=mmseqs2_batch_residues,
+            hmmer_engine=hmmer_engine,
+            prefilter_db=prefilter_db,
+            prefilter_recall_sample=prefilter_recall_sample,
+            hmm_db_shards=hmm_db_shards,
+            output_format=output_format,
+        )
+        calibration_key = get_calibration_key(hmm_dbs, get_search_mode(search_options))
+
+        genomes_per_hour = None
+        if calibrate:
+            n_processes, n_threads_per_process, genomes_per_hour = calibrate_workers(
+                paths, 
+                hmm_db_tmp_paths, 
+                hmm_db_names,
+                search_options, 
+                calibration_sample, 
+                Path(temp_dir) / 'calibration',
+            )
+            save_calibration(calibration_key, n_processes, n_threads_per_process, genomes_per_hour)
+        elif n_processes is None and n_threads_per_process is None and not dedup:
+            calibration = load_calibration(calibration_key)
+            if calibration is not None:
+                n_processes = calibration['n_processes']
+                n_threads_per_process = calibration['n_threads_per_process']
+                genomes_per_hour = calibration['genomes_per_hour']
+                logger.info((
+                    f'Using calibrated configuration: {n_processes:,} processes x '
+                    f'{n_threads_per_process:,} threads per process'
+                ))
+
+        n_processes = n_processes or DEFAULT_N_PROCESSES
+        n_threads_per_process = n_threads_per_process or DEFAULT_N_THREADS_PER_PROCESS
+
+        if dedup:
+            success = search_unique_sequences(
+                paths,
+                hmm_db_tmp_paths,
+                Path(temp_dir),
+                n_processes,
                 n_threads_per_process,
+                hmmer_batch_residues or DEDUP_CHUNK_RESIDUES,
+                output_format,
+            )
+            if not success:
+                sys.exit(1)
+
+            logger.info('DONE')
+            sys.exit(0)
+
+        n_remaining = sum(1 for p in paths if len(get_pending_db_ixs(p, hmm_db_names)) > 0)
+        if genomes_per_hour is not None and n_remaining > 0:
+            logger.info((
+                f'Expected throughput: {genomes_per_hour:,.0f} genomes/hour, '
+                f'{n_remaining:,} assemblies to search in about {n_remaining / genomes_per_hour:,.1f} hours'
             ))
-            p.start()
-            processes.append(p)
 
-        for p in processes:
-            p.join()
+        start_time = time.time()
+        run_workers(hmm_db_tmp_paths, paths, n_processes, n_threads_per_process, search_options)
+
+        elapsed_seconds = time.time() - start_time
+        if n_remaining > 0 and elapsed_seconds > 0:
+            logger.info((
+                f'Searched {n_remaining:,} assemblies in {elapsed_seconds / 3600:,.2f} hours '
+                f'({n_remaining / elapsed_seconds * 3600:,.0f} genomes/hour)'
+            ))
 
     logger.info('DONE')
     sys.exit(0)
 
 
+def run_workers(
+    hmm_dbs : List[Path], 
+    paths : List[Path], 
+    n_processes : int, 
+    n_threads_per_process : int, 
+    search_options : dict,
+) -> None:
+    """
+    Search assemblies of `paths` on `n_processes` processes (see `worker_main` for `search_options`).
+    """
+    n_processes = min(n_processes, len(paths))
+    n_per_process = int(np.ceil(len(paths) / n_processes))
+    processes = []
+    for i in range(n_processes):
+        start = i * n_per_process
+        end = start + n_per_process
+
+        p = Process(
+            target=worker_main, 
+            args=(i, hmm_dbs, paths[start:end]),
+            kwargs=dict(search_options, n_threads_per_process=n_threads_per_process),
+        )
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+
+
+def calibrate_workers(
+    paths : List[Path], 
+    hmm_dbs : List[Path], 
+    hmm_db_names : List[str],
+    search_options : dict, 
+    n_sample : int,
+    calibration_folder : Path,
+) -> Tuple[int, int, float]:
+    """
+    Search the same sample of assemblies with each candidate split of cores into processes x threads,
+    in folders of `calibration_folder` linking to the proteomes. 
+    Outputs of the fastest configuration are moved to the assembly folders, so that the sample is not searched again.
+    Return the number of processes, threads per process and genomes per hour of the fastest configuration.
+    """
+    sample = [
+        p for p in paths 
+        if (
+            len(get_pending_db_ixs(p, hmm_db_names)) > 0 and 
+            (p / f'{p.name}_protein.faa.gz').is_file()
+        )
+    ][:n_sample]
+    if len(sample) == 0:
+        sample = paths[:n_sample]
+
+    n_cores = get_n_cores()
+    configs = get_candidate_configs(n_cores, len(sample))
+    logger.info((
+        f'Calibration: {len(configs):,} configurations on {n_cores:,} cores, '
+        f'sample of {len(sample):,} assemblies'
+    ))
+
+    # Recall sampling would add exhaustive searches to some configurations only
+    search_options = dict(search_options, prefilter_recall_sample=0.)
+
+    results = []
+    for n_processes, n_threads_per_process in configs:
+        config_folder = calibration_folder / f'{n_processes}x{n_threads_per_process}'
+        config_paths = []
+        for path in sample:
+            config_path = config_folder / path.name
+            config_path.mkdir(parents=True)
+            protein_path_gz = path / f'{path.name}_protein.faa.gz'
+            if protein_path_gz.is_file():
+                (config_path / protein_path_gz.name).symlink_to(protein_path_gz.resolve())
+            config_paths.append(config_path)
+
+        start_time = time.time()
+        run_workers(hmm_dbs, config_paths, n_processes, n_threads_per_process, search_options)
+        genomes_per_hour = len(sample) / max(time.time() - start_time, 1e-6) * 3600
+
+        logger.info((
+            f'Calibration | {n_processes:,} processes x {n_threads_per_process:,} threads: '
+            f'{genomes_per_hour:,.0f} genomes/hour'
+        ))
+        results.append((genomes_per_hour, n_processes, n_threads_per_process, config_paths))
+
+    genomes_per_hour, n_processes, n_threads_per_process, config_paths = max(results, key=lambda r: r[0])
+    logger.info((
+        f'Calibration | Best: {n_processes:,} processes x {n_threads_per_process:,} threads per process '
+        f'({genomes_per_hour:,.0f} genomes/hour)'
+    ))
+
+    for path, config_path in zip(sample, config_paths):
+        for output_path in config_path.iterdir():
+            if not output_path.is_symlink() and not (path / output_path.name).exists():
+                shutil.move(output_path, path / output_path.name)
+
+    shutil.rmtree(calibration_folder)
+    return n_processes, n_threads_per_process, genomes_per_hour
+
+
+def get_search_mode(search_options : dict) -> str:
+    """
+    Search mode, part of the calibration key: configurations are not comparable across modes.
+    """
+    if not search_options['use_hmmer']:
+        if search_options['mmseqs2_batch_residues'] is not None:
+            return f'mmseqs2,batch={search_options["mmseqs2_batch_residues"]}'
+        return 'mmseqs2'
+
+    mode = [search_options['hmmer_engine']]
+    if search_options['hmmer_batch_residues'] is not None:
+        mode.append(f'batch={search_options["hmmer_batch_residues"]}')
+    if search_options['hmm_db_shards'] is not None:
+        mode.append(f'shards={len(search_options["hmm_db_shards"][0])}')
+    if search_options['prefilter_db'] is not None:
+        mode.append('prefilter')
+    return ','.join(mode)
+
+
+def get_hmm_db_name(hmm_db : Path, use_hmmer : bool) -> str:
+    if use_hmmer:
+        return hmm_db.name.replace('.hmm', '')
+    else:
+        return hmm_db.name.replace('.mmseqs2', '')
+
+
+def get_pending_db_ixs(path : Path, hmm_db_names : List[str]) -> List[int]:
+    """
+    Indices of the databases of `hmm_db_names` without output file (in any format) for assembly folder `path`.
+    """
+    return [
+        db_ix for db_ix, hmm_db_name in enumerate(hmm_db_names)
+        if find_output_path(path, hmm_db_name) is None
+    ]
+
+
 def worker_main(
     worker_ix : int, 
-    hmm_db : os.PathLike, 
+    hmm_dbs : List[os.PathLike], 
     paths_to_process : List[os.PathLike], 
     use_hmmer : bool,
     hmmer_e_value : float,
     hmmer_cut_ga : bool,
     mmseqs2_sensitivity : float,
     n_threads_per_process : int,
+    hmmer_batch_residues : int = None,
+    hmmer_engine : str = 'hmmsearch',
+    prefilter_db : Path = None,
+    prefilter_recall_sample : float = 0.,
+    hmm_db_shards : List[List[Path]] = None,
+    mmseqs2_batch_residues : int = None,
+    output_format : str = 'csv',
 ):
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
 
-    if use_hmmer:
-        hmm_db_name = hmm_db.name.replace('.hmm', '')
+    hmm_db_names = [get_hmm_db_name(hmm_db, use_hmmer) for hmm_db in hmm_dbs]
+
+    if mmseqs2_batch_residues is not None:
+        search_mmseqs2_batches(
+            worker_ix, 
+            hmm_dbs, 
+            hmm_db_names, 
+            paths_to_process, 
+            mmseqs2_sensitivity,
+            n_threads_per_process, 
+            mmseqs2_batch_residues,
+            output_format,
+        )
+        return
+
+    if hmmer_batch_residues is not None:
+        search_hmmer_batches(
+            worker_ix, 
+            hmm_dbs, 
+            hmm_db_names, 
+            paths_to_process, 
+            n_threads_per_process, 
+            hmmer_batch_residues,
+            output_format,
+        )
+        return
+
+    use_pyhmmer = use_hmmer and hmmer_engine == 'pyhmmer'
+    if use_pyhmmer:
+        profiles_per_db = [load_pyhmmer_profiles(hmm_db) for hmm_db in hmm_dbs]
     else:
-        hmm_db_name = hmm_db.name.replace('.mmseqs2', '')
+        profiles_per_db = [None] * len(hmm_dbs)
+
+    prefilter_sensitivity = mmseqs2_sensitivity if mmseqs2_sensitivity is not None else PREFILTER_SENSITIVITY
+    n_recall_found, n_recall_expected = 0, 0
 
     for i, path in enumerate(paths_to_process):
         logger.info(f'Worker {worker_ix+1} | Assembly {i+1:,} / {len(paths_to_process)}: {path.name}')
 
-        output_csv_path = path / f'{path.name}_{hmm_db_name}.csv'
-        output_csv_path_gz = path / f'{path.name}_{hmm_db_name}.csv.gz'
-
-        if output_csv_path_gz.is_file():
+        db_ixs = get_pending_db_ixs(path, hmm_db_names)
+        if len(db_ixs) == 0:
             continue
 
         if use_hmmer and hmmer_cut_ga:
@@ -206,132 +742,958 @@ def worker_main(
             logger.error(f'Protein file not found: {protein_path_gz}')
             continue
 
-        # Decompress protein fasta file
-        with tempfile.NamedTemporaryFile(suffix='.faa', delete=False) as protein_file:
-            protein_path = Path(protein_file.name).resolve()
-
-            returncode = subprocess.call(
-                ['gzip', '-cd', protein_path_gz.resolve().as_posix()],
-                stdout=protein_file,
-            )
-            if returncode != 0:
-                logger.error(f'Error while decompressing {protein_path_gz}')
-                continue
-        
-        output_csv_temp_path = Path(tempfile.NamedTemporaryFile(
-            suffix=f'_{path.name}_{hmm_db_name}.csv', 
-            delete=False,
-        ).name)
-        domtblout_path = Path(tempfile.NamedTemporaryFile(
-            suffix=f'_{path.name}_{hmm_db_name}_domtblout.txt', 
-            delete=False,
-        ).name)
-        try:
-            if use_hmmer:
-                # Run hmmsearch
-                response = run_hmmsearch(
+        if prefilter_db is not None:
+            # Single profile database (checked in main)
+            hmm_db, profiles = hmm_dbs[0], profiles_per_db[0]
+            try:
+                df = search_prefiltered(
                     hmm_db, 
-                    protein_path, 
-                    domtblout_path, 
-                    threshold_params, 
+                    prefilter_db, 
+                    protein_path_gz, 
+                    profiles, 
+                    prefilter_sensitivity, 
                     n_threads_per_process,
                 )
-                if response.returncode != 0:
-                    stderr_txt = response.stderr.decode('utf-8')
-                    logger.error(f'Error while running `hmmsearch` (hmmer) on {path.name}: {stderr_txt}')
-                    continue
 
-                # Process hmmer output into a CSV file
-                process_hmmer_output(domtblout_path, output_csv_temp_path)
-            else:
-                # Run MMseqs2
-                response = run_mmseqs2_easy_search(
-                    hmm_db, 
-                    protein_path, 
-                    domtblout_path, 
-                    threshold_params, 
-                    n_threads_per_process,
-                )
-                if response.returncode != 0:
-                    stderr_txt = response.stderr.decode('utf-8')
-                    logger.error(f'Error while running `mmseqs easy-search` on {path.name}: {stderr_txt}')
+                if random.random() < prefilter_recall_sample:
+                    exhaustive_df = search_exhaustive(hmm_db, protein_path_gz, profiles, n_threads_per_process)
+                    n_found, n_expected = count_recalled_hits(df, exhaustive_df)
+                    n_recall_found += n_found
+                    n_recall_expected += n_expected
+                    logger.info((
+                        f'Worker {worker_ix+1} | Prefilter recall on {path.name}: '
+                        f'{n_found:,} / {n_expected:,} domain hits'
+                    ))
+            except (SearchError, OSError, EOFError, ValueError, zlib.error) as e:
+                logger.error(f'Error while searching {protein_path_gz}: {e}')
+                continue
+
+            write_genome_output(df, path, hmm_db_names[0], output_format)
+            continue
+
+        if use_pyhmmer:
+            try:
+                # Sequences are read once and searched against each database
+                sequences = read_pyhmmer_sequences(protein_path_gz)
+                for db_ix in db_ixs:
+                    df = search_pyhmmer(
+                        profiles_per_db[db_ix], 
+                        sequences, 
+                        hmmer_e_value, 
+                        hmmer_cut_ga, 
+                        n_threads_per_process,
+                    )
+                    write_genome_output(df, path, hmm_db_names[db_ix], output_format)
+            except (OSError, EOFError, ValueError, zlib.error) as e:
+                logger.error(f'Error while searching {protein_path_gz}: {e}')
+
+            continue
+
+        try:
+            # Decompressed proteome is held in memory and streamed to the search tool,
+            # whose tabular output is read from a pipe: no per-genome temporary file.
+            # It is decompressed once and searched against each database.
+            with decompressed_fasta(protein_path_gz) as (protein_path, pass_fds):
+                for db_ix in db_ixs:
+                    if use_hmmer and hmm_db_shards is not None:
+                        # Run hmmsearch on profile shards in parallel
+                        response = run_hmmsearch_shards(
+                            hmm_db_shards[db_ix], 
+                            protein_path, 
+                            threshold_params, 
+                            n_threads_per_process,
+                            pass_fds,
+                        )
+                    elif use_hmmer:
+                        # Run hmmsearch
+                        response = run_hmmsearch(
+                            hmm_dbs[db_ix], 
+                            protein_path, 
+                            threshold_params, 
+                            n_threads_per_process,
+                            pass_fds,
+                        )
+                    else:
+                        # Run MMseqs2
+                        response = run_mmseqs2_easy_search(
+                            hmm_dbs[db_ix], 
+                            protein_path, 
+                            threshold_params, 
+                            n_threads_per_process,
+                        )
+
+                    if response.returncode != 0:
+                        stderr_txt = response.stderr.decode('utf-8')
+                        tool = '`hmmsearch` (hmmer)' if use_hmmer else '`mmseqs easy-search`'
+                        logger.error((
+                            f'Error while running {tool} on {path.name} '
+                            f'against {hmm_db_names[db_ix]}: {stderr_txt}'
+                        ))
+                        continue
+
+                    output_txt = io.StringIO(response.stdout.decode('utf-8'))
+                    if use_hmmer:
+                        # Process hmmer output into a CSV file
+                        df = process_hmmer_output(output_txt)
+                    else:
+                        # Process MMseqs2 output into a CSV file
+                        df = process_mmseqs2_output(output_txt)
+
+                    write_genome_output(df, path, hmm_db_names[db_ix], output_format)
+        except (OSError, EOFError, zlib.error) as e:
+            logger.error(f'Error while searching {protein_path_gz}: {e}')
+            continue
+
+    if n_recall_expected > 0:
+        logger.info((
+            f'Worker {worker_ix+1} | Prefilter recall: {n_recall_found:,} / {n_recall_expected:,} domain hits '
+            f'({n_recall_found / n_recall_expected:.2%})'
+        ))
+
+
+def search_prefiltered(
+    hmm_db : Path,
+    prefilter_db : Path,
+    protein_path_gz : Path,
+    profiles : list,
+    prefilter_sensitivity : float,
+    n_threads : int,
+) -> pd.DataFrame:
+    """
+    Two-stage search of a proteome with gathering thresholds.
+
+    MMseqs2 shortlists candidate (protein, profile) pairs, then hmmer searches candidates only, 
+    with `Z` set to the number of sequences of the proteome so that E-values are those of an exhaustive search.
+    - hmmsearch engine (`profiles` is None): proteins that are candidates of any profile are searched 
+      against all profiles, then hits are restricted to candidate pairs.
+    - pyhmmer engine: each profile is searched against its own candidates.
+    Both engines return the same hits.
+    """
+    with gzip.open(protein_path_gz, 'rb') as f:
+        data = f.read()
+
+    records = parse_fasta(data)
+    n_sequences = len(records)
+
+    with in_memory_file(protein_path_gz.name, lambda f: f.write(data)) as (protein_path, _):
+        response = run_mmseqs2_easy_search(
+            prefilter_db, 
+            protein_path, 
+            ['-s', f'{prefilter_sensitivity}', '-e', f'{PREFILTER_E_VALUE}'], 
+            n_threads,
+        )
+
+    if response.returncode != 0:
+        stderr_txt = response.stderr.decode('utf-8')
+        raise SearchError(f'`mmseqs easy-search` prefilter failed: {stderr_txt}')
+
+    candidates = process_mmseqs2_output(io.StringIO(response.stdout.decode('utf-8')))
+    if len(candidates) == 0:
+        return pd.DataFrame.from_dict(get_domain_file_columns_dict())
+
+    if profiles is not None:
+        return search_pyhmmer_candidates(profiles, records, candidates, n_sequences)
+
+    candidate_ids = set(candidates['protein_id'])
+    candidate_fasta = b''.join(
+        b'>%s\n%s\n' % (protein_id.encode('utf-8'), sequence)
+        for protein_id, sequence in records
+        if protein_id in candidate_ids
+    )
+    with in_memory_file('candidates.faa', lambda f: f.write(candidate_fasta)) as (candidates_path, pass_fds):
+        response = run_hmmsearch(
+            hmm_db, 
+            candidates_path, 
+            ['--cut_ga', '-Z', f'{n_sequences}'], 
+            n_threads, 
+            pass_fds,
+        )
+
+    if response.returncode != 0:
+        stderr_txt = response.stderr.decode('utf-8')
+        raise SearchError(f'`hmmsearch` (hmmer) failed: {stderr_txt}')
+
+    df = process_hmmer_output(io.StringIO(response.stdout.decode('utf-8')))
+    return filter_candidate_pairs(df, candidates)
+
+
+def filter_candidate_pairs(df : pd.DataFrame, candidates : pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep domain hits of candidate (protein, profile) pairs, 
+    with profiles of `candidates` matching either HMM names or accessions.
+    """
+    candidate_pairs = set(candidates[['protein_id', 'hmm_query']].itertuples(index=False, name=None))
+    is_candidate = [
+        (protein_id, hmm_query) in candidate_pairs or (protein_id, hmm_accession) in candidate_pairs
+        for protein_id, hmm_query, hmm_accession in zip(df['protein_id'], df['hmm_query'], df['hmm_accession'])
+    ]
+    return df[np.array(is_candidate, dtype=bool)]
+
+
+def search_pyhmmer_candidates(
+    profiles : list, 
+    records : List[Tuple[str, bytes]], 
+    candidates : pd.DataFrame, 
+    n_sequences : int,
+) -> pd.DataFrame:
+    """
+    Search each profile against its candidate sequences (`candidates` as parsed by `process_mmseqs2_output`),
+    with E-values computed for `n_sequences` sequences.
+    """
+    from pyhmmer.easel import DigitalSequenceBlock, TextSequence
+    from pyhmmer.plan7 import Pipeline
+
+    alphabet = profiles[0].alphabet
+
+    # Names of sequences and profiles are str from pyhmmer 0.11, bytes before: 
+    # candidate names are converted to the type used by the installed version.
+    if isinstance(profiles[0].name, bytes):
+        to_name = lambda name: name.encode('utf-8')
+    else:
+        to_name = lambda name: name
+
+    candidate_ids_per_profile = {
+        to_name(profile_name): {to_name(protein_id) for protein_id in protein_ids}
+        for profile_name, protein_ids in candidates.groupby('hmm_query')['protein_id'].agg(set).items()
+    }
+    candidate_ids = set(candidates['protein_id'])
+    sequences = [
+        TextSequence(name=to_name(protein_id), sequence=sequence.decode('utf-8')).digitize(alphabet)
+        for protein_id, sequence in records
+        if protein_id in candidate_ids
+    ]
+
+    pipeline = Pipeline(alphabet, Z=n_sequences, bit_cutoffs='gathering')
+    domtblout = io.BytesIO()
+    for profile in profiles:
+        profile_candidate_ids = (
+            candidate_ids_per_profile.get(profile.name, set()) | 
+            candidate_ids_per_profile.get(profile.accession, set())
+        )
+        if len(profile_candidate_ids) == 0:
+            continue
+
+        block = DigitalSequenceBlock(alphabet, [s for s in sequences if s.name in profile_candidate_ids])
+        hits = pipeline.search_hmm(profile, block)
+        hits.write(domtblout, format='domains', header=False)
+        pipeline.clear()
+
+    return process_hmmer_output(io.StringIO(domtblout.getvalue().decode('utf-8')))
+
+
+def search_exhaustive(hmm_db : Path, protein_path_gz : Path, profiles : list, n_threads : int) -> pd.DataFrame:
+    """
+    Search a whole proteome with gathering thresholds, as without prefilter.
+    """
+    if profiles is not None:
+        return search_pyhmmer(profiles, read_pyhmmer_sequences(protein_path_gz), None, True, n_threads)
+
+    with decompressed_fasta(protein_path_gz) as (protein_path, pass_fds):
+        response = run_hmmsearch(hmm_db, protein_path, ['--cut_ga'], n_threads, pass_fds)
+
+    if response.returncode != 0:
+        stderr_txt = response.stderr.decode('utf-8')
+        raise SearchError(f'`hmmsearch` (hmmer) failed: {stderr_txt}')
+
+    return process_hmmer_output(io.StringIO(response.stdout.decode('utf-8')))
+
+
+def count_recalled_hits(df : pd.DataFrame, exhaustive_df : pd.DataFrame) -> Tuple[int, int]:
+    """
+    Return the number of domain hits of the exhaustive search also found in `df`, 
+    and the number of domain hits of the exhaustive search.
+    """
+    key_columns = ['protein_id', 'hmm_query', 'start', 'end']
+    found = set(df[key_columns].itertuples(index=False, name=None))
+    expected = set(exhaustive_df[key_columns].itertuples(index=False, name=None))
+    return len(found & expected), len(expected)
+
+
+def load_pyhmmer_profiles(hmm_db : Path) -> list:
+    """
+    Load profiles of `hmm_db` and convert them once to the optimized profiles searched by hmmer, 
+    instead of converting every profile again for each genome.
+    """
+    from pyhmmer.plan7 import Background, HMMFile, Profile
+
+    with HMMFile(hmm_db) as f:
+        hmms = list(f)
+
+    profiles = []
+    background = None
+    for hmm in hmms:
+        if background is None:
+            background = Background(hmm.alphabet)
+        profile = Profile(hmm.M, hmm.alphabet)
+        profile.configure(hmm, background)
+        profiles.append(profile.to_optimized())
+
+    return profiles
+
+
+def read_pyhmmer_sequences(protein_path : Path):
+    """
+    Read protein fasta file `protein_path` (optionally gzipped) into a block of digital sequences 
+    searchable with pyhmmer.
+    """
+    from pyhmmer.easel import Alphabet, SequenceFile
+
+    open_fn = gzip.open if protein_path.name.endswith('.gz') else open
+    with open_fn(protein_path, 'rb') as f_in:
+        with SequenceFile(f_in, format='fasta', digital=True, alphabet=Alphabet.amino()) as sequence_file:
+            return sequence_file.read_block()
+
+
+def search_pyhmmer(
+    profiles : list, 
+    sequences, 
+    hmmer_e_value : float, 
+    hmmer_cut_ga : bool,
+    n_threads : int,
+    Z : float = None,
+    with_pvalues : bool = False,
+) -> pd.DataFrame:
+    """
+    Search `sequences` (see `read_pyhmmer_sequences`) in-process with pyhmmer, 
+    with the same thresholds as `run_hmmsearch`. 
+    `Z` overrides the number of sequences used to compute E-values, like hmmsearch's `-Z`.
+
+    Hits are formatted with hmmer's own domain table writer (in memory), 
+    so that values are rounded exactly as in `hmmsearch --domtblout` output.
+    With `with_pvalues`, column `pvalue` holds the unrounded P-value of each domain.
+    """
+    import pyhmmer
+
+    if len(profiles) == 0:
+        return pd.DataFrame.from_dict(get_domain_file_columns_dict())
+
+    if hmmer_cut_ga:
+        threshold_params = {'bit_cutoffs': 'gathering'}
+    else:
+        threshold_params = {'domE': hmmer_e_value}
+
+    if Z is not None:
+        threshold_params['Z'] = Z
+
+    domtblout = io.BytesIO()
+    pvalues = []
+    for hits in pyhmmer.hmmsearch(profiles, sequences, cpus=n_threads, **threshold_params):
+        hits.write(domtblout, format='domains', header=False)
+        if with_pvalues:
+            # Same domains, in the same order, as the domain table
+            pvalues += [domain.pvalue for hit in hits.reported for domain in hit.domains.reported]
+
+    df = parse_hmmer_output(io.StringIO(domtblout.getvalue().decode('utf-8')))
+    if with_pvalues:
+        df['pvalue'] = pvalues
+
+    return df.sort_values(['protein_id', 'start'])
+
+
+def search_unique_sequences(
+    paths : List[Path],
+    hmm_dbs : List[Path],
+    work_folder : Path,
+    n_processes : int,
+    n_threads_per_process : int,
+    chunk_residues : int,
+    output_format : str = 'csv',
+) -> bool:
+    """
+    --dedup mode, in three steps:
+    1. Hash every sequence into the sequence index and write each distinct sequence once,
+       into fasta chunks of up to `chunk_residues` residues.
+    2. Search chunks against each database of `hmm_dbs` with pyhmmer on `n_processes` processes, 
+       keeping the full-precision P-value of each domain.
+    3. Fan out hits of unique sequences to the output files of each genome.
+
+    Genomes are streamed one at a time: memory use does not depend on the size of the collection.
+    Return False if a chunk could not be searched.
+    """
+    hmm_db_names = [get_hmm_db_name(hmm_db, True) for hmm_db in hmm_dbs]
+    paths = [path for path in paths if len(get_pending_db_ixs(path, hmm_db_names)) > 0]
+    if len(paths) == 0:
+        return True
+
+    index_path = work_folder / 'sequence_index.sqlite'
+    conn = open_sequence_index(index_path)
+    try:
+        chunk_paths = write_unique_sequence_chunks(conn, paths, work_folder, chunk_residues, n_processes)
+
+        n_processes = min(n_processes, len(chunk_paths))
+        processes = []
+        for i in range(n_processes):
+            p = Process(target=search_chunks_worker_main, args=(
+                i,
+                hmm_dbs,
+                chunk_paths[i::n_processes],
+                n_threads_per_process,
+            ))
+            p.start()
+            processes.append(p)
+
+        for p in processes:
+            p.join()
+
+        for chunk_path in chunk_paths:
+            for db_ix in range(len(hmm_dbs)):
+                hits_path = get_chunk_hits_path(chunk_path, db_ix)
+                if not hits_path.is_file():
+                    logger.error((
+                        f'Search failed for chunk {chunk_path.name} against {hmm_db_names[db_ix]}: '
+                        'no output written'
+                    ))
+                    return False
+
+                record_hits(conn, pd.read_pickle(hits_path), db_ix)
+                hits_path.unlink()
+
+        logger.info('Indexing hits')
+        create_search_indices(conn)
+        genomes = get_genomes(conn)
+    finally:
+        conn.close()
+
+    n_processes = min(n_processes, len(genomes))
+    processes = []
+    for i in range(n_processes):
+        p = Process(target=fan_out_worker_main, args=(
+            i,
+            index_path,
+            genomes[i::n_processes],
+            hmm_db_names,
+            output_format,
+        ))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+
+    return True
+
+
+def write_unique_sequence_chunks(
+    conn, 
+    paths : List[Path], 
+    work_folder : Path, 
+    chunk_residues : int,
+    n_processes : int,
+) -> List[Path]:
+    """
+    Index proteomes of `paths` (read and hashed on `n_processes` processes) and write sequences 
+    not seen before to fasta chunks, with their sequence index as id. Return paths to the chunks.
+    """
+    chunk_paths = []
+    chunk_file, n_chunk_residues = None, 0
+    n_genomes, n_proteins, next_seq_ix = 0, 0, 0
+    try:
+        with Pool(n_processes) as pool:
+            for i, (path, records) in enumerate(pool.imap(read_assembly_proteome, paths, chunksize=4)):
+                if records is None:
                     continue
 
-                # Process hmmer output into a CSV file
-                process_mmseqs2_output(domtblout_path, output_csv_temp_path)
+                new_sequences = add_proteome(conn, n_genomes, path.as_posix(), records, next_seq_ix)
+                n_genomes += 1
+                n_proteins += len(records)
+                next_seq_ix += len(new_sequences)
+
+                for seq_ix, sequence in new_sequences:
+                    if chunk_file is None or n_chunk_residues >= chunk_residues:
+                        if chunk_file is not None:
+                            chunk_file.close()
+                        chunk_paths.append(work_folder / f'unique_sequences_{len(chunk_paths)}.faa')
+                        chunk_file = chunk_paths[-1].open('wb')
+                        n_chunk_residues = 0
+
+                    chunk_file.write(b'>%d\n%s\n' % (seq_ix, sequence))
+                    n_chunk_residues += len(sequence)
+
+                if (i + 1) % 1000 == 0 or i + 1 == len(paths):
+                    logger.info((
+                        f'Indexed {i+1:,} / {len(paths):,} assemblies: '
+                        f'{n_proteins:,} proteins, {next_seq_ix:,} unique sequences'
+                    ))
+    finally:
+        if chunk_file is not None:
+            chunk_file.close()
+
+    if n_proteins > 0:
+        logger.info((
+            f'{next_seq_ix:,} unique sequences out of {n_proteins:,} proteins '
+            f'({next_seq_ix / n_proteins:.1%}), in {len(chunk_paths):,} chunks'
+        ))
+    return chunk_paths
+
+
+def read_assembly_proteome(path : Path):
+    protein_path_gz = path / f'{path.name}_protein.faa.gz'
+    if not protein_path_gz.is_file():
+        logger.error(f'Protein file not found: {protein_path_gz}')
+        return path, None
+
+    try:
+        return path, read_proteome(protein_path_gz)
+    except (OSError, EOFError, zlib.error) as e:
+        logger.error(f'Error while decompressing {protein_path_gz}: {e}')
+        return path, None
+
+
+def search_chunks_worker_main(
+    worker_ix : int, 
+    hmm_dbs : List[Path], 
+    chunk_paths : List[Path], 
+    n_threads_per_process : int,
+):
+    """
+    Search chunks of unique sequences against each database with pyhmmer, keeping full-precision P-values,
+    and save hits next to each chunk (see `get_chunk_hits_path`).
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
+
+    profiles_per_db = [load_pyhmmer_profiles(hmm_db) for hmm_db in hmm_dbs]
 
-            # Compress hmmer CSV output to final location
-            if output_csv_path.is_file():
-                output_csv_path.unlink()
-            if output_csv_path_gz.is_file():
-                output_csv_path_gz.unlink()
+    for i, chunk_path in enumerate(chunk_paths):
+        logger.info(f'Worker {worker_ix+1} | Chunk {i+1:,} / {len(chunk_paths):,}: {chunk_path.name}')
 
-            with output_csv_path_gz.open('wb') as f_out:
-                response = subprocess.run(
-                    ['gzip', '-c', output_csv_temp_path.resolve().as_posix()], 
-                    stdout=f_out,
+        try:
+            sequences = read_pyhmmer_sequences(chunk_path)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f'Error while reading {chunk_path.name}: {e}')
+            continue
+
+        for db_ix in range(len(hmm_dbs)):
+            try:
+                df = search_pyhmmer(
+                    profiles_per_db[db_ix], 
+                    sequences, 
+                    None, 
+                    True, 
+                    n_threads_per_process, 
+                    Z=1, 
+                    with_pvalues=True,
                 )
+            except ValueError as e:
+                logger.error(f'Error while searching {chunk_path.name}: {e}')
+                continue
+
+            df.to_pickle(get_chunk_hits_path(chunk_path, db_ix))
+
+        chunk_path.unlink()
+
+
+def get_chunk_hits_path(chunk_path : Path, db_ix : int) -> Path:
+    return chunk_path.with_suffix(f'.{db_ix}.hits.pkl')
+
+
+def fan_out_worker_main(
+    worker_ix : int, 
+    index_path : Path, 
+    genomes : List[Tuple[int, str, int]],
+    hmm_db_names : List[str],
+    output_format : str = 'csv',
+):
+    """
+    Write the output file of each genome and database from hits of its unique sequences.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)-10s (%(levelname)s) %(message)s')
+
+    conn = open_sequence_index(index_path)
+    try:
+        for i, (genome_ix, folder, n_sequences) in enumerate(genomes):
+            path = Path(folder)
+            if (i + 1) % 1000 == 0 or i + 1 == len(genomes):
+                logger.info(f'Worker {worker_ix+1} | Writing outputs: {i+1:,} / {len(genomes):,} assemblies')
+
+            for db_ix in get_pending_db_ixs(path, hmm_db_names):
+                df = get_genome_hits(conn, genome_ix, n_sequences, db_ix)
+                write_genome_output(df, path, hmm_db_names[db_ix], output_format)
+    finally:
+        conn.close()
+
+
+def search_hmmer_batches(
+    worker_ix : int, 
+    hmm_dbs : List[Path], 
+    hmm_db_names : List[str],
+    paths_to_process : List[Path], 
+    n_threads_per_process : int,
+    batch_residues : int,
+    output_format : str = 'csv',
+):
+    """
+    Search batches of proteomes of up to `batch_residues` residues with one hmmsearch run per database,
+    then split hits into one output file per genome and database.
+
+    Sequence ids are tagged with the index of their genome in the batch. With --cut_ga, hits, scores and 
+    coordinates do not depend on the batch and are identical to a per-genome search. Independent E-values 
+    are proportional to the number of sequences searched (Z) and are scaled back to the size of each proteome, 
+    rounded to 2 significant digits. hmmsearch only prints E-values with 2 significant digits,
+    so scaled E-values are approximate: they may differ from a per-genome search in the last digit.
+    """
+    paths_to_process = [
+        path for path in paths_to_process
+        if len(get_pending_db_ixs(path, hmm_db_names)) > 0
+    ]
+
+    for batch_ix, batch in enumerate(iter_proteome_batches(paths_to_process, batch_residues)):
+        batch_paths = [path for path, _, _ in batch]
+        n_sequences_batch = sum(n_sequences for _, _, n_sequences in batch)
+        logger.info((
+            f'Worker {worker_ix+1} | Batch {batch_ix+1:,}: {len(batch):,} assemblies, '
+            f'{n_sequences_batch:,} sequences'
+        ))
+
+        with in_memory_file('batch.faa', lambda f: f.writelines(data for _, data, _ in batch)) as (protein_path, pass_fds):
+            responses = [
+                run_hmmsearch(hmm_db, protein_path, ['--cut_ga'], n_threads_per_process, pass_fds)
+                for hmm_db in hmm_dbs
+            ]
+
+        for hmm_db_name, response in zip(hmm_db_names, responses):
             if response.returncode != 0:
-                logger.error(f'Error while compressing CSV output {output_csv_temp_path}')
-                output_csv_path_gz.unlink()
+                stderr_txt = response.stderr.decode('utf-8')
+                logger.error((
+                    f'Error while running `hmmsearch` (hmmer) on batch {batch_paths[0].name}... '
+                    f'against {hmm_db_name}: {stderr_txt}'
+                ))
                 continue
 
-            # Change permissions
-            response = subprocess.run(
-                ['chmod', '644', output_csv_path_gz.resolve().as_posix()], 
-                capture_output=True,
-            )
+            df = parse_hmmer_output(io.StringIO(response.stdout.decode('utf-8')))
+            genome_ix = untag_protein_ids(df)
+
+            for ix, (path, _, n_sequences) in enumerate(batch):
+                if find_output_path(path, hmm_db_name) is not None:
+                    continue
+
+                genome_df = df[genome_ix == ix].copy()
+                genome_df['evalue'] = [
+                    float(f'{evalue * n_sequences / n_sequences_batch:.2g}') 
+                    for evalue in genome_df['evalue']
+                ]
+                genome_df = genome_df.sort_values(['protein_id', 'start'])
+                write_genome_output(genome_df, path, hmm_db_name, output_format)
+
+
+def search_mmseqs2_batches(
+    worker_ix : int, 
+    mmseqs2_dbs : List[Path], 
+    mmseqs2_db_names : List[str],
+    paths_to_process : List[Path], 
+    mmseqs2_sensitivity : float,
+    n_threads_per_process : int,
+    batch_residues : int,
+    output_format : str = 'csv',
+):
+    """
+    Search batches of proteomes of up to `batch_residues` residues with one `mmseqs easy-search` run 
+    per database, then split hits into one output file per genome and database.
+
+    Proteins are the queries: their E-values only depend on the size of the target (profile) database, 
+    so hits are the same as when searching each genome on its own.
+    """
+    paths_to_process = [
+        path for path in paths_to_process
+        if len(get_pending_db_ixs(path, mmseqs2_db_names)) > 0
+    ]
+
+    for batch_ix, batch in enumerate(iter_proteome_batches(paths_to_process, batch_residues)):
+        batch_paths = [path for path, _, _ in batch]
+        logger.info((
+            f'Worker {worker_ix+1} | Batch {batch_ix+1:,}: {len(batch):,} assemblies, '
+            f'{sum(n_sequences for _, _, n_sequences in batch):,} sequences'
+        ))
+
+        with in_memory_file('batch.faa', lambda f: f.writelines(data for _, data, _ in batch)) as (protein_path, _):
+            responses = [
+                run_mmseqs2_easy_search(
+                    mmseqs2_db, 
+                    protein_path, 
+                    ['-s', f'{mmseqs2_sensitivity}'], 
+                    n_threads_per_process, 
+                )
+                for mmseqs2_db in mmseqs2_dbs
+            ]
+
+        for mmseqs2_db_name, response in zip(mmseqs2_db_names, responses):
             if response.returncode != 0:
                 stderr_txt = response.stderr.decode('utf-8')
-                logger.error(f'Error while setting file permissions for {output_csv_path_gz}: {stderr_txt}')
+                logger.error((
+                    f'Error while running `mmseqs easy-search` on batch {batch_paths[0].name}... '
+                    f'against {mmseqs2_db_name}: {stderr_txt}'
+                ))
                 continue
 
+            df = process_mmseqs2_output(io.StringIO(response.stdout.decode('utf-8')))
+            genome_ix = untag_protein_ids(df)
+
+            for ix, (path, _, _) in enumerate(batch):
+                if find_output_path(path, mmseqs2_db_name) is not None:
+                    continue
+
+                genome_df = df[genome_ix == ix].sort_values(['protein_id', 'start'])
+                write_genome_output(genome_df, path, mmseqs2_db_name, output_format)
+
+
+def untag_protein_ids(df : pd.DataFrame) -> np.ndarray:
+    """
+    Remove genome tags from protein ids of a batch search (see `iter_proteome_batches`), in place.
+    Return the index of the genome of each row in the batch.
+    """
+    if len(df) == 0:
+        return np.array([], dtype=int)
+
+    parts = df['protein_id'].str.partition(GENOME_TAG_SEPARATOR)
+    df['protein_id'] = parts[2].to_numpy()
+    return parts[0].astype(int).to_numpy()
+
+
+def iter_proteome_batches(
+    paths : List[Path], 
+    batch_residues : int,
+) -> Iterator[List[Tuple[Path, bytes, int]]]:
+    """
+    Yield batches of `(path, tagged fasta, number of sequences)` of up to `batch_residues` residues 
+    (a single larger proteome makes a batch on its own).
+    Sequence ids are prefixed with the index of their genome in the batch, e.g. `>0@WP_012345678.1`.
+    """
+    batch, n_residues = [], 0
+    for path in paths:
+        protein_path_gz = path / f'{path.name}_protein.faa.gz'
+        if not protein_path_gz.is_file():
+            logger.error(f'Protein file not found: {protein_path_gz}')
+            continue
+
+        try:
+            with gzip.open(protein_path_gz, 'rb') as f:
+                data = f.read()
+        except (OSError, EOFError, zlib.error) as e:
+            logger.error(f'Error while decompressing {protein_path_gz}: {e}')
+            continue
+
+        if not data.endswith(b'\n'):
+            data += b'\n'
+
+        headers = re.findall(rb'^>.*$', data, flags=re.MULTILINE)
+        genome_residues = len(data) - sum(len(h) for h in headers) - data.count(b'\n')
+
+        if len(batch) > 0 and n_residues + genome_residues > batch_residues:
+            yield batch
+            batch, n_residues = [], 0
+
+        tag = f'>{len(batch)}{GENOME_TAG_SEPARATOR}'.encode()
+        batch.append((path, re.sub(rb'^>', tag, data, flags=re.MULTILINE), len(headers)))
+        n_residues += genome_residues
+
+    if len(batch) > 0:
+        yield batch
+
+
+@contextmanager
+def in_memory_file(name : str, write_content : Callable[[BinaryIO], None]) -> Iterator[Tuple[Path, Tuple[int, ...]]]:
+    """
+    Anonymous in-memory file, filled with `write_content(f)`.
+    Yield a path to it readable by a subprocess, and the file descriptors to pass to that subprocess.
+    Fall back to a temporary file on platforms without `memfd_create`.
+    """
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create(name)
+        try:
+            with os.fdopen(fd, 'wb', closefd=False) as f_out:
+                write_content(f_out)
+            os.lseek(fd, 0, os.SEEK_SET)
+            yield Path(f'/proc/self/fd/{fd}'), (fd,)
         finally:
-            if protein_path.is_file():
-                protein_path.unlink()
-            if output_csv_temp_path.is_file():
-                output_csv_temp_path.unlink()
-            if domtblout_path.is_file():
-                domtblout_path.unlink()
+            os.close(fd)
+    else:
+        with tempfile.NamedTemporaryFile(suffix=f'_{name}') as f_out:
+            write_content(f_out)
+            f_out.flush()
+            yield Path(f_out.name), ()
+
+
+def decompressed_fasta(fasta_path_gz : Path):
+    """
+    Decompress gzipped fasta file in-process into an in-memory file (see `in_memory_file`).
+    """
+    def write_content(f_out):
+        with gzip.open(fasta_path_gz, 'rb') as f_in:
+            shutil.copyfileobj(f_in, f_out)
+
+    return in_memory_file(fasta_path_gz.name, write_content)
 
 
-def run_hmmsearch(hmm_db, protein_path, domtblout_path, threshold_params, n_threads_per_process):
+def write_genome_output(df : pd.DataFrame, path : Path, hmm_db_name : str, output_format : str = 'csv') -> None:
+    """
+    Write domain hits of the assembly in folder `path` against database `hmm_db_name` 
+    (see `hmm_output.py` for formats), replacing an uncompressed output left by an older version.
+    """
+    output_csv_path = path / f'{path.name}_{hmm_db_name}.csv'
+    if output_csv_path.is_file():
+        output_csv_path.unlink()
+
+    write_hmm_output(df, get_output_path(path, hmm_db_name, output_format))
+
+
+def run_hmmsearch(hmm_db, protein_path, threshold_params, n_threads_per_process, pass_fds=()):
+    """
+    Run hmmsearch, with the domain table written to stdout.
+    hmmsearch rewinds the target file for each profile, so it is passed as a (seekable) path rather than stdin.
+    """
     return subprocess.run(
         [
             'hmmsearch',
             '--acc',
             '--noali',
             '-o', '/dev/null',
-            '--domtblout', domtblout_path.resolve().as_posix(),
+            '--domtblout', '/dev/stdout',
+            '--tformat', 'fasta',
             '--cpu', f'{n_threads_per_process}',
         ] + 
         threshold_params +
         [
             hmm_db.resolve().as_posix(),
-            protein_path.resolve().as_posix(),
+            protein_path.as_posix(),
         ], 
         capture_output=True,
+        pass_fds=pass_fds,
     )
 
 
-def run_mmseqs2_easy_search(hmm_db, protein_path, domtblout_path, threshold_params, n_threads_per_process):
-    tmp_folder = Path(tempfile.gettempdir())
-    return subprocess.run(
-        [
-            'mmseqs',
-            'easy-search',
-            protein_path.resolve().as_posix(),
-            hmm_db.resolve().as_posix(),
-            domtblout_path.resolve().as_posix(),
-            tmp_folder.resolve().as_posix(),
-            '--threads', f'{n_threads_per_process}',
-            '--format-output', 'query,target,evalue,bits,qstart,qend',
-        ] + 
-        threshold_params,
-        capture_output=True,
+def run_hmmsearch_shards(hmm_db_shards, protein_path, threshold_params, n_threads_per_process, pass_fds=()):
+    """
+    Run hmmsearch on each profile shard in parallel, splitting threads between shards:
+    at most `n_threads_per_process` shards run at once, and their `--cpu` add up to `n_threads_per_process`.
+    Domain tables are concatenated in shard order, i.e. in the order of profiles in the full database.
+    E-values do not depend on sharding: they are computed from the number of target sequences.
+    """
+    n_concurrent = max(1, min(len(hmm_db_shards), n_threads_per_process))
+    n_threads_per_shard = [
+        max(1, n_threads_per_process // n_concurrent + int(k < n_threads_per_process % n_concurrent))
+        for k in range(len(hmm_db_shards))
+    ]
+    with ThreadPoolExecutor(max_workers=n_concurrent) as executor:
+        responses = list(executor.map(
+            lambda shard, n_threads: run_hmmsearch(shard, protein_path, threshold_params, n_threads, pass_fds), 
+            hmm_db_shards,
+            n_threads_per_shard,
+        ))
+
+    failed = [r for r in responses if r.returncode != 0]
+    return subprocess.CompletedProcess(
+        args=[r.args for r in responses],
+        returncode=failed[0].returncode if len(failed) > 0 else 0,
+        stdout=b''.join(r.stdout for r in responses),
+        stderr=b''.join(r.stderr for r in responses),
     )
 
 
+def write_profile_shards(hmm_db : Path, n_shards : int, shards_folder : Path) -> List[Path]:
+    """
+    Split HMM database into up to `n_shards` files of consecutive profiles with similar total length
+    (search time grows with profile length). Return shard paths, in database order.
+    """
+    profiles, lengths = [], []
+    with hmm_db.open('rb') as f:
+        profile_lines, length = [], 0
+        for line in f:
+            profile_lines.append(line)
+            if line.startswith(b'LENG '):
+                length = int(line.split()[1])
+            elif line.startswith(b'//'):
+                profiles.append(b''.join(profile_lines))
+                lengths.append(length)
+                profile_lines, length = [], 0
+
+    n_shards = max(1, min(n_shards, len(profiles)))
+    cumulative_lengths = np.cumsum(lengths)
+    boundaries = [0]
+    for k in range(1, n_shards):
+        # First profile of shard k: closest to an even split of total length, leaving at least one profile per shard
+        boundary = int(np.searchsorted(cumulative_lengths, cumulative_lengths[-1] * k / n_shards, side='right'))
+        boundaries.append(min(max(boundary, boundaries[-1] + 1), len(profiles) - (n_shards - k)))
+    boundaries.append(len(profiles))
+
+    shards_folder.mkdir(parents=True, exist_ok=True)
+    shard_paths = []
+    for k in range(n_shards):
+        start, end = boundaries[k], boundaries[k+1]
+        if start >= end:
+            continue
+
+        shard_path = shards_folder / f'{hmm_db.stem}.shard_{k}{hmm_db.suffix}'
+        with shard_path.open('wb') as f:
+            f.writelines(profiles[start:end])
+        shard_paths.append(shard_path)
+
+    return shard_paths
+
+
+def run_mmseqs2_easy_search(hmm_db, protein_path, threshold_params, n_threads_per_process):
+    """
+    Run MMseqs2 easy-search, with the tabular output returned as stdout.
+    Each run gets its own tmp folder: MMseqs2 keeps intermediate databases there, 
+    which concurrent runs must not share.
+
+    Query and results are regular files of that folder: MMseqs2 writes per-thread result files next to 
+    the output path before merging them, so output cannot go to a pipe such as /dev/stdout. 
+    An in-memory query (see `in_memory_file`) is copied there first.
+    """
+    with tempfile.TemporaryDirectory(prefix='mmseqs2_') as tmp_folder:
+        query_path = Path(tmp_folder) / 'query.faa'
+        output_path = Path(tmp_folder) / 'result.m8'
+        shutil.copyfile(protein_path, query_path)
+
+        response = subprocess.run(
+            [
+                'mmseqs',
+                'easy-search',
+                query_path.as_posix(),
+                hmm_db.resolve().as_posix(),
+                output_path.as_posix(),
+                (Path(tmp_folder) / 'tmp').as_posix(),
+                '--threads', f'{n_threads_per_process}',
+                '--format-output', 'query,target,evalue,bits,qstart,qend',
+                '-v', '1',
+            ] + 
+            threshold_params,
+            capture_output=True,
+        )
+        if response.returncode == 0:
+            response.stdout = output_path.read_bytes()
+
+        return response
+
+
+def create_mmseqs2_index(mmseqs2_db : Path, work_folder : Path, sensitivity : float) -> None:
+    """
+    Precompute the index of MMseqs2 target database `mmseqs2_db` (written next to it), 
+    so that searches do not rebuild it. The index depends on sensitivity, which must match searches'.
+    Searches still work without index if this fails.
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix='mmseqs2_createindex_', dir=work_folder) as tmp_folder:
+            response = subprocess.run(
+                [
+                    'mmseqs',
+                    'createindex',
+                    mmseqs2_db.resolve().as_posix(),
+                    tmp_folder,
+                    '-s', f'{sensitivity}',
+                    '--threads', f'{get_n_cores()}',
+                    '-v', '1',
+                ],
+                capture_output=True,
+            )
+    except OSError as e:
+        logger.warning(f'Could not index MMseqs2 database {mmseqs2_db.name}, searching without index: {e}')
+        return
+
+    if response.returncode != 0:
+        stderr_txt = response.stderr.decode('utf-8')
+        logger.warning(f'Could not index MMseqs2 database {mmseqs2_db.name}, searching without index: {stderr_txt}')
+
+
 def get_domain_file_columns_dict():
     return {
         'protein_id': [],
@@ -345,43 +1707,50 @@ def get_domain_file_columns_dict():
     }
 
 
-def process_hmmer_output(domtblout_path, output_csv_path):
-    output_data = get_domain_file_columns_dict()
-    with domtblout_path.open() as f:
-        parser = Hmmer3DomtabHmmqueryParser(f)
-
-        for record in parser:
-            hmm_accession = record.accession
-            for protein_id, hit in record.items:
-                hmm_query = hit.query_id
-                for hit_instance in hit:
-                    evalue = hit_instance.evalue
-                    bitscore = hit_instance.bitscore
-                    start = hit_instance.env_start
-                    end = hit_instance.env_end
-                    accuracy = hit_instance.acc_avg
-
-                    accession = hmm_accession
-                    if accession == '-' or accession is None:
-                        accession = hmm_query
-
-                    output_data['protein_id'].append(protein_id)
-                    output_data['hmm_accession'].append(accession)
-                    output_data['hmm_query'].append(hmm_query)
-                    output_data['evalue'].append(evalue)
-                    output_data['bitscore'].append(bitscore)
-                    output_data['accuracy'].append(accuracy)
-                    output_data['start'].append(start)
-                    output_data['end'].append(end)
-
-    df = pd.DataFrame.from_dict(output_data).sort_values(['protein_id', 'start'])
-    df.to_csv(output_csv_path, index=False)
-
-
-def process_mmseqs2_output(domtblout_path, output_csv_path):
+def process_hmmer_output(domtblout_file : TextIO) -> pd.DataFrame:
+    return parse_hmmer_output(domtblout_file).sort_values(['protein_id', 'start'])
+
+
+def parse_hmmer_output(domtblout_file : TextIO) -> pd.DataFrame:
+    """
+    Domain hits in the order of the domain table.
+
+    The table is read by pandas' C parser straight into typed columns, ignoring the free-text 
+    description fields. Values match what Biopython's `Hmmer3DomtabHmmqueryParser` reports: 
+    independent E-value, 0-based envelope start and envelope end.
+    """
+    columns = {column_ix: name for name, column_ix in DOMTBLOUT_COLUMNS.items()}
+    df = pd.read_csv(
+        domtblout_file,
+        sep=r'\s+',
+        comment='#',
+        header=None,
+        names=list(range(DOMTBLOUT_N_FIELDS)),
+        index_col=False,
+        usecols=sorted(columns.keys()),
+        dtype={DOMTBLOUT_COLUMNS[name]: str for name in ['protein_id', 'hmm_query', 'hmm_accession']},
+        na_filter=False,
+        float_precision='round_trip',
+    ).rename(columns=columns)
+
+    hmm_accession = df['hmm_accession'].where(df['hmm_accession'] != '-', df['hmm_query'])
+
+    return pd.DataFrame.from_dict({
+        'protein_id': df['protein_id'],
+        'hmm_accession': hmm_accession,
+        'hmm_query': df['hmm_query'],
+        'evalue': df['evalue'].astype(float),
+        'bitscore': df['bitscore'].astype(float),
+        'accuracy': df['accuracy'].astype(float),
+        'start': df['env_start'].astype(int) - 1,
+        'end': df['env_end'].astype(int),
+    })
+
+
+def process_mmseqs2_output(mmseqs2_output_file : TextIO) -> pd.DataFrame:
     output_data = get_domain_file_columns_dict()
     mmseqs2_output_columns = ['query', 'target', 'evalue', 'bitscore', 'start', 'end']
-    mmseqs2_output = pd.read_csv(domtblout_path, sep='\t', header=None, names=mmseqs2_output_columns)
+    mmseqs2_output = pd.read_csv(mmseqs2_output_file, sep='\t', header=None, names=mmseqs2_output_columns)
 
     for row in mmseqs2_output.itertuples(index=False):
         output_data['protein_id'].append(row.query)
@@ -393,8 +1762,7 @@ def process_mmseqs2_output(domtblout_path, output_csv_path):
         output_data['start'].append(row.start)
         output_data['end'].append(row.end)
 
-    df = pd.DataFrame.from_dict(output_data).sort_values(['protein_id', 'start'])
-    df.to_csv(output_csv_path, index=False)
+    return pd.DataFrame.from_dict(output_data).sort_values(['protein_id', 'start'])
 
 
 def load_assembly_subset(assembly_list_path : os.PathLike):
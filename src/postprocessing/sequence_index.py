@@ -0,0 +1,206 @@
+"""
+Index of unique protein sequences across genomes, used by `search_hmm.py --dedup`.
+
+Identical sequences are common across assemblies (e.g. RefSeq WP_ proteins shared by many genomes).
+Each distinct sequence is stored once in fasta chunks and searched once; hits are then fanned out
+to every protein with that sequence.
+
+The index is a SQLite database, so that memory use does not grow with the number of sequences:
+- sequences: hash of each distinct sequence -> sequence index (`seq_ix`), also its id in the chunks
+- genomes: genome folder and number of sequences of each genome
+- proteins: (genome, protein id, seq_ix), in proteome order
+- hits: domain hits of each unique sequence against each profile database (`db_ix`), 
+  with full-precision P-values in place of E-values
+"""
+import gzip
+import hashlib
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from typing import List, Tuple
+
+import pandas as pd
+
+
+logger = logging.getLogger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    digest BLOB PRIMARY KEY,
+    seq_ix INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS genomes (
+    genome_ix INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    n_sequences INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS proteins (
+    genome_ix INTEGER NOT NULL,
+    protein_id TEXT NOT NULL,
+    seq_ix INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hits (
+    db_ix INTEGER NOT NULL,
+    seq_ix INTEGER NOT NULL,
+    hmm_accession TEXT,
+    hmm_query TEXT,
+    pvalue REAL,
+    bitscore REAL,
+    accuracy REAL,
+    start INTEGER,
+    "end" INTEGER
+);
+"""
+
+
+def open_sequence_index(path : os.PathLike) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def read_proteome(protein_path_gz : Path) -> List[Tuple[str, bytes, bytes]]:
+    """
+    Return `(protein_id, digest, sequence)` of each sequence of a gzipped fasta file.
+    """
+    with gzip.open(protein_path_gz, 'rb') as f:
+        data = f.read()
+
+    return [
+        (protein_id, hash_sequence(sequence), sequence) 
+        for protein_id, sequence in parse_fasta(data)
+    ]
+
+
+def parse_fasta(data : bytes) -> List[Tuple[str, bytes]]:
+    """
+    Return `(protein_id, sequence)` of each sequence of fasta content `data`.
+    The protein id is the first word of the header, as reported by hmmer.
+    """
+    records = []
+    for entry in data.split(b'\n>'):
+        header, _, sequence = entry.lstrip(b'>').partition(b'\n')
+        if header.strip() == b'':
+            continue
+
+        protein_id = header.split(maxsplit=1)[0].decode('utf-8')
+        records.append((protein_id, b''.join(sequence.split())))
+
+    return records
+
+
+def hash_sequence(sequence : bytes) -> bytes:
+    return hashlib.blake2b(sequence, digest_size=16).digest()
+
+
+def add_proteome(
+    conn : sqlite3.Connection,
+    genome_ix : int,
+    folder : str,
+    records : List[Tuple[str, bytes, bytes]],
+    next_seq_ix : int,
+) -> List[Tuple[int, bytes]]:
+    """
+    Add the proteins of a genome to the index.
+    Sequences not seen in previous genomes are numbered from `next_seq_ix`.
+    Return their `(seq_ix, sequence)`.
+    """
+    digests = {}
+    for _, digest, sequence in records:
+        digests.setdefault(digest, sequence)
+
+    with conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS genome_digests (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+        conn.execute('DELETE FROM genome_digests')
+        conn.executemany('INSERT INTO genome_digests (digest) VALUES (?)', [(d,) for d in digests.keys()])
+        new_digests = [
+            digest for digest, in conn.execute(
+                """
+                SELECT g.digest FROM genome_digests g
+                WHERE NOT EXISTS (SELECT 1 FROM sequences s WHERE s.digest = g.digest)
+                """
+            )
+        ]
+
+        new_sequences = list(enumerate(new_digests, start=next_seq_ix))
+        conn.executemany('INSERT INTO sequences (seq_ix, digest) VALUES (?, ?)', new_sequences)
+
+        conn.execute(
+            'INSERT INTO genomes (genome_ix, folder, n_sequences) VALUES (?, ?, ?)',
+            (genome_ix, folder, len(records)),
+        )
+        conn.executemany(
+            """
+            INSERT INTO proteins (genome_ix, protein_id, seq_ix)
+            SELECT ?, ?, seq_ix FROM sequences WHERE digest = ?
+            """,
+            [(genome_ix, protein_id, digest) for protein_id, digest, _ in records],
+        )
+
+    return [(seq_ix, digests[digest]) for seq_ix, digest in new_sequences]
+
+
+def record_hits(conn : sqlite3.Connection, df : pd.DataFrame, db_ix : int) -> None:
+    """
+    Record domain hits of unique sequences against profile database `db_ix`, 
+    with the full-precision P-value of each domain in column `pvalue` (see `search_pyhmmer`). 
+    The protein id column holds sequence indices.
+    """
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO hits (db_ix, seq_ix, hmm_accession, hmm_query, pvalue, bitscore, accuracy, start, "end")
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            zip(
+                [db_ix] * len(df),
+                df['protein_id'].astype(int).tolist(),
+                df['hmm_accession'].tolist(),
+                df['hmm_query'].tolist(),
+                df['pvalue'].tolist(),
+                df['bitscore'].tolist(),
+                df['accuracy'].tolist(),
+                df['start'].tolist(),
+                df['end'].tolist(),
+            ),
+        )
+
+
+def create_search_indices(conn : sqlite3.Connection) -> None:
+    """
+    Index proteins and hits for `get_genome_hits`, once all genomes and hits are recorded.
+    """
+    with conn:
+        conn.execute('CREATE INDEX IF NOT EXISTS proteins_genome ON proteins (genome_ix)')
+        conn.execute('CREATE INDEX IF NOT EXISTS hits_seq ON hits (seq_ix, db_ix)')
+
+
+def get_genomes(conn : sqlite3.Connection) -> List[Tuple[int, str, int]]:
+    """
+    Return `(genome_ix, folder, n_sequences)` of indexed genomes.
+    """
+    return conn.execute('SELECT genome_ix, folder, n_sequences FROM genomes ORDER BY genome_ix').fetchall()
+
+
+def get_genome_hits(conn : sqlite3.Connection, genome_ix : int, n_sequences : int, db_ix : int) -> pd.DataFrame:
+    """
+    Domain hits of a genome against profile database `db_ix`, with columns and E-values as if the genome had been searched on its own.
+    E-values are computed like hmmer from the full-precision P-value (P-value x number of sequences of the genome),
+    then rounded once to the 2 significant digits of hmmer's domain table.
+    """
+    df = pd.read_sql_query(
+        """
+        SELECT p.protein_id, h.hmm_accession, h.hmm_query, h.pvalue, h.bitscore, h.accuracy, h.start, h."end"
+        FROM proteins p JOIN hits h ON h.seq_ix = p.seq_ix
+        WHERE p.genome_ix = ? AND h.db_ix = ?
+        ORDER BY h.rowid
+        """,
+        conn,
+        params=(genome_ix, db_ix),
+    )
+    df['evalue'] = [float(f'{pvalue * n_sequences:.2g}') for pvalue in df['pvalue']]
+    df = df[['protein_id', 'hmm_accession', 'hmm_query', 'evalue', 'bitscore', 'accuracy', 'start', 'end']]
+    return df.sort_values(['protein_id', 'start'], kind='stable')
@@ -1,7 +1,10 @@
 import os
 from pathlib import Path
+import random
 import re
 
+import numpy as np
+
 
 def get_accession_from_path_name(path : Path):
     return '_'.join(path.name.split('_')[:2])
@@ -19,3 +22,11 @@ def escape_species_name(species_name : str):
         return species_name
     else:
         return re.sub(r'[^a-zA-Z0-9\-_]', '_', species_name.strip())
+
+
+def exponential_backoff_sleep_seconds(try_nb):
+    """
+    Return an exponentially larger number of seconds with each try.
+    A total of 10 tries adds up to about 5 minutes.
+    """
+    return np.round(1.6 ** try_nb + random.uniform(0, 1), 1)
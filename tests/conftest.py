@@ -0,0 +1,70 @@
+import gzip
+from pathlib import Path
+import shutil
+
+import pytest
+
+
+TEST_DATA_GENOMES = Path(__file__).parent.parent / 'test_data' / 'genomes'
+PROTEOME_NAMES = [
+    'GCA_018222585.1_ASM1822258v1',
+    'GCF_000337575.1_ASM33757v1',
+]
+
+
+def get_protein_path(path : Path) -> Path:
+    return path / f'{path.name}_protein.faa.gz'
+
+
+@pytest.fixture(scope='session')
+def hmm_db(tmp_path_factory) -> Path:
+    """
+    Small profile database with gathering thresholds, built from sequences of the test proteomes.
+    """
+    pyhmmer = pytest.importorskip('pyhmmer')
+    from pyhmmer.easel import Alphabet, SequenceFile
+
+    alphabet = Alphabet.amino()
+    builder = pyhmmer.plan7.Builder(alphabet)
+    background = pyhmmer.plan7.Background(alphabet)
+
+    hmm_db_path = tmp_path_factory.mktemp('hmm') / 'test_db.hmm'
+    with hmm_db_path.open('wb') as f_out:
+        n_profiles = 0
+        for name in PROTEOME_NAMES:
+            with gzip.open(get_protein_path(TEST_DATA_GENOMES / name), 'rb') as f:
+                with SequenceFile(f, format='fasta', digital=True, alphabet=alphabet) as sequences:
+                    for i, sequence in enumerate(sequences):
+                        if i % 250 != 0:
+                            continue
+
+                        hmm, _, _ = builder.build(sequence, background)
+                        hmm.name = f'dom{n_profiles}'
+                        hmm.accession = f'PF{n_profiles:05d}.1'
+                        hmm.cutoffs.gathering = (20., 20.)
+                        hmm.write(f_out)
+                        n_profiles += 1
+
+    return hmm_db_path
+
+
+@pytest.fixture
+def genomes_folder(tmp_path) -> Path:
+    """
+    Genomes folder with copies of the test proteomes, plus a genome made of the first half of
+    the first proteome: its sequences are shared with another genome of a different size.
+    """
+    genomes_folder = tmp_path / 'genomes'
+    for name in PROTEOME_NAMES:
+        (genomes_folder / name).mkdir(parents=True)
+        shutil.copy(get_protein_path(TEST_DATA_GENOMES / name), get_protein_path(genomes_folder / name))
+
+    with gzip.open(get_protein_path(TEST_DATA_GENOMES / PROTEOME_NAMES[0]), 'rb') as f:
+        records = f.read().split(b'\n>')
+
+    subset_path = genomes_folder / 'GCA_000000001.1_subset'
+    subset_path.mkdir()
+    with gzip.open(get_protein_path(subset_path), 'wb') as f:
+        f.write(b'\n>'.join(records[:len(records) // 2]) + b'\n')
+
+    return genomes_folder
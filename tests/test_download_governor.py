@@ -0,0 +1,46 @@
+import subprocess
+import threading
+import time
+
+import pytest
+
+from src import fetch_assemblies
+from src.ncbi_util.download_governor import DownloadGovernor
+
+
+MAX_BYTES_PER_SECOND = 10e6
+TRANSFER_BYTES = 2_000_000
+
+
+def fake_rsync_run(args, **kwargs):
+    """
+    Stand-in for `subprocess.run(['rsync', ...])`: "transfers" TRANSFER_BYTES at the --bwlimit rate.
+    """
+    bwlimit = next(int(a.split('=')[1]) for a in args if a.startswith('--bwlimit='))
+    time.sleep(TRANSFER_BYTES / (bwlimit * 1024))
+    stdout = f'Total transferred file size: {TRANSFER_BYTES:,} bytes\n'.encode('utf-8')
+    return subprocess.CompletedProcess(args, 0, stdout, b'')
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_rsync_long_run_rate(monkeypatch, n_workers):
+    monkeypatch.setattr(fetch_assemblies.subprocess, 'run', fake_rsync_run)
+
+    # Transfers larger than the burst of the token bucket
+    governor = DownloadGovernor(n_workers, max_bytes_per_second=MAX_BYTES_PER_SECOND, burst_seconds=0.1)
+    n_transfers_per_worker = 5
+
+    def worker():
+        for _ in range(n_transfers_per_worker):
+            fetch_assemblies.run_rsync(['rsync://example/GCA_000000001.1_A', '/tmp'], governor)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(n_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    rate = n_workers * n_transfers_per_worker * TRANSFER_BYTES / elapsed
+    assert rate == pytest.approx(MAX_BYTES_PER_SECOND, rel=0.15)
@@ -0,0 +1,116 @@
+import gzip
+import io
+import shutil
+import subprocess
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.postprocessing import search_hmm
+from src.postprocessing.hmm_output import read_hmm_output, get_output_path
+from src.postprocessing.search_hmm import (
+    get_hmm_db_name,
+    load_pyhmmer_profiles,
+    process_hmmer_output,
+    read_pyhmmer_sequences,
+    run_hmmsearch,
+    run_hmmsearch_shards,
+    search_hmmer_batches,
+    search_pyhmmer,
+    search_unique_sequences,
+)
+
+
+EXACT_COLUMNS = ['protein_id', 'hmm_accession', 'hmm_query', 'bitscore', 'accuracy', 'start', 'end']
+
+
+def decompress_proteome(path, tmp_path):
+    protein_path = tmp_path / f'{path.name}.faa'
+    with gzip.open(path / f'{path.name}_protein.faa.gz', 'rb') as f_in, protein_path.open('wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    return protein_path
+
+
+def search_genome_hmmsearch(hmm_db, path, tmp_path):
+    """
+    Reference per-genome search: `hmmsearch --cut_ga` on the proteome alone.
+    """
+    protein_path = decompress_proteome(path, tmp_path)
+    response = run_hmmsearch(hmm_db, protein_path, ['--cut_ga'], 1)
+    assert response.returncode == 0, response.stderr.decode('utf-8')
+    return process_hmmer_output(io.StringIO(response.stdout.decode('utf-8')))
+
+
+@pytest.mark.skipif(shutil.which('hmmsearch') is None, reason='hmmsearch not installed')
+def test_batches_match_per_genome_search(hmm_db, genomes_folder, tmp_path):
+    hmm_db_name = get_hmm_db_name(hmm_db, True)
+    paths = sorted(genomes_folder.iterdir())
+
+    search_hmmer_batches(0, [hmm_db], [hmm_db_name], paths, 1, batch_residues=10**9)
+
+    n_hits = 0
+    for path in paths:
+        batch_df = read_hmm_output(get_output_path(path, hmm_db_name)).reset_index(drop=True)
+        genome_df = search_genome_hmmsearch(hmm_db, path, tmp_path).reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(batch_df[EXACT_COLUMNS], genome_df[EXACT_COLUMNS], check_dtype=False)
+
+        # hmmsearch prints E-values with 2 significant digits: batch E-values are scaled from
+        # rounded values, and may differ from a per-genome search in the last digit.
+        np.testing.assert_allclose(batch_df['evalue'], genome_df['evalue'], rtol=0.15)
+        n_hits += len(genome_df)
+
+    assert n_hits > 0
+
+
+def test_dedup_matches_per_genome_search(hmm_db, genomes_folder, tmp_path):
+    pytest.importorskip('pyhmmer')
+
+    hmm_db_name = get_hmm_db_name(hmm_db, True)
+    paths = sorted(genomes_folder.iterdir())
+    work_folder = tmp_path / 'work'
+    work_folder.mkdir()
+
+    assert search_unique_sequences(paths, [hmm_db], work_folder, 2, 1, chunk_residues=500_000)
+
+    profiles = load_pyhmmer_profiles(hmm_db)
+    n_hits = 0
+    for path in paths:
+        dedup_df = read_hmm_output(get_output_path(path, hmm_db_name)).reset_index(drop=True)
+
+        sequences = read_pyhmmer_sequences(decompress_proteome(path, tmp_path))
+        genome_df = search_pyhmmer(profiles, sequences, None, True, 1).reset_index(drop=True)
+
+        # E-values included: computed from full-precision P-values, they are rounded once like hmmer's
+        pd.testing.assert_frame_equal(dedup_df, genome_df, check_dtype=False, check_exact=True)
+        n_hits += len(genome_df)
+
+    assert n_hits > 0
+
+
+@pytest.mark.parametrize('n_shards, n_threads', [(3, 8), (8, 2), (2, 1)])
+def test_shards_share_thread_budget(monkeypatch, n_shards, n_threads):
+    lock = threading.Lock()
+    running = {'n_threads': 0, 'max_threads': 0}
+
+    def fake_run_hmmsearch(hmm_db, protein_path, threshold_params, n_threads_per_process, pass_fds=()):
+        with lock:
+            running['n_threads'] += n_threads_per_process
+            running['max_threads'] = max(running['max_threads'], running['n_threads'])
+        time.sleep(0.05)
+        with lock:
+            running['n_threads'] -= n_threads_per_process
+        return subprocess.CompletedProcess([], 0, f'{hmm_db}\n'.encode('utf-8'), b'')
+
+    monkeypatch.setattr(search_hmm, 'run_hmmsearch', fake_run_hmmsearch)
+
+    shards = [f'shard_{k}' for k in range(n_shards)]
+    response = run_hmmsearch_shards(shards, None, ['--cut_ga'], n_threads)
+
+    assert response.returncode == 0
+    assert response.stdout.decode('utf-8').split() == shards
+    assert running['max_threads'] == n_threads